@@ -15,6 +15,24 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24
 # 提示词配置
 PERSONAL_PROMPT = "The person in the picture is attracted by the true surprise and naturally covers their mouth with their hands, opens their eyes wide, and shows a real expression of surprise. It is necessary to strictly ensure that the finger shape is normal and reasonable, and the fingernails are normal red and not too long"
 
+# 公平调度权重，按用户当前有效卡密类型（见 routers/admin/carmine.py 中的 CARMINE_TYPES）取值
+SCHEDULE_WEIGHTS = {
+    "day": 1.0,
+    "week": 1.0,
+    "month": 2.0,
+    "year": 3.0,
+    "forever": 4.0,
+}
+
+# 持久化任务的截止时间（秒），超时后终止轮询、释放账号并标记为失败
+JOB_TIMEOUTS = {
+    "generate_video_task": 30 * 60,
+    "ai_video_generate": 30 * 60,
+}
+
+# 任务排队等待账号的最长时间（秒），超时后交还并发名额重新调度
+ACCOUNT_WAIT_TIMEOUT = 60
+
 app = FastAPI()
 
 # CORS配置
@@ -3,6 +3,33 @@ from pathlib import Path
 from .config import db_pool
 from loguru import logger
 
+# 已有表的结构变更，每次启动执行，字段或索引已存在时跳过
+MIGRATIONS = [
+    "ALTER TABLE video_generation ADD COLUMN runway_task_id VARCHAR(255) COMMENT 'Runway任务ID'",
+    "ALTER TABLE video_generation ADD COLUMN status TINYINT NOT NULL DEFAULT 2 COMMENT '状态:1-生成中,2-完成,3-失败'",
+    "ALTER TABLE ai_video ADD COLUMN runway_task_id VARCHAR(255) COMMENT 'Runway任务ID'",
+    "ALTER TABLE ai_video ADD COLUMN session_id VARCHAR(255) COMMENT 'Runway会话ID'",
+    "ALTER TABLE job_queue ADD COLUMN job_key VARCHAR(128) COMMENT '业务键，用于按业务记录查找任务'",
+    "ALTER TABLE job_queue ADD INDEX idx_job_key (job_key)",
+    "ALTER TABLE runway_account ADD COLUMN max_concurrency INT NOT NULL DEFAULT 2 COMMENT '最大并发数'",
+    "ALTER TABLE runway_account ADD COLUMN daily_quota INT COMMENT '每日生成上限，为空时使用默认值，0为不限'",
+    "ALTER TABLE runway_session ADD COLUMN asset_group_id VARCHAR(255) COMMENT '会话的assetGroupId缓存'",
+]
+
+# 字段已存在、索引已存在
+IGNORED_MIGRATION_ERRORS = (1060, 1061)
+
+def apply_migrations(cursor):
+    """执行表结构变更，忽略已经执行过的变更"""
+    for statement in MIGRATIONS:
+        try:
+            cursor.execute(statement)
+            logger.info(f'执行表结构变更: {statement}')
+        except Exception as e:
+            if getattr(e, 'errno', None) in IGNORED_MIGRATION_ERRORS:
+                continue
+            raise
+
 def init_database():
     """初始化数据库，创建必要的表结构"""
     conn = db_pool.connection()
@@ -18,6 +45,7 @@ def init_database():
             if statement.strip():
                 cursor.execute(statement)
         
+        apply_migrations(cursor)
         conn.commit()
         logger.info('数据库表初始化完成')
     except Exception as e:
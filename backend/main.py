@@ -11,12 +11,17 @@ from routers.admin.runway_account import router as runway_account_router
 from routers.admin.user import router as admin_user_router
 from routers.admin.carmine import router as carmine_router
 from routers.user import router as user_router
-from routers.generate_video import router as generate_video_router
+from routers.generate_video import router as generate_video_router, recover_video_generations
 from routers.video import router as video_router
 from utils.account_pool import account_pool
+from utils.account_health import account_health
+from utils.asset_group_cache import asset_group_cache
 from routers.prompt import router as prompt_router
 from routers.admin.dashbroad import router as dashbroad_router
-from routers.ai_video import router as ai_video_router
+from routers.ai_video import router as ai_video_router, recover_ai_videos
+from utils.job_queue import job_queue
+from utils.thread_pool import global_thread_pool
+from utils.runway_client import async_runway_client
 
 
 app = config.app
@@ -71,6 +76,22 @@ app.include_router(prompt_router, prefix="/prompt", tags=["提示词管理"])
 app.include_router(dashbroad_router, prefix="/admin/dashbroad", tags=["仪表盘"])
 app.include_router(ai_video_router, prefix="/ai_video", tags=["AI视频生成"])
 account_pool.initialize()
+# 后台探测账号token，失效时自动重新登录
+account_health.start()
+# 加载会话的assetGroupId缓存，并在后台为尚未缓存的会话预先获取
+asset_group_cache.start()
+# 异步任务引擎关闭前关闭绑定其事件循环的Runway客户端
+global_thread_pool.async_engine.add_shutdown_hook(async_runway_client.aclose)
+# 协程任务并发上限随账号池可用实例数伸缩
+global_thread_pool.set_capacity_provider(lambda: account_pool.get_stats()["available_instances"])
+# 为重启前已创建Runway任务的记录重新挂上轮询，再启动持久化任务队列
+# 重启前未完成的任务会在租约过期后被重新领取
+try:
+    recover_video_generations()
+    recover_ai_videos()
+except Exception as e:
+    logger.error(f"恢复未完成的生成任务失败: {str(e)}")
+job_queue.start()
 
 @app.get("/token")
 async def token():
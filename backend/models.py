@@ -39,6 +39,8 @@ class RunwayAccount(BaseModel):
     as_team_id = CharField(max_length=255)
     token = CharField(max_length=255)
     plan_expires = DateTimeField(null=True)
+    max_concurrency = IntegerField(default=2, help_text='最大并发数，实际并发按限流情况在1到该值之间自动调整')
+    daily_quota = IntegerField(null=True, help_text='每日生成上限，为空时使用默认值ACCOUNT_DAILY_QUOTA，0为不限')
     created_at = DateTimeField(default=datetime.datetime.now)
     updated_at = DateTimeField(default=datetime.datetime.now)
 
@@ -48,6 +50,7 @@ class RunwayAccount(BaseModel):
 class RunwaySession(BaseModel):
     runway = ForeignKeyField(RunwayAccount, backref='sessions')
     session_id = CharField(max_length=255)
+    asset_group_id = CharField(max_length=255, null=True, help_text='会话的assetGroupId缓存，会话失效时清空')
     created_at = DateTimeField(default=datetime.datetime.now)
 
     class Meta:
@@ -84,7 +87,7 @@ class UserCarmine(BaseModel):
 
 class Task(BaseModel):
     user = ForeignKeyField(User, backref='tasks')
-    status = IntegerField(default=0, help_text='0-排队中,1-生成中,2-完成')
+    status = IntegerField(default=0, help_text='0-排队中,1-生成中,2-完成,3-失败,4-已删除')
     created_at = DateTimeField(default=datetime.datetime.now)
 
     class Meta:
@@ -98,8 +101,10 @@ class VideoGeneration(BaseModel):
     category = CharField(max_length=255, null=True, help_text='分类')
     image_url = CharField(max_length=1024, help_text='输入图片URL')
     video_url = CharField(max_length=1024, null=True, help_text='生成视频URL')
-    runway_id = CharField(max_length=255, null=True, help_text='Runway任务ID')
+    runway_id = CharField(max_length=255, null=True, help_text='Runway账号ID')
     session_id = CharField(max_length=255, null=True, help_text='Runway会话ID')
+    runway_task_id = CharField(max_length=255, null=True, help_text='Runway任务ID')
+    status = IntegerField(default=2, help_text='状态:1-生成中,2-完成,3-失败,4-已取消')
     created_at = DateTimeField(default=datetime.datetime.now)
 
     class Meta:
@@ -136,11 +141,38 @@ class AIVideo(BaseModel):
     seed = BigIntegerField(help_text='随机种子')
     image_url = CharField(max_length=1024, null=True, help_text='输入图片URL')
     video_url = CharField(max_length=1024, null=True, help_text='生成视频URL')
-    status = IntegerField(default=0, help_text='状态:0-排队中,1-生成中,2-完成,3-失败')
+    status = IntegerField(default=0, help_text='状态:0-排队中,1-生成中,2-完成,3-失败,4-已取消')
     is_deleted = IntegerField(default=0, help_text='是否删除:0-否,1-是')
-    runway_id = CharField(max_length=255, null=True, help_text='Runway任务ID')
+    runway_id = CharField(max_length=255, null=True, help_text='Runway账号ID')
+    runway_task_id = CharField(max_length=255, null=True, help_text='Runway任务ID')
+    session_id = CharField(max_length=255, null=True, help_text='Runway会话ID')
+    created_at = DateTimeField(default=datetime.datetime.now, help_text='创建时间')
+    updated_at = DateTimeField(default=datetime.datetime.now, help_text='更新时间')
+
+    class Meta:
+        table_name = 'ai_video'
+
+class Job(BaseModel):
+    job_type = CharField(max_length=64, help_text='任务类型')
+    payload = TextField(help_text='任务参数(JSON)')
+    owner_id = IntegerField(null=True, help_text='任务归属用户ID')
+    weight = FloatField(default=1.0, help_text='公平调度权重')
+    status = IntegerField(default=0, help_text='状态:0-待执行,1-执行中,2-完成,3-失败,4-已取消')
+    attempts = IntegerField(default=0, help_text='已领取次数')
+    lease_owner = CharField(max_length=64, null=True, help_text='租约持有进程')
+    lease_expires_at = DateTimeField(null=True, help_text='租约过期时间')
+    error = TextField(null=True, help_text='失败原因')
+    job_key = CharField(max_length=128, null=True, index=True, help_text='业务键，用于按业务记录查找任务')
     created_at = DateTimeField(default=datetime.datetime.now, help_text='创建时间')
     updated_at = DateTimeField(default=datetime.datetime.now, help_text='更新时间')
 
     class Meta:
-        table_name = 'ai_video'
\ No newline at end of file
+        table_name = 'job_queue'
+
+class AccountInstanceLease(BaseModel):
+    instance_key = CharField(max_length=64, primary_key=True, help_text='账号实例键(账号ID_实例ID)')
+    owner = CharField(max_length=128, help_text='持有者(进程标识/租约ID)')
+    expires_at = DateTimeField(help_text='租约过期时间')
+
+    class Meta:
+        table_name = 'account_instance_lease'
@@ -6,6 +6,12 @@ from datetime import datetime, timedelta
 from utils.account_pool import account_pool
 from peewee import fn, JOIN
 from utils.thread_pool import global_thread_pool
+from utils.job_queue import job_queue
+from utils.rate_limiter import runway_limiter
+from utils.runway_client import runway_client, async_runway_client
+from utils.asset_group_cache import asset_group_cache
+from utils.upload_cache import upload_cache
+from utils.account_health import account_health
 
 router = APIRouter()
 
@@ -166,7 +172,17 @@ class DashboardStats:
             
             return {
                 "total": total_accounts,
-                "pool": pool_stats
+                "pool": pool_stats,
+                "wait": account_pool.get_wait_stats(),
+                "selection": account_pool.get_selection_stats(),
+                "concurrency": account_pool.get_concurrency_stats(),
+                "quota": account_pool.get_quota_stats(),
+                "health": account_health.get_stats(),
+                "rate_limit": runway_limiter.get_stats(),
+                "http": runway_client.get_stats(),
+                "http_async": async_runway_client.get_stats(),
+                "asset_group_cache": asset_group_cache.get_stats(),
+                "upload_cache": upload_cache.get_stats()
             }
         except Exception as e:
             logger.error(f"获取账号统计数据失败: {str(e)}")
@@ -193,6 +209,13 @@ class DashboardStats:
                 "queue_size": global_thread_pool.get_queue_size(),
                 "active_workers": global_thread_pool.get_active_workers(),
                 "max_workers": global_thread_pool.max_workers,
+                "min_workers": global_thread_pool.min_workers,
+                "async_running": global_thread_pool.get_async_running(),
+                "max_concurrency": global_thread_pool.async_engine.max_concurrency,
+                "loop": global_thread_pool.get_loop_stats(),
+                "scheduler": global_thread_pool.scheduler,
+                "job_queue": job_queue.get_stats(),
+                "timed_out_jobs": job_queue.get_timed_out_count(),
                 "running": global_thread_pool.running
             }
         except Exception as e:
@@ -202,6 +225,13 @@ class DashboardStats:
                 "queue_size": 0,
                 "active_workers": 0,
                 "max_workers": 0,
+                "min_workers": 0,
+                "async_running": 0,
+                "max_concurrency": 0,
+                "loop": {},
+                "scheduler": "",
+                "job_queue": {},
+                "timed_out_jobs": 0,
                 "running": False
             }
     
@@ -7,6 +7,8 @@ import requests
 from typing import Optional, List
 import datetime as dt
 from base.security import AdminContext
+from utils.runway_client import runway_client, API_BASE_URL
+from utils.account_pool import account_pool
 
 router = APIRouter()
 
@@ -36,6 +38,8 @@ class RunwayAccountResponse(BaseModel):
     password: str
     as_team_id: str
     plan_expires: datetime
+    max_concurrency: int
+    daily_quota: Optional[int]
     created_at: datetime
     updated_at: datetime
 
@@ -53,10 +57,12 @@ class RunwaySessionListResponse(BaseModel):
     total: int
     sessions: List[RunwaySessionResponse]
 
+# 登录和获取用户资料是同步请求，经过限流器时可能等待，使用普通函数由FastAPI放到线程池执行，不阻塞事件循环
 @router.post("/account/add")
-async def add_runway_account(
+def add_runway_account(
     username: str, 
     password: str,
+    max_concurrency: int = Query(2, ge=1, description="最大并发数，高级套餐的账号可以设置得更高"),
     admin: AdminContext = Depends()
 ):
     """
@@ -76,7 +82,8 @@ async def add_runway_account(
         password=password,
         as_team_id=user_info.id,
         token=token,
-        plan_expires=user_info.planExpires
+        plan_expires=user_info.planExpires,
+        max_concurrency=max_concurrency
     )
     
     # 保存到数据库
@@ -111,6 +118,8 @@ async def list_runway_accounts(
             password=account.password,
             as_team_id=account.as_team_id,
             plan_expires=account.plan_expires,
+            max_concurrency=account.max_concurrency,
+            daily_quota=account.daily_quota,
             created_at=account.created_at,
             updated_at=account.updated_at
         ))
@@ -121,8 +130,45 @@ async def list_runway_accounts(
         accounts=account_list
     )
 
+@router.post("/account/concurrency")
+async def set_account_concurrency(
+    runway_id: int,
+    max_concurrency: int = Query(..., ge=1, description="最大并发数"),
+    admin: AdminContext = Depends()
+):
+    """
+    修改Runway账号的最大并发数，立即在账号池中生效
+    """
+    logger.info(f"修改Runway账号最大并发数: runway_id={runway_id}, max_concurrency={max_concurrency}")
+    
+    updated = RunwayAccount.update(max_concurrency=max_concurrency).where(RunwayAccount.id == runway_id).execute()
+    if not updated:
+        raise HTTPException(status_code=404, detail="Runway账号不存在")
+    
+    account_pool.set_max_concurrency(runway_id, max_concurrency)
+    return {"message": "最大并发数修改成功"}
+
+@router.post("/account/quota")
+async def set_account_quota(
+    runway_id: int,
+    daily_quota: Optional[int] = Query(None, ge=0, description="每日生成上限，不传时使用默认值，0为不限"),
+    admin: AdminContext = Depends()
+):
+    """
+    修改Runway账号的每日生成上限，立即在账号池中生效
+    """
+    logger.info(f"修改Runway账号每日生成上限: runway_id={runway_id}, daily_quota={daily_quota}")
+    
+    updated = RunwayAccount.update(daily_quota=daily_quota).where(RunwayAccount.id == runway_id).execute()
+    if not updated:
+        raise HTTPException(status_code=404, detail="Runway账号不存在")
+    
+    account_pool.update_account(RunwayAccount.select().where(RunwayAccount.id == runway_id).dicts().get())
+    return {"message": "每日生成上限修改成功"}
+
+# 创建会话是同步请求，原因同add_runway_account
 @router.post("/session/create")
-async def create_session(
+def create_session(
     runway_id: int,
     admin: AdminContext = Depends()
 ):
@@ -147,6 +193,8 @@ async def create_session(
         session_id=session_id
     )
     session.save()
+    # 账号池立即使用新会话，不必等待下次刷新
+    account_pool.set_session(runway_id, session_id)
     
     logger.info(f"Runway会话创建成功: runway_id={runway_id}, session_id={session_id}")
     return {"message": "会话创建成功", "session_id": session_id}
@@ -206,7 +254,7 @@ def runway_login(username: str, password: str) -> str:
     Raises:
         Exception: 当登录失败时抛出异常
     """
-    url = "https://api.runwayml.com/v1/login"
+    url = f"{API_BASE_URL}/login"
     
     logger.info(f"尝试登录Runway账号: username={username}")
     
@@ -218,7 +266,7 @@ def runway_login(username: str, password: str) -> str:
     
     try:
         logger.debug(f"发送登录请求到: {url}")
-        response = requests.post(url, json=payload.dict())
+        response = runway_client.post(url, json=payload.dict())
         logger.info(f"登录响应: {response.json()}")
         response.raise_for_status()  # 处理其他非200状态码
         
@@ -228,10 +276,10 @@ def runway_login(username: str, password: str) -> str:
         
     except requests.exceptions.RequestException as e:
         logger.error(f"登录请求失败: {str(e)}")
-        raise Exception(f"登录请求失败: {str(e)}")
+        raise Exception(f"登录请求失败: {str(e)}") from e
     except Exception as e:
         logger.error(f"处理登录响应时出错: {str(e)}")
-        raise Exception(f"处理登录响应时出错: {str(e)}")
+        raise Exception(f"处理登录响应时出错: {str(e)}") from e
 
 
 def get_runway_user_info(token: str) -> UserProfile:
@@ -247,7 +295,7 @@ def get_runway_user_info(token: str) -> UserProfile:
     Raises:
         Exception: 当请求失败时抛出异常
     """
-    url = "https://api.runwayml.com/v1/profile"
+    url = f"{API_BASE_URL}/profile"
     headers = {
         "Authorization": f"Bearer {token}"
     }
@@ -256,7 +304,7 @@ def get_runway_user_info(token: str) -> UserProfile:
     
     try:
         logger.debug(f"发送获取用户资料请求到: {url}")
-        response = requests.get(url, headers=headers)
+        response = runway_client.get(url, headers=headers)
         response.raise_for_status()
         
         data = response.json()
@@ -272,10 +320,10 @@ def get_runway_user_info(token: str) -> UserProfile:
         
     except requests.exceptions.RequestException as e:
         logger.error(f"获取用户资料失败: {str(e)}")
-        raise Exception(f"获取用户资料失败: {str(e)}")
+        raise Exception(f"获取用户资料失败: {str(e)}") from e
     except Exception as e:
         logger.error(f"处理用户资料响应时出错: {str(e)}")
-        raise Exception(f"处理用户资料响应时出错: {str(e)}")
+        raise Exception(f"处理用户资料响应时出错: {str(e)}") from e
 
 
 def create_runway_session(token: str, team_id: str) -> str:
@@ -292,7 +340,7 @@ def create_runway_session(token: str, team_id: str) -> str:
     Raises:
         Exception: 当创建会话失败时抛出异常
     """
-    url = "https://api.runwayml.com/v1/sessions"
+    url = f"{API_BASE_URL}/sessions"
     headers = {
         "Authorization": f"Bearer {token}"
     }
@@ -305,7 +353,7 @@ def create_runway_session(token: str, team_id: str) -> str:
     
     try:
         logger.debug(f"发送创建会话请求到: {url}")
-        response = requests.post(url, headers=headers, json=payload)
+        response = runway_client.post(url, headers=headers, json=payload, team_id=team_id)
         response.raise_for_status()
         
         data = response.json()
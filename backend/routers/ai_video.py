@@ -4,20 +4,25 @@ from fastapi import Depends
 from enum import Enum
 from typing import Optional
 from pydantic import BaseModel
-from models import AIVideo
+from models import AIVideo, RunwayAccount
 import os
 import uuid
 from loguru import logger
-from utils.thread_pool import global_thread_pool
+from utils.thread_pool import PoolSaturatedError, Reschedule, is_deadline_exceeded
+from utils.job_queue import job_queue
+from routers.user import get_user_schedule_weight
 from utils.account_pool import account_pool
+from utils.runway_client import async_runway_client, API_BASE_URL
+from utils.asset_group_cache import asset_group_cache
+from utils.upload_cache import upload_cache, file_sha256
+from utils.account_health import account_health
+from base.config import JOB_TIMEOUTS, ACCOUNT_WAIT_TIMEOUT
 import time
-from models import RunwaySession
-import requests
+import asyncio
 from scripts.config import USER_AGENT
 from typing import Dict, List
 import json
 import datetime
-API_BASE_URL = "https://api.runwayml.com/v1"
 
 # 内容类型映射
 CONTENT_TYPE_MAP = {
@@ -57,84 +62,189 @@ class AIVideoListResponse(BaseModel):
     items: List[AIVideoItem]
 
 
+class CancelVideoResponse(BaseModel):
+    success: bool
+    message: str
+
+
 router = APIRouter()
 
 async def ai_video_generate(
     user_id: int,
     video_id: int,
     prompt: str,
-    photo_path: str,
+    photo_path: Optional[str],
     seconds: int,
     seed: int,
     resolution: Resolution
 ):
+    account = None
+    poll_account = None
+    runway_task_id = None
     try:
-        # 循环阻塞获取账号
-        account = None
-        while not account:
-            account = account_pool.get_account()
+        # 数据库操作都交给IO线程执行，不阻塞异步任务引擎的事件循环
+        # 进程重启后任务会被重新执行，已经创建过Runway任务的直接恢复轮询，不重复生成
+        video = await asyncio.to_thread(AIVideo.get_by_id, video_id)
+        if video.status == 2:
+            logger.info(f"[AIVideo-{video_id}] 视频已生成，无需重复执行")
+            return
+        if video.status == 4:
+            logger.info(f"[AIVideo-{video_id}] 视频已取消，不再生成")
+            return
+        if video.runway_task_id:
+            runway_task_id = video.runway_task_id
+            image_url = video.image_url
+            account = await account_pool.get_account_by_id_async(int(video.runway_id), holder=f"AIVideo-{video_id}")
+            if account:
+                poll_account = account
+            else:
+                # 账号实例都在使用中时仍然使用该账号的凭据轮询，Runway任务已在远端运行
+                poll_account = await asyncio.to_thread(
+                    RunwayAccount.select().where(RunwayAccount.id == int(video.runway_id)).dicts().first)
+                if not poll_account:
+                    # 账号已被删除，无法再查询该Runway任务
+                    raise Exception(f"恢复轮询失败，账号 ID: {video.runway_id} 不存在")
+            logger.info(f"[AIVideo-{video_id}] 恢复轮询Runway任务: {runway_task_id}, 账号 ID: {poll_account['id']}")
+            # 恢复的任务无法得知完整耗时，不计入账号耗时和排队时间统计
+            runway_started_at = None
+            queue_started_at = None
+        else:
+            # 排队等待账号释放，等待过久时交还并发名额，由线程池重新调度本任务
+            account = await account_pool.acquire_async(timeout=ACCOUNT_WAIT_TIMEOUT, holder=f"AIVideo-{video_id}")
             if not account:
-                logger.info(f"[AIVideo-{video_id}] 未能获取到账号，3秒后重试...")
-                time.sleep(3)
-        # 获取Session
-        session = RunwaySession.get(runway_id=account['id'])
-        logger.info(f"[AIVideo-{video_id}] 获取到账号 ID: {account['id']}, 用户名: {account['username']}, Session ID: {session.session_id}")
-        # 更新视频状态为生成中和账号
-        AIVideo.update(status=1, runway_id=account['id']).where(AIVideo.id == video_id).execute()
-
-        # 上传图片到runway
-        image_url = upload_image_to_runway(video_id, session.session_id, photo_path, account)
-
-        # 创建视频生成任务
-        runway_task_id = create_video_task(video_id, image_url, prompt, session.session_id, seed, seconds, account)
-        if not runway_task_id:
-            logger.error(f"[AIVideo-{video_id}] 创建视频生成任务失败")
-            raise HTTPException(status_code=500, detail="创建视频生成任务失败")
-
+                logger.info(f"[AIVideo-{video_id}] 未能获取到账号，稍后重试...")
+                return Reschedule(1)
+            poll_account = account
+            # 获取Session，实例没有携带会话时需要查询数据库
+            session_id = account.get('session_id') or await asyncio.to_thread(account_pool.get_session_id, account)
+            logger.info(f"[AIVideo-{video_id}] 获取到账号 ID: {account['id']}, 用户名: {account['username']}, Session ID: {session_id}")
+            # 更新视频状态为生成中和账号
+            await asyncio.to_thread(AIVideo.update(status=1, runway_id=account['id']).where(AIVideo.id == video_id).execute)
+
+            # 上传图片到runway
+            image_url = await upload_image_to_runway(video_id, session_id, photo_path, account)
+
+            # 上传期间租约丢失时实例可能已被其他持有者使用，重新获取账号后再创建任务
+            if account.lost:
+                logger.warning(f"[AIVideo-{video_id}] 账号 ID: {account['id']} 的租约已丢失，稍后重新获取账号")
+                return Reschedule(1)
+
+            # 创建视频生成任务
+            runway_task_id = await create_video_task_async(video_id, image_url, prompt, session_id, seed, seconds, account)
+            if not runway_task_id:
+                logger.error(f"[AIVideo-{video_id}] 创建视频生成任务失败")
+                raise HTTPException(status_code=500, detail="创建视频生成任务失败")
+            
+            runway_started_at = time.time()
+            queue_started_at = runway_started_at
+            # 创建后立即记录Runway任务ID和会话，进程重启后据此恢复轮询
+            await asyncio.to_thread(AIVideo.update(
+                runway_task_id=runway_task_id,
+                session_id=session_id,
+                image_url=image_url
+            ).where(AIVideo.id == video_id).execute)
+
+        throttled = False
         while True:
-            task_detail = get_task_detail(video_id, runway_task_id, account)
+            task_detail = await get_task_detail(video_id, runway_task_id, poll_account)
             if task_detail:
                 status_info = parse_task_status(video_id, task_detail)
                 if status_info:
                     logger.info(f"[AIVideo-{video_id}] 任务状态: {status_info['status']}")
                     logger.info(f"[AIVideo-{video_id}] 进度: {status_info['progress']}")
                     
+                    # 任务在Runway排队限流时上报一次，供账号选择策略和并发上限参考
+                    if status_info['status'] == 'THROTTLED' and not throttled:
+                        throttled = True
+                        account_pool.record_request(int(poll_account['id']), True)
+                    
+                    # 任务开始运行时上报排队时间，排队过久的账号降低并发上限
+                    if status_info['status'] in ['RUNNING', 'SUCCEEDED'] and queue_started_at:
+                        account_pool.record_queue_time(int(poll_account['id']), time.time() - queue_started_at)
+                        queue_started_at = None
+                    
                     # 如果任务完成或失败则退出循环
                     if status_info['status'] in ['SUCCEEDED']:
+                        if runway_started_at:
+                            account_pool.account_stats.record_duration(int(poll_account['id']), time.time() - runway_started_at)
                         if status_info['video_url']:
                             logger.info(f"[AIVideo-{video_id}] 视频URL: {status_info['video_url']}")
                             logger.info(f"[AIVideo-{video_id}] 预览图片URLs: {json.dumps(status_info['preview_urls'], indent=2)}")
-                            AIVideo.update(
+                            await asyncio.to_thread(AIVideo.update(
                                 status=2, 
                                 video_url=status_info['video_url'],
                                 image_url=image_url
-                            ).where(AIVideo.id == video_id).execute()
+                            ).where(AIVideo.id == video_id).execute)
                         break
                     if status_info['status'] in ['FAILED', 'CANCELED']:
                         logger.error(f"[AIVideo-{video_id}] 视频生成失败，任务ID: {runway_task_id}")
-                        AIVideo.update(status=3).where(AIVideo.id == video_id).execute()
+                        await asyncio.to_thread(AIVideo.update(status=3).where(AIVideo.id == video_id).execute)
                         break
                         
             # 等待5秒后再次查询
-            time.sleep(5)
+            await asyncio.sleep(5)
 
 
 
-    except Exception as e:
-        logger.error(f"[AIVideo-{video_id}] AI视频生成失败: {e}")
-        AIVideo.update(status=3).where(AIVideo.id == video_id).execute()
+    except asyncio.CancelledError as e:
+        if is_deadline_exceeded(e):
+            logger.error(f"[AIVideo-{video_id}] 超过截止时间，停止生成")
+            await asyncio.to_thread(AIVideo.update(status=3).where(AIVideo.id == video_id).execute)
+        else:
+            logger.info(f"[AIVideo-{video_id}] 任务已取消，停止生成")
+        if runway_task_id and poll_account:
+            await cancel_runway_task(video_id, runway_task_id, poll_account)
+        raise
     except HTTPException as e:
+        # HTTPException是Exception的子类，必须先于Exception处理
+        if e.status_code != 401:
+            logger.error(f"[AIVideo-{video_id}] AI视频生成失败: {e.detail}")
+            await asyncio.to_thread(AIVideo.update(status=3).where(AIVideo.id == video_id).execute)
+            return
         logger.error(f"[AIVideo-{video_id}] Runway账号失效: {str(e)}")
         if account:
             account_pool.remove_account(account['id'])
             logger.info(f"[AIVideo-{video_id}] 已删除失效账号 ID: {account['id']}")
+            # 后台重新登录，成功后账号重新加入账号池
+            account_health.report_unauthorized(account['id'])
             account = None
-        AIVideo.update(status=3).where(AIVideo.id == video_id).execute()
+        await asyncio.to_thread(AIVideo.update(status=3).where(AIVideo.id == video_id).execute)
         raise e
+    except Exception as e:
+        logger.error(f"[AIVideo-{video_id}] AI视频生成失败: {e}")
+        await asyncio.to_thread(AIVideo.update(status=3).where(AIVideo.id == video_id).execute)
     finally:
-        account_pool.release_account(account)
+        if account:
+            await account_pool.release_account_async(account)
 
-def create_video_task(
+
+def recover_ai_videos():
+    """
+    启动时恢复未完成的AI视频
+    
+    为已创建Runway任务但没有待执行或执行中任务的AI视频记录重新入队，
+    处理函数会直接恢复轮询，不会重新上传图片和创建Runway任务
+    """
+    videos = AIVideo.select().where(
+        (AIVideo.status.in_([0, 1])) &
+        (AIVideo.is_deleted == 0) &
+        (AIVideo.runway_task_id.is_null(False))
+    )
+    count = 0
+    for video in videos:
+        job_key = f"ai_video:{video.id}"
+        if job_queue.has_active_job(job_key):
+            continue
+        job_queue.enqueue(
+            "ai_video_generate",
+            (video.user_id, video.id, video.prompt, None, video.seconds, video.seed, video.resolution),
+            owner_id=video.user_id,
+            job_key=job_key
+        )
+        count += 1
+    logger.info(f"恢复 {count} 个未完成的AI视频任务")
+
+async def create_video_task(
     aivideo_id: int,
     image_url: str,
     text_prompt: str,
@@ -157,13 +267,16 @@ def create_video_task(
     Returns:
         str: 成功时返回任务ID，失败返回None
     """
-    # 获取assetGroupId
-    asset_group_id = get_asset_group_id(aivideo_id, session_id=session_id, account=account)
+    # 获取assetGroupId，同一会话的assetGroupId不变，优先使用缓存
+    asset_group_id = asset_group_cache.get(session_id)
     if not asset_group_id:
-        asset_group_id = get_asset_group(aivideo_id, session_id=session_id, account=account)
+        asset_group_id = await get_asset_group_id(aivideo_id, session_id=session_id, account=account)
+        if not asset_group_id:
+            asset_group_id = await get_asset_group(aivideo_id, session_id=session_id, account=account)
         if not asset_group_id:
             logger.error(f"[AIVideo-{aivideo_id}] 未能获取到assetGroupId")
             return None
+        await asset_group_cache.set_async(session_id, asset_group_id)
     logger.info(f"[AIVideo-{aivideo_id}] 获取到assetGroupId: {asset_group_id}")
     headers = {
         "Authorization": f"Bearer {account['token']}",
@@ -197,24 +310,26 @@ def create_video_task(
     
     logger.info(f"[AIVideo-{aivideo_id}] 开始创建视频任务，提示词: {text_prompt[:30]}...")
     
-    while True:
-        response = requests.post(
-            f"{API_BASE_URL}/tasks",
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code == 401:
-            logger.error(f"[AIVideo-{aivideo_id}] Runway账号token失效")
-            raise HTTPException(status_code=401, detail="Runway账号失效")
-            
-        if response.status_code == 429:
-            logger.warning(f"[AIVideo-{aivideo_id}] 请求频率限制(429)，3秒后重试...")
-            time.sleep(3)
-            continue
+    response = await async_runway_client.post(
+        f"{API_BASE_URL}/tasks",
+        headers=headers,
+        json=payload,
+        account=account
+    )
+    
+    if response.status_code in (401, 404):
+        # 账号或会话失效，清除缓存的assetGroupId，下次重新获取
+        await asset_group_cache.invalidate_async(session_id)
+
+    if response.status_code == 401:
+        logger.error(f"[AIVideo-{aivideo_id}] Runway账号token失效")
+        raise HTTPException(status_code=401, detail="Runway账号失效")
         
-        response.raise_for_status()
-        break
+    if response.status_code == 429:
+        logger.warning(f"[AIVideo-{aivideo_id}] 请求频率限制(429)")
+        raise HTTPException(status_code=429, detail="Runway请求频率限制")
+    
+    response.raise_for_status()
     
     data = response.json()
     task_id = parse_task_id(aivideo_id, data)
@@ -225,7 +340,79 @@ def create_video_task(
         logger.error(f"[AIVideo-{aivideo_id}] 未能获取到任务ID")
         return None
 
-def get_task_detail(aivideo_id: int, task_id: str, account: dict) -> Optional[Dict]:
+
+async def create_video_task_async(
+    aivideo_id: int,
+    image_url: str,
+    text_prompt: str,
+    session_id: str,
+    seed: int,
+    seconds: int,
+    account: dict
+) -> Optional[str]:
+    """
+    创建视频生成任务，遇到频率限制(429)时等待到限流器放行后重试
+    
+    Args:
+        aivideo_id: AI视频ID
+        image_url: 输入图片的URL
+        text_prompt: 文本提示
+        session_id: 会话ID
+        seed: 随机种子
+        seconds: 视频时长（秒）
+        account: 账号信息
+        
+    Returns:
+        str: 成功时返回任务ID，失败返回None
+    """
+    while True:
+        try:
+            task_id = await create_video_task(aivideo_id, image_url, text_prompt, session_id, seed, seconds, account)
+            account_pool.record_request(account['id'], False)
+            if task_id:
+                # 计入账号当天的生成数，用于每日上限
+                account_pool.record_generation(account['id'])
+            return task_id
+        except HTTPException as e:
+            if e.status_code != 429:
+                raise
+            # 上报限流，账号选择策略据此减少向该账号分配任务，并降低该账号的并发上限
+            account_pool.record_request(account['id'], True)
+            # 限流器已根据429暂停该账号，重试时由限流器等待，这里不再额外等待
+            logger.warning(f"[AIVideo-{aivideo_id}] 请求频率限制(429)，等待限流器放行后重试...")
+
+async def cancel_runway_task(aivideo_id: int, task_id: str, account: dict) -> bool:
+    """
+    取消Runway上的视频任务，失败时只记录日志
+    
+    Args:
+        aivideo_id: AI视频ID
+        task_id: Runway任务ID
+        account: 账号信息
+        
+    Returns:
+        bool: 是否取消成功
+    """
+    headers = {
+        "Authorization": f"Bearer {account['token']}",
+        "Accept": "application/json",
+        "User-Agent": USER_AGENT
+    }
+    try:
+        response = await async_runway_client.delete(
+            f"{API_BASE_URL}/tasks/{task_id}",
+            headers=headers,
+            params={"asTeamId": account['as_team_id']},
+            account=account
+        )
+        response.raise_for_status()
+        logger.info(f"[AIVideo-{aivideo_id}] 已取消Runway任务: {task_id}")
+        return True
+    except Exception as e:
+        logger.warning(f"[AIVideo-{aivideo_id}] 取消Runway任务失败，任务ID: {task_id}, 错误: {str(e)}")
+        return False
+
+async def get_task_detail(aivideo_id: int, task_id: str, account: dict) -> Optional[Dict]:
     """
     获取任务详细信息
     
@@ -241,10 +428,12 @@ def get_task_detail(aivideo_id: int, task_id: str, account: dict) -> Optional[Di
         "User-Agent": USER_AGENT
     }
     
-    response = requests.get(
+    response = await async_runway_client.get(
         f"{API_BASE_URL}/tasks/{task_id}",
         headers=headers,
-        params={"asTeamId": account['as_team_id']}
+        params={"asTeamId": account['as_team_id']},
+        account=account,
+        poll=True
     )
     
     if response.status_code == 401:
@@ -278,7 +467,7 @@ def parse_task_id(aivideo_id: int, response_data: Dict) -> Optional[str]:
         return None
 
 
-def get_asset_group_id(aivideo_id: int, session_id: str, account: dict) -> Optional[str]:
+async def get_asset_group_id(aivideo_id: int, session_id: str, account: dict) -> Optional[str]:
     """
     获取assetGroupId
     
@@ -296,10 +485,11 @@ def get_asset_group_id(aivideo_id: int, session_id: str, account: dict) -> Optio
     }
     
     logger.info(f"[AIVideo-{aivideo_id}] 获取assetGroupId，Session ID: {session_id}")
-    response = requests.get(
-        f"https://api.runwayml.com/v1/sessions/{session_id}",
+    response = await async_runway_client.get(
+        f"{API_BASE_URL}/sessions/{session_id}",
         headers=headers,
-        params={"asTeamId": account['as_team_id']}
+        params={"asTeamId": account['as_team_id']},
+        account=account
     )
 
     if response.status_code == 401:
@@ -316,7 +506,7 @@ def get_asset_group_id(aivideo_id: int, session_id: str, account: dict) -> Optio
     else:
         logger.error(f"[AIVideo-{aivideo_id}] 未能获取到assetGroupId")
         return None
-def get_asset_group(aivideo_id: int, session_id: str, account: dict) -> Optional[str]:
+async def get_asset_group(aivideo_id: int, session_id: str, account: dict) -> Optional[str]:
     """
     获取assetGroupId
     
@@ -334,10 +524,11 @@ def get_asset_group(aivideo_id: int, session_id: str, account: dict) -> Optional
     }
     
     logger.info(f"[AIVideo-{aivideo_id}] 获取assetGroupId，Session ID: {session_id}")
-    response = requests.post(
-        f"https://api.runwayml.com/v1/sessions/{session_id}/assetGroup",
+    response = await async_runway_client.post(
+        f"{API_BASE_URL}/sessions/{session_id}/assetGroup",
         headers=headers,
-        params={"asTeamId": account['as_team_id']}
+        params={"asTeamId": account['as_team_id']},
+        account=account
     )
 
     if response.status_code == 401:
@@ -398,10 +589,17 @@ def parse_task_status(aivideo_id: int, task_detail: Dict) -> Dict:
     return result
 
 # 上传图片到runway
-def upload_image_to_runway(aivideo_id: int, session_id: str, image_path: str, account: dict):
+async def upload_image_to_runway(aivideo_id: int, session_id: str, image_path: str, account: dict):
     # 获取上传链接
     logger.info(f"[AIVideo-{aivideo_id}] 上传图片到runway，Session ID: {session_id}, 图片路径: {image_path}, 账号: {account}")
 
+    # 同一账号上传过相同内容的图片时直接复用图片地址
+    digest = await asyncio.to_thread(file_sha256, image_path)
+    cached_url = upload_cache.get(digest, account['as_team_id'])
+    if cached_url:
+        logger.info(f"[AIVideo-{aivideo_id}] 图片已上传过，复用图片URL: {cached_url}")
+        return cached_url
+
     headers = {
         "Authorization": f"Bearer {account['token']}",
         "Content-Type": "application/json", 
@@ -421,10 +619,11 @@ def upload_image_to_runway(aivideo_id: int, session_id: str, image_path: str, ac
     }
     
     logger.info(f"[AIVideo-{aivideo_id}] 请求上传链接，payload: {get_upload_url_payload}")
-    response = requests.post(
+    response = await async_runway_client.post(
         f"{API_BASE_URL}/uploads",
         headers = headers,
-        json = get_upload_url_payload
+        json = get_upload_url_payload,
+        account=account
     )
     
     if response.status_code == 401:
@@ -454,18 +653,18 @@ def upload_image_to_runway(aivideo_id: int, session_id: str, image_path: str, ac
     headers["Content-Length"] = str(file_size)
     logger.info(f"[AIVideo-{aivideo_id}] 文件大小: {file_size} 字节")
     
-    with open(image_path, 'rb') as f:
-        logger.info(f"[AIVideo-{aivideo_id}] 开始上传文件到: {upload_url}")
-        response = requests.put(upload_url, data=f, headers=headers)
-        
-        if response.status_code == 401:
-            logger.error(f"[AIVideo-{aivideo_id}] Runway账号token失效")
-            raise HTTPException(status_code=401, detail="Runway账号失效")
-            
-        response.raise_for_status()
+    # 从磁盘流式上传，不把整个文件读入内存
+    logger.info(f"[AIVideo-{aivideo_id}] 开始上传文件到: {upload_url}")
+    response = await async_runway_client.upload(upload_url, image_path, headers=headers)
+    
+    if response.status_code == 401:
+        logger.error(f"[AIVideo-{aivideo_id}] Runway账号token失效")
+        raise HTTPException(status_code=401, detail="Runway账号失效")
         
-        etag = response.headers.get('ETag')
-        logger.info(f"[AIVideo-{aivideo_id}] 文件上传成功，获取到ETag: {etag}")
+    response.raise_for_status()
+    
+    etag = response.headers.get('ETag')
+    logger.info(f"[AIVideo-{aivideo_id}] 文件上传成功，获取到ETag: {etag}")
 
     if not etag:
         logger.error(f"[AIVideo-{aivideo_id}] 上传图片失败: 未获取到ETag")
@@ -491,10 +690,11 @@ def upload_image_to_runway(aivideo_id: int, session_id: str, image_path: str, ac
     }
     
     logger.info(f"[AIVideo-{aivideo_id}] 完成上传请求，upload_id: {upload_id}, payload: {payload}")
-    response = requests.post(
+    response = await async_runway_client.post(
         f"{API_BASE_URL}/uploads/{upload_id}/complete",
         headers=headers,
-        json=payload
+        json=payload,
+        account=account
     )
     
     if response.status_code == 401:
@@ -506,10 +706,20 @@ def upload_image_to_runway(aivideo_id: int, session_id: str, image_path: str, ac
     data = response.json()
     image_url = data.get('url')
     logger.info(f"[AIVideo-{aivideo_id}] 完成上传成功，图片URL: {image_url}")
+    if image_url:
+        upload_cache.set(digest, account['as_team_id'], image_url)
     
     return image_url
 
 
+def fail_ai_video_job(user_id: int, video_id: int, *args):
+    """持久化队列放弃AI视频任务（如超过最大重试次数）时，将未完成的视频标记为失败"""
+    AIVideo.update(status=3).where((AIVideo.id == video_id) & (AIVideo.status.in_([0, 1]))).execute()
+    logger.error(f"[AIVideo-{video_id}] 已被任务队列放弃，标记为失败")
+
+job_queue.register("ai_video_generate", ai_video_generate, timeout=JOB_TIMEOUTS["ai_video_generate"],
+                   on_failed=fail_ai_video_job)
+
 @router.post("/create_video", response_model=CreateVideoResponse)
 async def create_video(
     prompt: str = Form(...),
@@ -523,6 +733,16 @@ async def create_video(
     if resolution not in Resolution:
         raise HTTPException(status_code=400, detail="分辨率只能是 1280x768(横屏) 或 768x1280(竖屏)")
     
+    # 积压任务过多时快速返回，避免请求堆积
+    try:
+        job_queue.check_admission()
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail={"message": "当前生成任务过多，请稍后重试", "queue_depth": e.queue_depth, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     # 保存上传的图片
     upload_dir = "uploads"
     if not os.path.exists(upload_dir):
@@ -543,15 +763,13 @@ async def create_video(
         status=1  # 排队中
     )
 
-    global_thread_pool.submit(
-        ai_video_generate, 
-        user_context.user_id, 
-        video.id, 
-        prompt, 
-        photo_path, 
-        seconds, 
-        seed, 
-        resolution
+    # 写入持久化队列，按用户公平调度，权重取决于用户的卡密类型
+    job_queue.enqueue(
+        "ai_video_generate",
+        (user_context.user_id, video.id, prompt, photo_path, seconds, seed, resolution),
+        owner_id=user_context.user_id,
+        weight=get_user_schedule_weight(user_context.user_id),
+        job_key=f"ai_video:{video.id}"
     )
 
     return {
@@ -617,4 +835,34 @@ async def get_video_list(
     return {
         "total": total,
         "items": items
-    }
\ No newline at end of file
+    }
+
+
+@router.post("/cancel/{video_id}", response_model=CancelVideoResponse)
+async def cancel_video(
+    video_id: int,
+    user_context: UserContext = Depends()
+):
+    """
+    取消AI视频生成
+    
+    停止轮询，取消Runway上的任务并立即释放占用的账号
+    
+    Args:
+        video_id: AI视频ID
+        user: 用户上下文
+    """
+    video = AIVideo.get_or_none((AIVideo.id == video_id) & (AIVideo.user == user_context.user_id))
+    if not video:
+        raise HTTPException(status_code=404, detail="视频不存在或无权取消")
+    if video.status in (2, 3, 4):
+        raise HTTPException(status_code=400, detail="视频已结束，无法取消")
+    
+    AIVideo.update(status=4, updated_at=datetime.datetime.now()).where(AIVideo.id == video_id).execute()
+    job_queue.cancel(f"ai_video:{video_id}")
+    logger.info(f"[AIVideo-{video_id}] 用户 {user_context.user_id} 取消视频生成")
+    
+    return {
+        "success": True,
+        "message": "视频生成已取消"
+    }
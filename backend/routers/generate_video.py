@@ -7,17 +7,23 @@ from loguru import logger
 from scripts.config import USER_AGENT
 import uuid
 import os
-from utils.thread_pool import global_thread_pool
-from models import Task, VideoGeneration, User, RunwaySession
+from utils.thread_pool import global_thread_pool, PoolSaturatedError, Reschedule, is_deadline_exceeded
+from utils.job_queue import job_queue
+from models import Task, VideoGeneration, User, RunwayAccount
 from utils.account_pool import account_pool
+from utils.runway_client import async_runway_client, API_BASE_URL
+from utils.asset_group_cache import asset_group_cache
+from utils.upload_cache import upload_cache, file_sha256
+from utils.account_health import account_health
 from utils.thread_pool import Task as ThreadPoolTask
 from utils.image_util import pad_image, crop_image
-import requests
 import json
 import time
+import asyncio
 from typing import Optional, Dict
-from base.config import PERSONAL_PROMPT
+from base.config import PERSONAL_PROMPT, JOB_TIMEOUTS, ACCOUNT_WAIT_TIMEOUT
 from routers.prompt import get_random_prompt, get_category_cn_name
+from routers.user import get_user_schedule_weight
 from datetime import datetime, timedelta
 import random
 
@@ -41,8 +47,6 @@ class GenerateVideoLimitResponse(BaseModel):
     product_categories: Optional[List[str]] = None
 
 
-API_BASE_URL = "https://api.runwayml.com/v1"
-
 # 内容类型映射
 CONTENT_TYPE_MAP = {
     '.jpg': 'image/jpeg',
@@ -54,239 +58,7 @@ CONTENT_TYPE_MAP = {
 
 router = APIRouter()
 
-async def process_video_generation(
-    user_id: int,
-    task_id: int,
-    person_prompt: str,
-    product_prompt: str,
-    person_categories: List[str],
-    product_categories: List[str],
-    person_photo_path: str,
-    product_photo_path: str
-):
-    
-    try:
-        """
-        处理视频生成的后台任务
-        """
-        logger.info(f"开始处理视频生成任务 {task_id}")
-        
-        # 更新任务状态为生成中
-        task = Task.get_by_id(task_id)
-        task.status = 1  # 1-生成中
-        task.save()
-        
-        # 获取账号，如果没有可用账号则死循环阻塞等待
-        account = None
-        # 尝试创建人物视频任务，最多尝试5次
-        runway_task_id = None
-        retry_count = 0
-        while retry_count < 5:
-            while account is None:
-                account = account_pool.get_account()
-                if account is None:
-                    logger.warning("没有可用账号，等待5秒后重试...")
-                    time.sleep(5)
-            # 获取到账号，获取Session信息
-            session = RunwaySession.get(runway_id=account['id'])
-            logger.info(f"获取到账号 ID: {account['id']}, 用户名: {account['username']}, Session ID: {session.session_id}")
-
-            # 获取账号后，开始处理
-            # 上传图片到runway
-            person_image_url = upload_image_to_runway(session.session_id, person_photo_path, account)
-            
-            runway_task_id = create_video_task(
-                image_url=person_image_url,
-                text_prompt=PERSONAL_PROMPT + "," + person_prompt,
-                session_id=session.session_id,
-                seconds=5,
-                account=account
-            )
-            if runway_task_id:
-                break
-            # 释放账号
-            if account:
-                account_pool.release_account(account['id'])
-                logger.info(f"已释放账号 ID: {account['id']}")
-                account = None
-            logger.warning(f"创建人物视频任务失败，第{retry_count+1}次重试...")
-            time.sleep(60)  # 等待1分钟后重试
-            retry_count += 1
-            
-        if not runway_task_id:
-            logger.error("创建人物视频任务失败，已达到最大重试次数")
-            # 更新任务状态为失败
-            task = Task.get_by_id(task_id)
-            task.status = 3  # 3-失败
-            task.save()
-            return
-        
-        video_url = None
-        # 轮询任务状态
-        while True:
-            task_detail = get_task_detail(runway_task_id, account)
-            if task_detail:
-                status_info = parse_task_status(task_detail)
-                if status_info:
-                    logger.info(f"任务状态: {status_info['status']}")
-                    logger.info(f"进度: {status_info['progress']}")
-                    
-                    # 如果任务完成或失败则退出循环
-                    if status_info['status'] in ['SUCCEEDED']:
-                        if status_info['video_url']:
-                            logger.info(f"视频URL: {status_info['video_url']}")
-                            logger.info(f"预览图片URLs: {json.dumps(status_info['preview_urls'], indent=2)}")
-                            
-                            # 添加VideoGeneration记录
-                            VideoGeneration.create(
-                                task=task_id,
-                                type=0,  # 0-人物
-                                user_prompt=person_prompt,
-                                category=','.join(person_categories),
-                                image_url=person_image_url,
-                                video_url=status_info['video_url'],
-                                runway_id=account['id'],
-                                session_id=session.session_id
-                            )
-                            
-                            
-                        break
-                    if status_info['status'] in ['FAILED', 'CANCELED']:
-                        logger.error(f"人物视频生成失败，任务ID: {runway_task_id}")
-                        # 更新任务状态为失败
-                        task = Task.get_by_id(task_id)
-                        task.status = 3  # 3-失败
-                        task.save()
-                        return 
-                        
-            # 等待5秒后再次查询
-            time.sleep(5)
-        
-        if account:
-            account_pool.release_account(account['id'])
-            logger.info(f"已释放账号 ID: {account['id']}")
-            account = None
-        
-        system_prompt = ""
-        category_cn_name_list = []
-        # 循环获取产品提示词
-        for category in product_categories:
-            # 拼接提示词
-            prompt = get_random_prompt(category)
-            # 获取中文分类名称
-            category_cn_name = get_category_cn_name(category)
-            category_cn_name_list.append(category_cn_name)
-            if isinstance(prompt, str):
-                system_prompt += prompt + ","
-            else:
-                # 如果get_random_prompt返回协程，需要等待它完成
-                prompt_result = await prompt
-                system_prompt += prompt_result + ","
-        
-        system_prompt += product_prompt
-        # 尝试创建产品视频任务，最多尝试5次
-        runway_task_id = None
-        retry_count = 0
-        while retry_count < 5:
-            while account is None:
-                account = account_pool.get_account()
-                if account is None:
-                    logger.warning("没有可用账号，等待5秒后重试...")
-                    time.sleep(5)
-            # 获取到账号，获取Session信息
-            session = RunwaySession.get(runway_id=account['id'])
-            logger.info(f"获取到账号 ID: {account['id']}, 用户名: {account['username']}, Session ID: {session.session_id}")
-
-            # 获取账号后，开始处理
-            # 上传图片到runway
-            product_image_url = upload_image_to_runway(session.session_id, product_photo_path, account)
-            runway_task_id = create_video_task(
-                image_url=product_image_url,
-                text_prompt=system_prompt,
-                session_id=session.session_id,
-                seconds=5,
-                account=account
-            )
-            if runway_task_id:
-                break
-            # 释放账号
-            if account:
-                account_pool.release_account(account['id'])
-                logger.info(f"已释放账号 ID: {account['id']}")
-                account = None
-            
-            logger.warning(f"创建产品视频任务失败，第{retry_count+1}次重试...")
-            time.sleep(60)  # 等待1分钟后重试
-            retry_count += 1
-            
-        if not runway_task_id:
-            logger.error("创建产品视频任务失败，已达到最大重试次数")
-            # 更新任务状态为失败
-            task = Task.get_by_id(task_id)
-            task.status = 3  # 3-失败
-            task.save()
-            return
-        
-        video_url = None
-        # 轮询任务状态
-        while True:
-            task_detail = get_task_detail(runway_task_id, account)
-            if task_detail:
-                status_info = parse_task_status(task_detail)
-                if status_info:
-                    logger.info(f"任务状态: {status_info['status']}")
-                    logger.info(f"进度: {status_info['progress']}")
-                    
-                    # 如果任务完成或失败则退出循环
-                    if status_info['status'] in ['SUCCEEDED', 'FAILED', 'CANCELED']:
-                        if status_info['video_url']:
-                            logger.info(f"视频URL: {status_info['video_url']}")
-                            logger.info(f"预览图片URLs: {json.dumps(status_info['preview_urls'], indent=2)}")
-                            
-                            # 添加VideoGeneration记录
-                            VideoGeneration.create(
-                                task=task_id,
-                                type=1,  
-                                user_prompt=product_prompt,
-                                category=','.join(category_cn_name_list),
-                                image_url=product_image_url,
-                                video_url=status_info['video_url'],
-                                runway_id=account['id'],
-                                session_id=session.session_id
-                            )
-                            
-                            # 更新任务状态为完成
-                            task = Task.get_by_id(task_id)
-                            task.status = 2  # 2-完成
-                            task.save()
-                            
-                        break
-                    if status_info['status'] in ['FAILED', 'CANCELED']:
-                        logger.error(f"产品视频生成失败，任务ID: {runway_task_id}")
-                        # 更新任务状态为失败
-                        task = Task.get_by_id(task_id)
-                        task.status = 3  # 3-失败
-                        task.save()
-                        return 
-                        
-            # 等待5秒后再次查询
-            time.sleep(5)
-        
-    except Exception as e:
-        logger.error(f"视频生成任务 {task_id} 失败: {str(e)}")
-        # 更新任务状态为失败
-        try:
-            task = Task.get_by_id(task_id)
-            task.status = 3  # 3-失败
-            task.save()
-        except Exception as ex:
-            logger.error(f"更新任务状态失败: {str(ex)}")
-    finally:
-        # 释放账号回到账号池
-        if account:
-            account_pool.release_account(account['id'])
-            logger.info(f"已释放账号 ID: {account['id']}")
-def get_task_detail(task_id: str, account: dict) -> Optional[Dict]:
+async def get_task_detail(task_id: str, account: dict) -> Optional[Dict]:
     """
     获取任务详细信息
     
@@ -302,10 +74,12 @@ def get_task_detail(task_id: str, account: dict) -> Optional[Dict]:
         "User-Agent": USER_AGENT
     }
     
-    response = requests.get(
+    response = await async_runway_client.get(
         f"{API_BASE_URL}/tasks/{task_id}",
         headers=headers,
-        params={"asTeamId": account['as_team_id']}
+        params={"asTeamId": account['as_team_id']},
+        account=account,
+        poll=True
     )
     
     if response.status_code == 401:
@@ -315,6 +89,50 @@ def get_task_detail(task_id: str, account: dict) -> Optional[Dict]:
     
     data = response.json()
     return data
+async def cancel_runway_task(task_id: str, account: dict) -> bool:
+    """
+    取消Runway上的视频任务，失败时只记录日志
+    
+    Args:
+        task_id: Runway任务ID
+        account: 账号信息
+        
+    Returns:
+        bool: 是否取消成功
+    """
+    headers = {
+        "Authorization": f"Bearer {account['token']}",
+        "Accept": "application/json",
+        "User-Agent": USER_AGENT
+    }
+    try:
+        response = await async_runway_client.delete(
+            f"{API_BASE_URL}/tasks/{task_id}",
+            headers=headers,
+            params={"asTeamId": account['as_team_id']},
+            account=account
+        )
+        response.raise_for_status()
+        logger.info(f"已取消Runway任务: {task_id}")
+        return True
+    except Exception as e:
+        logger.warning(f"取消Runway任务失败，任务ID: {task_id}, 错误: {str(e)}")
+        return False
+
+
+def cancel_video_task(task_id: int) -> int:
+    """
+    取消任务的人物和产品视频生成，停止轮询并立即释放占用的账号
+    
+    Args:
+        task_id: 任务ID
+        
+    Returns:
+        int: 被取消的任务数量
+    """
+    return sum(job_queue.cancel(f"generate_video:{task_id}:{type}") for type in (0, 1))
+
+
 def parse_task_status(task_detail: Dict) -> Dict:
     """
     解析任务状态和视频URL
@@ -356,7 +174,7 @@ def parse_task_status(task_detail: Dict) -> Dict:
         logger.info(f"视频URL: {result['video_url']}")
         
     return result
-def create_video_task(
+async def create_video_task(
     image_url: str,
     text_prompt: str,
     session_id: str,
@@ -378,13 +196,16 @@ def create_video_task(
     Returns:
         str: 成功时返回任务ID，失败返回None
     """
-    # 获取assetGroupId
-    asset_group_id = get_asset_group_id(session_id=session_id, account=account)
+    # 获取assetGroupId，同一会话的assetGroupId不变，优先使用缓存
+    asset_group_id = asset_group_cache.get(session_id)
     if not asset_group_id:
-        asset_group_id = get_asset_group(session_id=session_id, account=account)
+        asset_group_id = await get_asset_group_id(session_id=session_id, account=account)
+        if not asset_group_id:
+            asset_group_id = await get_asset_group(session_id=session_id, account=account)
         if not asset_group_id:
             logger.error("未能获取到assetGroupId")
             return None
+        await asset_group_cache.set_async(session_id, asset_group_id)
     logger.info(f"获取到assetGroupId: {asset_group_id}")
     headers = {
         "Authorization": f"Bearer {account['token']}",
@@ -418,24 +239,26 @@ def create_video_task(
     
     logger.info(f"开始创建视频任务，提示词: {text_prompt[:30]}...")
     
-    while True:
-        response = requests.post(
-            f"{API_BASE_URL}/tasks",
-            headers=headers,
-            json=payload
-        )
-        
-        if response.status_code == 401:
-            logger.error("Runway账号token失效")
-            raise HTTPException(status_code=401, detail="Runway账号失效")
-            
-        if response.status_code == 429:
-            logger.warning("请求频率限制(429)，3秒后重试...")
-            time.sleep(3)
-            continue
+    response = await async_runway_client.post(
+        f"{API_BASE_URL}/tasks",
+        headers=headers,
+        json=payload,
+        account=account
+    )
+    
+    if response.status_code in (401, 404):
+        # 账号或会话失效，清除缓存的assetGroupId，下次重新获取
+        await asset_group_cache.invalidate_async(session_id)
+
+    if response.status_code == 401:
+        logger.error("Runway账号token失效")
+        raise HTTPException(status_code=401, detail="Runway账号失效")
         
-        response.raise_for_status()
-        break
+    if response.status_code == 429:
+        logger.warning("请求频率限制(429)")
+        raise HTTPException(status_code=429, detail="Runway请求频率限制")
+    
+    response.raise_for_status()
     
     data = response.json()
     task_id = parse_task_id(data)
@@ -447,6 +270,34 @@ def create_video_task(
         return None
                 
 
+
+async def create_video_task_async(**kwargs) -> Optional[str]:
+    """
+    创建视频生成任务，遇到频率限制(429)时等待到限流器放行后重试
+    
+    Args:
+        kwargs: 传给create_video_task的参数
+        
+    Returns:
+        str: 成功时返回任务ID，失败返回None
+    """
+    account_id = kwargs['account']['id']
+    while True:
+        try:
+            task_id = await create_video_task(**kwargs)
+            account_pool.record_request(account_id, False)
+            if task_id:
+                # 计入账号当天的生成数，用于每日上限
+                account_pool.record_generation(account_id)
+            return task_id
+        except HTTPException as e:
+            if e.status_code != 429:
+                raise
+            # 上报限流，账号选择策略据此减少向该账号分配任务，并降低该账号的并发上限
+            account_pool.record_request(account_id, True)
+            # 限流器已根据429暂停该账号，重试时由限流器等待，这里不再额外等待
+            logger.warning("请求频率限制(429)，等待限流器放行后重试...")
+
 def parse_task_id(response_data: Dict) -> Optional[str]:
     """
     从任务响应数据中解析任务ID
@@ -469,7 +320,7 @@ def parse_task_id(response_data: Dict) -> Optional[str]:
         logger.error(f"解析任务ID失败: {e}")
         return None
 
-def get_asset_group_id(session_id: str, account: dict) -> Optional[str]:
+async def get_asset_group_id(session_id: str, account: dict) -> Optional[str]:
     """
     获取assetGroupId
     
@@ -487,10 +338,11 @@ def get_asset_group_id(session_id: str, account: dict) -> Optional[str]:
     }
     
     logger.info(f"获取assetGroupId，Session ID: {session_id}")
-    response = requests.get(
-        f"https://api.runwayml.com/v1/sessions/{session_id}",
+    response = await async_runway_client.get(
+        f"{API_BASE_URL}/sessions/{session_id}",
         headers=headers,
-        params={"asTeamId": account['as_team_id']}
+        params={"asTeamId": account['as_team_id']},
+        account=account
     )
 
     if response.status_code == 401:
@@ -507,7 +359,7 @@ def get_asset_group_id(session_id: str, account: dict) -> Optional[str]:
     else:
         logger.error("未能获取到assetGroupId")
         return None
-def get_asset_group(session_id: str, account: dict) -> Optional[str]:
+async def get_asset_group(session_id: str, account: dict) -> Optional[str]:
     """
     获取assetGroupId
     
@@ -525,10 +377,11 @@ def get_asset_group(session_id: str, account: dict) -> Optional[str]:
     }
     
     logger.info(f"获取assetGroupId，Session ID: {session_id}")
-    response = requests.post(
-        f"https://api.runwayml.com/v1/sessions/{session_id}/assetGroup",
+    response = await async_runway_client.post(
+        f"{API_BASE_URL}/sessions/{session_id}/assetGroup",
         headers=headers,
-        params={"asTeamId": account['as_team_id']}
+        params={"asTeamId": account['as_team_id']},
+        account=account
     )
 
     if response.status_code == 401:
@@ -546,10 +399,17 @@ def get_asset_group(session_id: str, account: dict) -> Optional[str]:
         return None
 
 # 上传图片到runway
-def upload_image_to_runway(session_id: str, image_path: str, account: dict):
+async def upload_image_to_runway(session_id: str, image_path: str, account: dict):
     # 获取上传链接
     logger.info(f"上传图片到runway，Session ID: {session_id}, 图片路径: {image_path}, 账号: {account}")
 
+    # 同一账号上传过相同内容的图片时直接复用图片地址
+    digest = await asyncio.to_thread(file_sha256, image_path)
+    cached_url = upload_cache.get(digest, account['as_team_id'])
+    if cached_url:
+        logger.info(f"图片已上传过，复用图片URL: {cached_url}")
+        return cached_url
+
     headers = {
         "Authorization": f"Bearer {account['token']}",
         "Content-Type": "application/json", 
@@ -569,10 +429,11 @@ def upload_image_to_runway(session_id: str, image_path: str, account: dict):
     }
     
     logger.info(f"请求上传链接，payload: {get_upload_url_payload}")
-    response = requests.post(
+    response = await async_runway_client.post(
         f"{API_BASE_URL}/uploads",
         headers = headers,
-        json = get_upload_url_payload
+        json = get_upload_url_payload,
+        account=account
     )
     
     if response.status_code == 401:
@@ -602,18 +463,18 @@ def upload_image_to_runway(session_id: str, image_path: str, account: dict):
     headers["Content-Length"] = str(file_size)
     logger.info(f"文件大小: {file_size} 字节")
     
-    with open(image_path, 'rb') as f:
-        logger.info(f"开始上传文件到: {upload_url}")
-        response = requests.put(upload_url, data=f, headers=headers)
-        
-        if response.status_code == 401:
-            logger.error("Runway账号token失效")
-            raise HTTPException(status_code=401, detail="Runway账号失效")
-            
-        response.raise_for_status()
+    # 从磁盘流式上传，不把整个文件读入内存
+    logger.info(f"开始上传文件到: {upload_url}")
+    response = await async_runway_client.upload(upload_url, image_path, headers=headers)
+    
+    if response.status_code == 401:
+        logger.error("Runway账号token失效")
+        raise HTTPException(status_code=401, detail="Runway账号失效")
         
-        etag = response.headers.get('ETag')
-        logger.info(f"文件上传成功，获取到ETag: {etag}")
+    response.raise_for_status()
+    
+    etag = response.headers.get('ETag')
+    logger.info(f"文件上传成功，获取到ETag: {etag}")
 
     if not etag:
         logger.error("上传图片失败: 未获取到ETag")
@@ -639,10 +500,11 @@ def upload_image_to_runway(session_id: str, image_path: str, account: dict):
     }
     
     logger.info(f"完成上传请求，upload_id: {upload_id}, payload: {payload}")
-    response = requests.post(
+    response = await async_runway_client.post(
         f"{API_BASE_URL}/uploads/{upload_id}/complete",
         headers=headers,
-        json=payload
+        json=payload,
+        account=account
     )
     
     if response.status_code == 401:
@@ -654,6 +516,8 @@ def upload_image_to_runway(session_id: str, image_path: str, account: dict):
     data = response.json()
     image_url = data.get('url')
     logger.info(f"完成上传成功，图片URL: {image_url}")
+    if image_url:
+        upload_cache.set(digest, account['as_team_id'], image_url)
     
     return image_url
 
@@ -662,83 +526,151 @@ async def generate_video_task(
         task_id: int,
         type : int, # 0-人物，1-产品
         prompt: str,
-        photo_path: str,
+        photo_path: Optional[str],
         categories: List[str]
 ):
     try:
         task_log_prefix = f"任务[{task_id}_{type}]"
-        # 循环阻塞获取账号
         account = None
-        while not account:
-            account = account_pool.get_account()
-            if not account:
-                logger.info(f"{task_log_prefix} 用户 {user_id} 未能获取到账号，3秒后重试...")
-                time.sleep(3)
-        # 获取Session
-        session = RunwaySession.get(runway_id=account['id'])
-        logger.info(f"{task_log_prefix} user_id: {user_id}, 获取到账号 ID: {account['id']}, 用户名: {account['username']}, Session ID: {session.session_id}")
-
-        # 上传图片到runway
-        image_url = upload_image_to_runway(session.session_id, photo_path, account)
-        # 创建视频任务
-        logger.info(f"{task_log_prefix} 默认提示词是: {type} == {prompt}")
-        my_prompt = ""
-        # 输出分类
-        logger.info(f"{task_log_prefix} 分类是: {categories[0]}")
-        if type == 0:
-            my_prompt = prompt if prompt != "默认人像提示词" else PERSONAL_PROMPT
+        poll_account = None
+        generation = None
+        runway_task_id = None
+        queue_started_at = None  # 新建Runway任务的创建时间，用于上报排队时间，恢复的任务不上报
+        # 数据库操作都交给IO线程执行，不阻塞异步任务引擎的事件循环
+        if (await asyncio.to_thread(Task.get_by_id, task_id)).status == 4:
+            logger.info(f"{task_log_prefix} 任务已删除，不再生成")
+            return
+        # 进程重启后任务会被重新执行，已经创建过Runway任务的直接恢复轮询，不重复生成
+        generation = await asyncio.to_thread(VideoGeneration.get_or_none,
+                                             (VideoGeneration.task == task_id) & (VideoGeneration.type == type))
+        if generation and generation.status == 2:
+            logger.info(f"{task_log_prefix} 视频已生成，无需重复执行")
+            return
+        if generation and generation.status == 1 and generation.runway_task_id:
+            runway_task_id = generation.runway_task_id
+            account = await account_pool.get_account_by_id_async(int(generation.runway_id), holder=task_log_prefix)
+            if account:
+                poll_account = account
+            else:
+                # 账号实例都在使用中时仍然使用该账号的凭据轮询，Runway任务已在远端运行
+                poll_account = await asyncio.to_thread(
+                    RunwayAccount.select().where(RunwayAccount.id == int(generation.runway_id)).dicts().first)
+                if not poll_account:
+                    # 账号已被删除，无法再查询该Runway任务
+                    raise Exception(f"恢复轮询失败，账号 ID: {generation.runway_id} 不存在")
+            logger.info(f"{task_log_prefix} 恢复轮询Runway任务: {runway_task_id}, 账号 ID: {poll_account['id']}")
         else:
-            my_prompt = prompt if prompt != "默认商品提示词" else get_random_prompt(categories[0])
-        logger.info(f"{task_log_prefix} 最终提示词是: {type} == {my_prompt}")
-        runway_task_id = create_video_task(
+            # 排队等待账号释放，等待过久时交还并发名额，由线程池重新调度本任务
+            account = await account_pool.acquire_async(timeout=ACCOUNT_WAIT_TIMEOUT, holder=task_log_prefix)
+            if not account:
+                logger.info(f"{task_log_prefix} 用户 {user_id} 未能获取到账号，稍后重试...")
+                return Reschedule(1)
+            poll_account = account
+            # 获取Session，实例没有携带会话时需要查询数据库
+            session_id = account.get('session_id') or await asyncio.to_thread(account_pool.get_session_id, account)
+            logger.info(f"{task_log_prefix} user_id: {user_id}, 获取到账号 ID: {account['id']}, 用户名: {account['username']}, Session ID: {session_id}")
+
+            # 上传图片到runway
+            image_url = await upload_image_to_runway(session_id, photo_path, account)
+            # 创建视频任务
+            logger.info(f"{task_log_prefix} 默认提示词是: {type} == {prompt}")
+            my_prompt = ""
+            # 输出分类
+            logger.info(f"{task_log_prefix} 分类是: {categories[0]}")
+            if type == 0:
+                my_prompt = prompt if prompt != "默认人像提示词" else PERSONAL_PROMPT
+            else:
+                my_prompt = prompt if prompt != "默认商品提示词" else get_random_prompt(categories[0])
+            logger.info(f"{task_log_prefix} 最终提示词是: {type} == {my_prompt}")
+            # 上传期间租约丢失时实例可能已被其他持有者使用，重新获取账号后再创建任务
+            if account.lost:
+                logger.warning(f"{task_log_prefix} 账号 ID: {account['id']} 的租约已丢失，稍后重新获取账号")
+                return Reschedule(1)
+            runway_task_id = await create_video_task_async(
+                    image_url=image_url,
+                    text_prompt=my_prompt,
+                    session_id=session_id,
+                    seconds=5,
+                    seed=random.randint(1, 1000000000),
+                    account=account
+                )
+            queue_started_at = time.time()
+            if not runway_task_id:
+                raise Exception("创建视频生成任务失败")
+            
+            # 创建后立即记录Runway任务ID、账号和会话，进程重启后据此恢复轮询
+            generation = await asyncio.to_thread(
+                VideoGeneration.create,
+                task=task_id,
+                type=type,  # 0-人物，1-产品
+                user_prompt= prompt,
+                category=get_category_cn_name(categories[0]),
                 image_url=image_url,
-                text_prompt=my_prompt,
-                session_id=session.session_id,
-                seconds=5,
-                seed=random.randint(1, 1000000000),
-                account=account
+                runway_id=account['id'],
+                session_id=session_id,
+                runway_task_id=runway_task_id,
+                status=1  # 1-生成中
             )
         
         # 循环获取任务状态
         # 轮询任务状态
+        started_at = generation.created_at.timestamp()
+        throttled = False
         while True:
-            task_detail = get_task_detail(runway_task_id, account)
+            task_detail = await get_task_detail(runway_task_id, poll_account)
             if task_detail:
                 status_info = parse_task_status(task_detail)
                 if status_info:
                     logger.info(f"{task_log_prefix} 任务状态: {status_info['status']}")
                     logger.info(f"{task_log_prefix} 进度: {status_info['progress']}")
                     
+                    # 任务在Runway排队限流时上报一次，供账号选择策略和并发上限参考
+                    if status_info['status'] == 'THROTTLED' and not throttled:
+                        throttled = True
+                        account_pool.record_request(int(poll_account['id']), True)
+                    
+                    # 任务开始运行时上报排队时间，排队过久的账号降低并发上限
+                    if status_info['status'] in ['RUNNING', 'SUCCEEDED'] and queue_started_at:
+                        account_pool.record_queue_time(int(poll_account['id']), time.time() - queue_started_at)
+                        queue_started_at = None
+                    
                     # 如果任务完成或失败则退出循环
                     if status_info['status'] in ['SUCCEEDED']:
+                        account_pool.account_stats.record_duration(int(poll_account['id']), time.time() - started_at)
                         if status_info['video_url']:
                             logger.info(f"{task_log_prefix} 视频URL: {status_info['video_url']}")
                             logger.info(f"{task_log_prefix} 预览图片URLs: {json.dumps(status_info['preview_urls'], indent=2)}")
                             
-                            # 添加VideoGeneration记录
-                            VideoGeneration.create(
-                                task=task_id,
-                                type=type,  # 0-人物
-                                user_prompt= prompt,
-                                category=get_category_cn_name(categories[0]),
-                                image_url=image_url,
+                            # 更新VideoGeneration记录
+                            await asyncio.to_thread(VideoGeneration.update(
                                 video_url=status_info['video_url'],
-                                runway_id=account['id'],
-                                session_id=session.session_id
-                            )
+                                status=2  # 2-完成
+                            ).where(VideoGeneration.id == generation.id).execute)
                             
                             
                         break
                     if status_info['status'] in ['FAILED', 'CANCELED']:
                         logger.error(f"{task_log_prefix} 视频生成失败，任务ID: {runway_task_id}")
-                        task = Task.get_by_id(task_id)
-                        task.status = 3  # 3-失败
-                        task.save()
+                        await asyncio.to_thread(_fail_generation, task_id, generation.id)
                         raise HTTPException(status_code=400, detail="视频生成失败")
                         
             # 等待5秒后再次查询
-            time.sleep(5)
+            await asyncio.sleep(5)
         
+    except asyncio.CancelledError as e:
+        timed_out = is_deadline_exceeded(e)
+        if timed_out:
+            logger.error(f"{task_log_prefix} 超过截止时间，停止生成")
+        else:
+            logger.info(f"{task_log_prefix} 任务已取消，停止生成")
+        if runway_task_id and poll_account:
+            await cancel_runway_task(runway_task_id, poll_account)
+        if generation:
+            # 超时记为失败，用户删除记为取消
+            await asyncio.to_thread(VideoGeneration.update(status=3 if timed_out else 4).where(VideoGeneration.id == generation.id).execute)
+        if timed_out:
+            await asyncio.to_thread(Task.update(status=3).where((Task.id == task_id) & (Task.status != 4)).execute)
+        raise
     except HTTPException as e:
         if e.status_code == 401 and e.detail == "Runway账号失效":
             logger.error(f"{task_log_prefix} Runway账号失效: {str(e)}")
@@ -746,31 +678,82 @@ async def generate_video_task(
                 # 从账号池中删除失效账号
                 account_pool.remove_account(account['id'])
                 logger.info(f"{task_log_prefix} 已删除失效账号 ID: {account['id']}")
+                # 后台重新登录，成功后账号重新加入账号池
+                account_health.report_unauthorized(account['id'])
                 account = None
             # 生成失败
-            task = Task.get_by_id(task_id)
-            task.status = 3  # 3-失败
-            task.save()
+            await asyncio.to_thread(_fail_generation, task_id, generation.id if generation else None)
             raise
     except Exception as e:
         logger.error(f"{task_log_prefix} 生成视频任务失败: {str(e)}")
         # 生成失败
-        task = Task.get_by_id(task_id)
-        task.status = 3  # 3-失败
-        task.save()
+        await asyncio.to_thread(_fail_generation, task_id, generation.id if generation else None)
         raise
     finally:
         if account:
-            account_pool.release_account(account['id'])
+            await account_pool.release_account_async(account)
             logger.info(f"{task_log_prefix} 已释放账号 ID: {account['id']}")
             account = None
-        # 判断任务流程是否结束
-        if VideoGeneration.select().where(VideoGeneration.task == task_id).count() == 2:
-            task = Task.get_by_id(task_id)
+        await asyncio.to_thread(_finish_task_if_complete, task_id)
+
+def _fail_generation(task_id: int, generation_id: Optional[int]):
+    """将视频生成记录和所属任务标记为失败"""
+    if generation_id:
+        VideoGeneration.update(status=3).where(VideoGeneration.id == generation_id).execute()
+    task = Task.get_by_id(task_id)
+    task.status = 3  # 3-失败
+    task.save()
+
+def _finish_task_if_complete(task_id: int):
+    """判断任务流程是否结束，已删除的任务保持删除状态"""
+    if VideoGeneration.select().where((VideoGeneration.task == task_id) & (VideoGeneration.status == 2)).count() == 2:
+        task = Task.get_by_id(task_id)
+        if task.status != 4:
             task.status = 2  # 2-完成
             task.save()
             logger.info(f"任务[{task_id}] 全部完成，已更新状态")
 
+def fail_video_generation_job(user_id: int, task_id: int, type: int, *args):
+    """持久化队列放弃生成任务（如超过最大重试次数）时，将视频生成记录和任务标记为失败"""
+    generation = VideoGeneration.get_or_none((VideoGeneration.task == task_id) & (VideoGeneration.type == type))
+    if generation and generation.status == 2:
+        return
+    _fail_generation(task_id, generation.id if generation else None)
+    logger.error(f"任务[{task_id}_{type}] 已被任务队列放弃，标记为失败")
+
+job_queue.register("generate_video_task", generate_video_task, timeout=JOB_TIMEOUTS["generate_video_task"],
+                   on_failed=fail_video_generation_job)
+
+
+def recover_video_generations():
+    """
+    启动时恢复未完成的视频生成
+    
+    为已创建Runway任务但没有待执行或执行中任务的视频生成记录重新入队，
+    处理函数会直接恢复轮询，不会重新上传图片和创建Runway任务
+    """
+    generations = (VideoGeneration
+                   .select(VideoGeneration, Task)
+                   .join(Task, on=(VideoGeneration.task == Task.id))
+                   .where(
+                       (VideoGeneration.status == 1) &
+                       (VideoGeneration.runway_task_id.is_null(False)) &
+                       (Task.status == 1)
+                   ))
+    count = 0
+    for generation in generations:
+        job_key = f"generate_video:{generation.task_id}:{generation.type}"
+        if job_queue.has_active_job(job_key):
+            continue
+        job_queue.enqueue(
+            "generate_video_task",
+            (generation.task.user_id, generation.task_id, generation.type, generation.user_prompt, None, []),
+            owner_id=generation.task.user_id,
+            job_key=job_key
+        )
+        count += 1
+    logger.info(f"恢复 {count} 个未完成的视频生成任务")
+
 @router.post("/generate_video", response_model=GenerateVideoLimitResponse)
 async def generate_video(
     person_prompt: str = Form(...),
@@ -818,6 +801,16 @@ async def generate_video(
             count=count
         )
     
+    # 积压任务过多时快速返回，避免请求堆积
+    try:
+        job_queue.check_admission(2)
+    except PoolSaturatedError as e:
+        raise HTTPException(
+            status_code=503,
+            detail={"message": "当前生成任务过多，请稍后重试", "queue_depth": e.queue_depth, "retry_after": e.retry_after},
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     # 创建任务记录
     task = Task.create(
         user_id=user_id,
@@ -844,26 +837,22 @@ async def generate_video(
     # 裁剪产品照片
     product_photo_path = pad_image(product_photo_path, 'vertical')
     
-    global_thread_pool.submit(
-        generate_video_task,
-        user_id,
-        task.id,
-        0,
-        person_prompt,
-        person_photo_path,
-        person_categories
+    # 写入持久化队列，按用户公平调度，权重取决于用户的卡密类型
+    weight = get_user_schedule_weight(user_id)
+    job_queue.enqueue(
+        "generate_video_task",
+        (user_id, task.id, 0, person_prompt, person_photo_path, person_categories),
+        owner_id=user_id,
+        weight=weight,
+        job_key=f"generate_video:{task.id}:0"
     )
-    
-    global_thread_pool.submit(
-        generate_video_task,
-        user_id,
-        task.id,
-        1,
-        product_prompt,
-        product_photo_path,
-        product_categories
+    job_queue.enqueue(
+        "generate_video_task",
+        (user_id, task.id, 1, product_prompt, product_photo_path, product_categories),
+        owner_id=user_id,
+        weight=weight,
+        job_key=f"generate_video:{task.id}:1"
     )
-    
 
     return GenerateVideoLimitResponse(
         status="processing",
@@ -7,6 +7,8 @@ from base.security import create_user_token
 from fastapi import Request
 from base.security import UserContext
 from fastapi import Depends
+from base.config import SCHEDULE_WEIGHTS
+from routers.admin.carmine import CARMINE_TYPES
 router = APIRouter()
 
 class LoginResponse(BaseModel):
@@ -153,3 +155,32 @@ async def heartbeat(user_ctx: UserContext = Depends(UserContext)):
         username=user_ctx.user.username,
         expires_at=valid_carmine.expired_at
     )
+
+
+def get_user_schedule_weight(user_id: int) -> float:
+    """
+    根据用户当前有效卡密的类型获取公平调度权重
+    
+    Args:
+        user_id: 用户ID
+        
+    Returns:
+        float: 调度权重，查询不到有效卡密时返回1
+    """
+    now = datetime.now()
+    try:
+        carmine = UserCarmine.select().where(
+            (UserCarmine.user_id == user_id) & 
+            (UserCarmine.activated_at.is_null(False)) & 
+            ((UserCarmine.expired_at > now) | (UserCarmine.expired_at.is_null()))
+        ).order_by(UserCarmine.duration.desc()).get()
+    except UserCarmine.DoesNotExist:
+        return 1.0
+    except Exception as e:
+        logger.error(f"查询用户调度权重失败: user_id={user_id}, error={str(e)}")
+        return 1.0
+    
+    for key, value in CARMINE_TYPES.items():
+        if value["days"] == carmine.duration:
+            return SCHEDULE_WEIGHTS.get(key, 1.0)
+    return 1.0
@@ -6,6 +6,7 @@ from base.security import UserContext
 from models import Task, VideoGeneration, User
 from loguru import logger
 from peewee import JOIN, fn, DoesNotExist
+from routers.generate_video import cancel_video_task
 
 
 class VideoResponse(BaseModel):
@@ -154,6 +155,10 @@ async def delete_video(
         task.status = 4
         task.save()
         
+        # 停止仍在进行的生成，取消Runway任务并立即释放账号
+        if cancel_video_task(task_id):
+            logger.info(f"已取消进行中的视频生成，任务ID: {task_id}")
+        
         return DeleteVideoResponse(
             success=True,
             message="视频删除成功"
@@ -5,6 +5,8 @@ CREATE TABLE IF NOT EXISTS runway_account (
     as_team_id VARCHAR(255) NOT NULL,
     token VARCHAR(255) NOT NULL,
     plan_expires TIMESTAMP,
+    max_concurrency INT NOT NULL DEFAULT 2 COMMENT '最大并发数',
+    daily_quota INT COMMENT '每日生成上限，为空时使用默认值，0为不限',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -13,6 +15,7 @@ CREATE TABLE IF NOT EXISTS runway_session (
     id INT AUTO_INCREMENT PRIMARY KEY,
     runway_id INT NOT NULL,
     session_id VARCHAR(255) NOT NULL,
+    asset_group_id VARCHAR(255) COMMENT '会话的assetGroupId缓存',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (runway_id) REFERENCES runway_account(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -48,7 +51,7 @@ CREATE TABLE IF NOT EXISTS user_carmine (
 CREATE TABLE IF NOT EXISTS task (
     id INT AUTO_INCREMENT PRIMARY KEY,
     user_id INT NOT NULL,
-    status TINYINT NOT NULL DEFAULT 0 COMMENT '0-排队中,1-生成中,2-完成',
+    status TINYINT NOT NULL DEFAULT 0 COMMENT '0-排队中,1-生成中,2-完成,3-失败,4-已删除',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES user(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -62,8 +65,10 @@ CREATE TABLE IF NOT EXISTS video_generation (
     category VARCHAR(255) COMMENT '分类',
     image_url VARCHAR(1024) NOT NULL COMMENT '输入图片URL',
     video_url VARCHAR(1024) COMMENT '生成视频URL',
-    runway_id VARCHAR(255) COMMENT 'Runway任务ID',
+    runway_id VARCHAR(255) COMMENT 'Runway账号ID',
     session_id VARCHAR(255) COMMENT 'Runway会话ID',
+    runway_task_id VARCHAR(255) COMMENT 'Runway任务ID',
+    status TINYINT NOT NULL DEFAULT 2 COMMENT '状态:1-生成中,2-完成,3-失败,4-已取消',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (task_id) REFERENCES task(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -100,10 +105,38 @@ CREATE TABLE IF NOT EXISTS ai_video (
     seed BIGINT NOT NULL COMMENT '随机种子',
     image_url VARCHAR(1024) COMMENT '输入图片URL',
     video_url VARCHAR(1024) COMMENT '生成视频URL',
-    status TINYINT NOT NULL DEFAULT 0 COMMENT '状态:0-排队中,1-生成中,2-完成,3-失败',
+    status TINYINT NOT NULL DEFAULT 0 COMMENT '状态:0-排队中,1-生成中,2-完成,3-失败,4-已取消',
     is_deleted TINYINT NOT NULL DEFAULT 0 COMMENT '是否删除:0-否,1-是',
-    runway_id VARCHAR(255) COMMENT 'Runway任务ID',
+    runway_id VARCHAR(255) COMMENT 'Runway账号ID',
+    runway_task_id VARCHAR(255) COMMENT 'Runway任务ID',
+    session_id VARCHAR(255) COMMENT 'Runway会话ID',
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
     FOREIGN KEY (user_id) REFERENCES user(id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='AI视频生成记录表';
+
+CREATE TABLE IF NOT EXISTS job_queue (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    job_type VARCHAR(64) NOT NULL COMMENT '任务类型',
+    payload TEXT NOT NULL COMMENT '任务参数(JSON)',
+    owner_id INT COMMENT '任务归属用户ID',
+    weight FLOAT NOT NULL DEFAULT 1 COMMENT '公平调度权重',
+    status TINYINT NOT NULL DEFAULT 0 COMMENT '状态:0-待执行,1-执行中,2-完成,3-失败,4-已取消',
+    attempts INT NOT NULL DEFAULT 0 COMMENT '已领取次数',
+    lease_owner VARCHAR(64) COMMENT '租约持有进程',
+    lease_expires_at DATETIME COMMENT '租约过期时间',
+    error TEXT COMMENT '失败原因',
+    job_key VARCHAR(128) COMMENT '业务键，用于按业务记录查找任务',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+    INDEX idx_status_id (status, id),
+    INDEX idx_status_lease (status, lease_expires_at),
+    INDEX idx_job_key (job_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='持久化任务队列';
+
+CREATE TABLE IF NOT EXISTS account_instance_lease (
+    instance_key VARCHAR(64) NOT NULL PRIMARY KEY COMMENT '账号实例键(账号ID_实例ID)',
+    owner VARCHAR(128) NOT NULL COMMENT '持有者(进程标识/租约ID)',
+    expires_at DATETIME NOT NULL COMMENT '租约过期时间',
+    INDEX idx_expires_at (expires_at)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='账号实例跨进程租约';
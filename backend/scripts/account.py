@@ -3,6 +3,9 @@ from typing import Optional
 from pydantic import BaseModel
 from datetime import datetime
 
+# 复用keep-alive连接的会话，避免每次请求重新握手
+http_session = requests.Session()
+
 class LoginRequest(BaseModel):
     username: str
     password: str
@@ -46,7 +49,7 @@ def login(username: str, password: str) -> str:
     )
     
     try:
-        response = requests.post(url, json=payload.dict())
+        response = http_session.post(url, json=payload.dict())
         response.raise_for_status()  # 如果响应状态码不是 200，抛出异常
         
         login_response = LoginResponse(**response.json())
@@ -76,7 +79,7 @@ def get_user_profile(token: str) -> UserProfile:
     }
     
     try:
-        response = requests.get(url, headers=headers)
+        response = http_session.get(url, headers=headers)
         response.raise_for_status()
         
         data = response.json()
@@ -118,7 +121,7 @@ def create_session(token: str, team_id: int) -> str:
     }
     
     try:
-        response = requests.post(url, headers=headers, json=payload)
+        response = http_session.post(url, headers=headers, json=payload)
         response.raise_for_status()
         
         data = response.json()
@@ -0,0 +1,114 @@
+"""
+账号池微基准测试
+
+用不同规模的模拟账号填充账号池，测量各操作的单次耗时。
+默认策略(fifo)下各操作耗时不随账号数量增长，说明账号池的分配、释放、移除和统计都是常数时间；
+按得分选择的策略每次分配都要遍历可用账号，分配耗时随账号数量线性增长。
+
+在 backend 目录下运行（需要能连接数据库以完成账号池的初始化），不指定策略时测量账号池当前使用的策略：
+    python scripts/bench_account_pool.py
+    python scripts/bench_account_pool.py fifo balanced
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loguru import logger
+from utils.account_pool import account_pool
+
+SIZES = [100, 1000, 10000]  # 模拟账号数量
+ROUNDS = 20000  # 每项操作的最多执行次数
+BUDGET = 2.0  # 每项操作的最长计时（秒），耗时随账号数量增长的策略达到后提前结束
+
+
+def make_accounts(count: int):
+    """生成模拟账号"""
+    return [
+        {
+            'id': account_id,
+            'username': f"bench_{account_id}",
+            'password': "",
+            'as_team_id': "",
+            'token': "",
+            'plan_expires': None
+        }
+        for account_id in range(1, count + 1)
+    ]
+
+
+def reset_pool(count: int):
+    """用模拟账号重建账号池，并保证测试期间不会触发数据库刷新"""
+    with account_pool._lock:
+        for key in list(account_pool._in_use_accounts):
+            account_pool._unmark_in_use(key)
+        account_pool._index_accounts(make_accounts(count), shuffle=True)
+        account_pool._last_refresh_time = time.time()
+        account_pool._refresh_interval = 3600
+
+
+def measure(func, rounds: int = ROUNDS, budget: float = BUDGET) -> float:
+    """最多执行rounds次func，总耗时超过budget秒时提前结束，返回单次耗时（微秒）"""
+    start = time.perf_counter()
+    done = 0
+    while done < rounds:
+        func()
+        done += 1
+        if done % 100 == 0 and time.perf_counter() - start > budget:
+            break
+    return (time.perf_counter() - start) / done * 1_000_000
+
+
+def bench(count: int) -> dict:
+    """在count个账号的规模下测量各操作耗时"""
+    reset_pool(count)
+    # 先占用一半实例，使释放和移除操作面对较大的使用中集合
+    held = [account_pool.get_account() for _ in range(len(account_pool._available_accounts) // 2)]
+
+    def acquire_release():
+        lease = account_pool.get_account()
+        account_pool.release_account(lease)
+
+    def acquire_release_by_id():
+        lease = account_pool.get_account_by_id(random.randint(1, count))
+        if lease:
+            account_pool.release_account(lease)
+
+    result = {
+        "get+release": measure(acquire_release),
+        "get_by_id+release": measure(acquire_release_by_id),
+        "get_stats": measure(account_pool.get_stats),
+    }
+
+    # 移除操作不可重复执行，单独计时
+    victims = random.sample(range(1, count + 1), min(count, 1000))
+    start = time.perf_counter()
+    for account_id in victims:
+        account_pool.remove_account(account_id, reason="基准测试")
+    result["remove_account"] = (time.perf_counter() - start) / len(victims) * 1_000_000
+
+    # 归还占用的实例，被移除账号的租约已失效，释放时会被忽略
+    for lease in held:
+        if lease:
+            account_pool.release_account(lease)
+    return result
+
+
+def main():
+    logger.remove()  # 关闭账号池的调试日志，避免影响计时
+    strategies = sys.argv[1:] or [account_pool._strategy.name]
+    for strategy in strategies:
+        account_pool.set_strategy(strategy)
+        rows = {size: bench(size) for size in SIZES}
+        operations = list(next(iter(rows.values())).keys())
+
+        print(f"\n选择策略: {strategy}")
+        print(f"{'操作':<20}" + "".join(f"{f'{size}个账号':>14}" for size in SIZES))
+        for operation in operations:
+            print(f"{operation:<20}" + "".join(f"{rows[size][operation]:>12.2f}us" for size in SIZES))
+
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,8 @@ class VideoGenerator:
         }
         if team_id:
             self.headers["Team-ID"] = team_id
+        # 复用keep-alive连接的会话，避免每次请求重新握手
+        self.session = requests.Session()
 
     def generate_video(self, params: Dict) -> Optional[str]:
         """
@@ -37,7 +39,7 @@ class VideoGenerator:
             str: 视频任务ID，如果失败则返回None
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/generate",
                 headers=self.headers,
                 json=params
@@ -59,7 +61,7 @@ class VideoGenerator:
             Dict: 包含状态信息的字典
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/status/{task_id}",
                 headers=self.headers
             )
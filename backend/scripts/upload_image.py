@@ -10,6 +10,9 @@ from PIL import Image
 # API基础URL
 API_BASE_URL = "https://api.runwayml.com/v1"
 
+# 复用keep-alive连接的会话，避免每次请求重新握手
+http_session = requests.Session()
+
 # 请求头常量
 HEADERS = {
     "Origin": "https://app.runwayml.com",
@@ -66,7 +69,7 @@ def init_upload(filename: str) -> Optional[Dict]:
             "type": "DATASET"
         }
         
-        response = requests.post(
+        response = http_session.post(
             f"{API_BASE_URL}/uploads",
             headers=headers,
             json=payload
@@ -112,7 +115,7 @@ def upload_file_to_url(file_path: str, upload_url: str) -> Optional[str]:
         headers["Content-Length"] = str(file_size)
         
         with open(file_path, 'rb') as f:
-            response = requests.put(upload_url, data=f, headers=headers)
+            response = http_session.put(upload_url, data=f, headers=headers)
             response.raise_for_status()
             
             etag = response.headers.get('ETag')
@@ -151,7 +154,7 @@ def complete_upload(upload_id: str, etag: str) -> Optional[str]:
             ]
         }
         
-        response = requests.post(
+        response = http_session.post(
             f"{API_BASE_URL}/uploads/{upload_id}/complete",
             headers=headers,
             json=payload
@@ -8,6 +8,9 @@ from config import RUNWAY_TOKEN, USER_AGENT, SESSION_ID, AS_TEAM_ID
 # API基础URL
 API_BASE_URL = "https://api.runwayml.com/v1"
 
+# 复用keep-alive连接的会话，避免每次请求重新握手
+http_session = requests.Session()
+
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -69,7 +72,7 @@ def create_video_task(
             "sessionId": SESSION_ID
         }
         
-        response = requests.post(
+        response = http_session.post(
             f"{API_BASE_URL}/tasks",
             headers=headers,
             json=payload
@@ -107,7 +110,7 @@ def get_asset_group_id(session_id: str, team_id: int) -> Optional[str]:
             "User-Agent": USER_AGENT
         }
         
-        response = requests.get(
+        response = http_session.get(
             f"https://api.runwayml.com/v1/sessions/{session_id}",
             headers=headers,
             params={"asTeamId": team_id}
@@ -167,7 +170,7 @@ def get_task_detail(task_id: str) -> Optional[Dict]:
             "User-Agent": USER_AGENT
         }
         
-        response = requests.get(
+        response = http_session.get(
             f"{API_BASE_URL}/tasks/{task_id}",
             headers=headers,
             params={"asTeamId": AS_TEAM_ID}
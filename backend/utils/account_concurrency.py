@@ -0,0 +1,121 @@
+import time
+from typing import Dict, Optional
+from loguru import logger
+
+
+class ConcurrencyLimit:
+    """单个账号的并发上限"""
+    def __init__(self, max_limit: int):
+        """
+        Args:
+            max_limit: 账号配置的最大并发数
+        """
+        self.max_limit = max_limit
+        self.value = float(max_limit)  # 当前上限，按整数部分生效
+        self.last_decrease = 0.0
+
+    @property
+    def limit(self) -> int:
+        return max(1, min(self.max_limit, int(self.value)))
+
+
+class AdaptiveConcurrency:
+    """
+    按账号自动调整的并发上限（AIMD）
+
+    账号从配置的最大并发数开始分配；任务被Runway限流(THROTTLED/429)或排队过久时上限减半，
+    排队时间正常时每完成一个任务上限增加1/上限，约每轮满载增加1，直到回到配置的最大并发数。
+    本类不加锁，由账号池在持有锁时调用。
+    """
+    def __init__(self, target_queue_seconds: float = 60.0, decrease: float = 0.5, cooldown: float = 30.0):
+        """
+        Args:
+            target_queue_seconds: 任务从创建到开始运行的目标排队时间（秒），超过视为账号饱和
+            decrease: 饱和时上限的缩减系数
+            cooldown: 两次缩减的最小间隔（秒），避免同一批任务的限流反复减半
+        """
+        self.target_queue_seconds = target_queue_seconds
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._limits: Dict[int, ConcurrencyLimit] = {}
+
+    def configure(self, account_id: int, max_limit: int) -> int:
+        """
+        设置账号的最大并发数，新账号从最大并发数开始
+
+        Args:
+            account_id: 账号ID
+            max_limit: 最大并发数
+
+        Returns:
+            int: 账号当前的并发上限
+        """
+        max_limit = max(1, int(max_limit))
+        state = self._limits.get(account_id)
+        if state is None:
+            state = self._limits[account_id] = ConcurrencyLimit(max_limit)
+        elif state.max_limit != max_limit:
+            # 调高最大并发数时当前上限同步调高，调低时截断到新的最大值
+            state.value = min(max_limit, state.value + max(0, max_limit - state.max_limit))
+            state.max_limit = max_limit
+        return state.limit
+
+    def limit(self, account_id: int) -> int:
+        """账号当前的并发上限，未配置的账号返回0"""
+        state = self._limits.get(account_id)
+        return state.limit if state else 0
+
+    def forget(self, account_id: int):
+        """移除账号的并发状态"""
+        self._limits.pop(account_id, None)
+
+    def on_throttle(self, account_id: int) -> Optional[int]:
+        """
+        账号被限流，并发上限减半
+
+        Returns:
+            int | None: 上限发生变化时返回新上限
+        """
+        state = self._limits.get(account_id)
+        if state is None:
+            return None
+        now = time.time()
+        if now - state.last_decrease < self.cooldown:
+            return None
+        old = state.limit
+        state.value = max(1.0, state.value * self.decrease)
+        state.last_decrease = now
+        if state.limit != old:
+            logger.info(f"账号 ID: {account_id} 被限流，并发上限 {old} -> {state.limit}")
+            return state.limit
+        return None
+
+    def on_queue_time(self, account_id: int, seconds: float) -> Optional[int]:
+        """
+        上报任务在Runway的排队时间，排队过久视为饱和，否则增加并发上限
+
+        Args:
+            account_id: 账号ID
+            seconds: 任务从创建到开始运行的时间（秒）
+
+        Returns:
+            int | None: 上限发生变化时返回新上限
+        """
+        if seconds > self.target_queue_seconds:
+            return self.on_throttle(account_id)
+        state = self._limits.get(account_id)
+        if state is None:
+            return None
+        old = state.limit
+        state.value = min(float(state.max_limit), state.value + 1 / state.limit)
+        if state.limit != old:
+            logger.info(f"账号 ID: {account_id} 排队正常，并发上限 {old} -> {state.limit}")
+            return state.limit
+        return None
+
+    def snapshot(self) -> Dict[int, dict]:
+        """导出各账号的并发上限"""
+        return {
+            account_id: {"limit": state.limit, "max_limit": state.max_limit}
+            for account_id, state in self._limits.items()
+        }
@@ -0,0 +1,153 @@
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict
+from loguru import logger
+from peewee import IntegrityError
+from models import AccountInstanceLease
+
+
+class CoordinationBackend:
+    """
+    账号实例的跨进程协调后端
+
+    账号池在本进程分配实例后，还需要向协调后端申领同一实例，申领成功才能使用，
+    保证多个进程（多个uvicorn worker或多个容器）不会同时使用同一个账号实例。
+    默认的本地后端只有一个进程，申领总是成功。
+    """
+    name = "local"
+    is_local = True
+
+    def try_acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        申领实例
+
+        Args:
+            key: 账号实例键
+            owner: 持有者标识，每个租约唯一
+            ttl: 租约时长（秒），持有进程退出后最迟在ttl后被其他进程申领
+
+        Returns:
+            bool: 是否申领成功，实例被其他持有者占用时返回False
+        """
+        return True
+
+    def renew(self, key: str, owner: str, ttl: float) -> bool:
+        """续约，实例已被释放但仍空闲时重新申领"""
+        return self.try_acquire(key, owner, ttl)
+
+    def release(self, key: str, owner: str):
+        """释放实例，只释放owner持有的租约"""
+
+
+class MySQLBackend(CoordinationBackend):
+    """
+    基于MySQL行租约的协调后端
+
+    每个被占用的实例在 account_instance_lease 表中有一行，过期的行可以被其他持有者接管。
+    """
+    name = "mysql"
+    is_local = False
+
+    def try_acquire(self, key, owner, ttl):
+        now = datetime.now()
+        expires_at = now + timedelta(seconds=ttl)
+        try:
+            # 接管过期的租约或续约自己的租约
+            updated = (AccountInstanceLease
+                       .update(owner=owner, expires_at=expires_at)
+                       .where((AccountInstanceLease.instance_key == key) &
+                              ((AccountInstanceLease.expires_at < now) | (AccountInstanceLease.owner == owner)))
+                       .execute())
+            if updated:
+                return True
+            try:
+                AccountInstanceLease.insert(instance_key=key, owner=owner, expires_at=expires_at).execute()
+                return True
+            except IntegrityError:
+                # 行已存在：被其他持有者占用，或者是自己的租约但更新没有改变任何值
+                row = AccountInstanceLease.get_or_none(AccountInstanceLease.instance_key == key)
+                return row is not None and row.owner == owner
+        except Exception as e:
+            logger.error(f"申领账号实例 {key} 失败: {str(e)}")
+            return False
+
+    def release(self, key, owner):
+        try:
+            (AccountInstanceLease
+             .delete()
+             .where((AccountInstanceLease.instance_key == key) & (AccountInstanceLease.owner == owner))
+             .execute())
+        except Exception as e:
+            # 释放失败时租约会在过期后被其他进程接管
+            logger.error(f"释放账号实例 {key} 失败: {str(e)}")
+
+
+class FileLockBackend(CoordinationBackend):
+    """
+    基于文件锁的协调后端，用于单机多进程的本地测试
+
+    每个实例对应目录下的一个锁文件，持有期间保持非阻塞的排他flock，进程退出时由操作系统自动释放，
+    因此不需要过期时间。
+    """
+    name = "file"
+    is_local = False
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: 锁文件目录，需要协调的进程使用同一目录
+        """
+        import fcntl
+        self._fcntl = fcntl
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._held: Dict[str, tuple] = {}  # 实例键 -> (持有者, 文件描述符)
+
+    def try_acquire(self, key, owner, ttl):
+        with self._lock:
+            held = self._held.get(key)
+            if held:
+                return held[0] == owner
+            fd = os.open(os.path.join(self.directory, f"{key}.lock"), os.O_CREAT | os.O_RDWR)
+            try:
+                self._fcntl.flock(fd, self._fcntl.LOCK_EX | self._fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._held[key] = (owner, fd)
+            return True
+
+    def release(self, key, owner):
+        with self._lock:
+            held = self._held.get(key)
+            if not held or held[0] != owner:
+                return
+            del self._held[key]
+            self._fcntl.flock(held[1], self._fcntl.LOCK_UN)
+            os.close(held[1])
+
+
+def create_backend(name: str) -> CoordinationBackend:
+    """
+    按名称创建协调后端，未知名称时退回本地后端
+
+    Args:
+        name: local/mysql/file，file后端的锁文件目录由环境变量ACCOUNT_LOCK_DIR指定
+    """
+    if name == "mysql":
+        return MySQLBackend()
+    if name == "file":
+        return FileLockBackend(os.getenv("ACCOUNT_LOCK_DIR", os.path.join(tempfile.gettempdir(), "account_locks")))
+    if name != "local":
+        logger.warning(f"未知的账号协调后端: {name}，使用local")
+    return CoordinationBackend()
+
+
+def process_id() -> str:
+    """当前进程的标识，作为租约持有者的前缀"""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+import requests
+from loguru import logger
+from models import RunwayAccount
+from utils.account_pool import account_pool
+from routers.admin.runway_account import runway_login, get_runway_user_info
+
+HEALTHY = "healthy"  # token有效
+RELOGGED = "relogged"  # token失效，已重新登录
+FAILED = "failed"  # 重新登录失败
+UNREACHABLE = "unreachable"  # 网络错误、5xx或429等暂时性错误，无法判断token是否有效，下轮重试
+
+
+def is_auth_failure(error: Exception) -> bool:
+    """
+    Runway是否明确拒绝了凭据
+
+    只有401/403（登录时还包括400）才说明token或账号密码无效；网络错误、超时、5xx和429
+    都是暂时性错误，不能据此重新登录或移出账号池。
+    """
+    cause = error.__cause__ or error
+    response = getattr(cause, 'response', None)
+    return isinstance(cause, requests.HTTPError) and response is not None and response.status_code in (400, 401, 403)
+
+
+class AccountHealthChecker:
+    """
+    Runway账号健康检查
+
+    后台定期并发探测每个账号的token（获取用户资料），Runway明确拒绝token时用保存的账号密码重新登录，
+    更新数据库中的token并把账号重新加入账号池。探测或登录遇到暂时性错误时不做处理，下一轮再检查。
+    生成过程中遇到401时也可以立即触发单个账号的检查。
+    """
+    def __init__(self, interval: float = 600, max_workers: int = 8):
+        """
+        Args:
+            interval: 两轮全量检查的间隔（秒）
+            max_workers: 并发探测的线程数
+        """
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="AccountHealth")
+        self._lock = threading.Lock()
+        self._results: Dict[int, Dict[str, Any]] = {}  # 账号ID -> 最近一次检查结果
+        self._checking: Set[int] = set()  # 正在检查的账号ID，避免重复检查
+        self._relogin_count = 0
+        self._failed_count = 0
+        self._unreachable_count = 0
+        self._last_round_at: Optional[float] = None
+        self._started = False
+
+    def start(self):
+        """启动后台检查线程"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="AccountHealthChecker", daemon=True).start()
+        logger.info(f"账号健康检查已启动，间隔: {self.interval} 秒")
+
+    def _run(self):
+        """后台线程主循环，定期检查全部账号"""
+        while True:
+            try:
+                self.check_all()
+            except Exception as e:
+                logger.error(f"账号健康检查失败: {str(e)}")
+            time.sleep(self.interval)
+
+    def check_all(self) -> int:
+        """
+        并发检查数据库中的全部账号，包括已被移出账号池的账号
+
+        Returns:
+            int: 本轮检查的账号数
+        """
+        accounts = list(RunwayAccount.select().dicts())
+        futures = [future for future in map(self._submit, accounts) if future]
+        for future in futures:
+            future.result()
+        self._last_round_at = time.time()
+        logger.info(f"账号健康检查完成，共检查 {len(futures)} 个账号")
+        return len(futures)
+
+    def report_unauthorized(self, account_id: int):
+        """
+        上报账号返回401，立即在后台检查该账号
+
+        Args:
+            account_id: 账号ID
+        """
+        self._executor.submit(self._check_by_id, account_id)
+
+    def _check_by_id(self, account_id: int):
+        """查询账号后提交检查"""
+        try:
+            account = RunwayAccount.select().where(RunwayAccount.id == account_id).dicts().get_or_none()
+        except Exception as e:
+            logger.error(f"查询账号 ID: {account_id} 失败: {str(e)}")
+            return
+        if account:
+            self._submit(account)
+
+    def _submit(self, account: Dict[str, Any]):
+        """提交单个账号的检查，账号正在检查时跳过"""
+        with self._lock:
+            if account['id'] in self._checking:
+                return None
+            self._checking.add(account['id'])
+        return self._executor.submit(self._check, account)
+
+    def _check(self, account: Dict[str, Any]):
+        """检查单个账号的token，失效时重新登录"""
+        account_id = account['id']
+        started_at = time.time()
+        try:
+            status, error = self._probe(account)
+        except Exception as e:
+            logger.error(f"账号 ID: {account_id} 健康检查出错: {str(e)}")
+            status, error = FAILED, str(e)
+        finally:
+            with self._lock:
+                self._checking.discard(account_id)
+        with self._lock:
+            previous = self._results.get(account_id, {})
+            self._results[account_id] = {
+                "username": account['username'],
+                "status": status,
+                "error": error,
+                "consecutive_failures": previous.get("consecutive_failures", 0) + 1 if status == FAILED else 0,
+                "elapsed_ms": round((time.time() - started_at) * 1000),
+                "checked_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            if status == RELOGGED:
+                self._relogin_count += 1
+            elif status == UNREACHABLE:
+                self._unreachable_count += 1
+            elif status == FAILED:
+                self._failed_count += 1
+
+    def _probe(self, account: Dict[str, Any]):
+        """
+        探测token，Runway明确拒绝时重新登录并重新加入账号池，暂时性错误留到下一轮重试
+
+        Returns:
+            tuple: (检查结果, 错误信息)
+        """
+        account_id = account['id']
+        try:
+            get_runway_user_info(account['token'])
+            # token有效但账号已被移出账号池（例如偶发的401），重新加入
+            if account_pool.is_removed(account_id):
+                account_pool.add_account(account_id)
+            return HEALTHY, None
+        except Exception as e:
+            if not is_auth_failure(e):
+                logger.warning(f"账号 ID: {account_id} token探测遇到暂时性错误，下轮重试: {str(e)}")
+                return UNREACHABLE, str(e)
+            logger.warning(f"账号 ID: {account_id} token已失效，尝试重新登录: {str(e)}")
+
+        try:
+            token = runway_login(account['username'], account['password'])
+        except Exception as e:
+            if not is_auth_failure(e):
+                logger.warning(f"账号 ID: {account_id} 重新登录遇到暂时性错误，下轮重试: {str(e)}")
+                return UNREACHABLE, str(e)
+            logger.error(f"账号 ID: {account_id} 重新登录失败: {str(e)}")
+            if not account_pool.is_removed(account_id):
+                account_pool.remove_account(account_id, reason=f"重新登录失败: {str(e)}")
+            return FAILED, str(e)
+        RunwayAccount.update(token=token).where(RunwayAccount.id == account_id).execute()
+
+        logger.info(f"账号 ID: {account_id} 重新登录成功，已更新token")
+        if account_pool.is_removed(account_id):
+            account_pool.add_account(account_id)
+        else:
+            account_pool.update_token(account_id, token)
+        return RELOGGED, None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取健康检查统计
+
+        Returns:
+            Dict[str, Any]: 包含各状态账号数、重新登录次数和各账号最近检查结果的字典
+        """
+        with self._lock:
+            results = {account_id: dict(result) for account_id, result in self._results.items()}
+            counts = {HEALTHY: 0, RELOGGED: 0, FAILED: 0, UNREACHABLE: 0}
+            for result in results.values():
+                counts[result["status"]] += 1
+            return {
+                "healthy": counts[HEALTHY],
+                "relogged": counts[RELOGGED],
+                "failed": counts[FAILED],
+                "unreachable": counts[UNREACHABLE],
+                "checking": len(self._checking),
+                "relogin_total": self._relogin_count,
+                "failed_total": self._failed_count,
+                "unreachable_total": self._unreachable_count,
+                "last_round_at": datetime.fromtimestamp(self._last_round_at).strftime("%Y-%m-%d %H:%M:%S") if self._last_round_at else None,
+                "accounts": results
+            }
+
+
+# 全局账号健康检查实例
+account_health = AccountHealthChecker(
+    interval=float(os.getenv("ACCOUNT_HEALTH_INTERVAL", "600")),
+    max_workers=int(os.getenv("ACCOUNT_HEALTH_WORKERS", "8"))
+)
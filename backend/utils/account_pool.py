@@ -3,10 +3,121 @@ import json
 import random
 import threading
 import time
-from typing import List, Optional, Dict, Any
+import asyncio
+import collections
+import math
+import uuid
+from typing import List, Optional, Dict, Any, Iterable
 from loguru import logger
-from models import RunwayAccount
-from datetime import datetime
+from models import RunwayAccount, RunwaySession
+from utils.account_strategy import AccountStatsRegistry, SelectionStrategy, create_strategy, days_until_expiry
+from utils.account_concurrency import AdaptiveConcurrency
+from utils.account_coordination import CoordinationBackend, create_backend, process_id
+from utils.account_quota import DailyQuota, load_daily_counts
+from datetime import date, datetime
+
+class AccountLease:
+    """
+    账号实例的租约
+    
+    持有者需在过期前续约（协程中可调用start_heartbeat自动续约），过期未续约的租约会被账号池回收并记录为泄漏。
+    租约可以像账号字典一样读取字段，lease['token'] 等价于 lease.account['token']。
+    """
+    def __init__(self, pool: "AccountPool", account: Dict[str, Any], ttl: float, holder: Optional[str] = None):
+        self._pool = pool
+        self.account = account
+        self.lease_id = uuid.uuid4().hex
+        self.account_id = account['id']
+        self.instance_id = account['instance_id']
+        self.key = f"{self.account_id}_{self.instance_id}"
+        self.owner = f"{pool.process_id}/{self.lease_id}"  # 在协调后端中的持有者标识
+        self.ttl = ttl
+        self.holder = holder
+        self.acquired_at = time.time()
+        self.expires_at = self.acquired_at + ttl
+        self.active = True
+        self.lost = False  # 续约失败，实例可能已被回收或被其他进程接管
+    
+    def __getitem__(self, name: str) -> Any:
+        return self.account[name]
+    
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.account.get(name, default)
+    
+    def renew(self) -> bool:
+        """
+        续约
+        
+        Returns:
+            bool: 租约已被释放或回收时返回False
+        """
+        return self._pool.renew_lease(self)
+    
+    def release(self):
+        """释放租约，归还账号实例"""
+        self._pool.release_account(self)
+    
+    def start_heartbeat(self) -> bool:
+        """
+        在当前事件循环中每ttl/3秒自动续约，直到租约释放或当前asyncio任务结束
+        
+        Returns:
+            bool: 不在协程中调用时返回False，此时需要持有者自行调用renew续约
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        loop.create_task(self._heartbeat(asyncio.current_task()))
+        return True
+    
+    async def _heartbeat(self, owner: asyncio.Task):
+        while self.active:
+            await asyncio.sleep(self.ttl / 3)
+            # 持有者已结束却没有释放租约时停止续约，由账号池在租约过期后回收
+            if owner.done():
+                return
+            # 跨进程协调时续约需要访问数据库，放到线程中执行
+            try:
+                renewed = self.renew() if self._pool.coordinator.is_local else await asyncio.to_thread(self.renew)
+            except Exception as e:
+                # 协调后端暂时不可用，下个周期再续约，租约过期前恢复即可
+                logger.error(f"账号 ID: {self.account_id}, 实例ID: {self.instance_id} 续约失败: {str(e)}")
+                continue
+            if not renewed:
+                # 标记租约丢失，持有者在开始占用账号额度的操作（如创建Runway任务）前检查并重新获取账号
+                self.lost = True
+                logger.warning(f"账号 ID: {self.account_id}, 实例ID: {self.instance_id} 的租约已丢失，持有者: {self.holder}")
+                return
+
+class _Waiter:
+    """
+    等待账号的调用方
+    
+    释放账号时直接把实例交给最早的等待者并只唤醒它，等待者之间严格先进先出。
+    同步等待者使用Event，异步等待者使用所在事件循环的Future。
+    """
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None, ttl: Optional[float] = None,
+                 holder: Optional[str] = None):
+        self.lease: Optional[AccountLease] = None
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+        self.ttl = ttl
+        self.holder = holder
+        self.enqueued_at = time.time()
+    
+    def wake(self, lease: AccountLease):
+        """交付租约并唤醒等待者（调用方需持有账号池的锁）"""
+        self.lease = lease
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+    
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
 
 class AccountPool:
     """
@@ -27,16 +138,52 @@ class AccountPool:
             return
             
         self._lock = threading.RLock()  # 使用可重入锁
-        self._available_accounts: List[Dict[str, Any]] = []  # 可用账号列表
+        # 所有操作都基于下面的索引完成，不随账号数量线性扫描
+        self._available_accounts: "collections.OrderedDict[str, Dict[str, Any]]" = collections.OrderedDict()  # 可用账号实例，按先进先出分配，键为账号ID和实例ID的组合
         self._in_use_accounts: Dict[str, Dict[str, Any]] = {}  # 正在使用的账号，键为账号ID和实例ID的组合
+        self._available_by_account: Dict[int, Dict[str, None]] = {}  # 账号ID -> 可用实例键，没有可用实例的账号不在其中
+        self._in_use_by_account: Dict[int, Dict[str, None]] = {}  # 账号ID -> 使用中实例键，没有使用中实例的账号不在其中
+        self._instance_counts: Dict[int, int] = {}  # 账号ID -> 池中实例数（可用+使用中），用于统计唯一账号数
         self._removed_accounts: Dict[int, str] = {}  # 被移除的账号，键为账号ID，值为移除原因
         self._initialized = True
         self._refresh_interval = 60  # 刷新间隔，单位秒
         self._last_refresh_time = 0
-        self._instances_per_account = 2  # 每个账号的实例数量
+        self._default_concurrency = 2  # 账号未配置最大并发数时的默认值
+        self._concurrency = AdaptiveConcurrency()  # 各账号的并发上限，即池中实例数，按限流和排队时间自动调整
+        self._accounts: Dict[int, Dict[str, Any]] = {}  # 账号ID -> 数据库中的账号信息快照，只整体替换不原地修改
+        self._updated_watermark: Optional[datetime] = None  # 已刷新账号的最大updated_at
+        self._session_ids: Dict[int, str] = {}  # 账号ID -> 最新创建的会话ID，随实例一起返回
+        self._session_watermark = 0  # 已加载会话的最大ID，会话只增不改，按ID增量加载
+        self._quota = DailyQuota(int(os.getenv("ACCOUNT_DAILY_QUOTA", "0")))  # 各账号当天的生成数和每日上限
+        self._eligibility_interval = 60  # 检查跨天和套餐到期的间隔，单位秒
+        self._last_eligibility_check = time.time()
+        self._waiters = collections.deque()  # 等待账号的调用方，先进先出
+        self._wait_times = collections.deque(maxlen=1000)  # 最近的等待耗时（秒）
+        self._acquired_count = 0
+        self._wait_timeout_count = 0
+        self._leases: Dict[str, AccountLease] = {}  # 使用中实例键 -> 当前有效的租约
+        self._lease_ttl = 300  # 默认租约时长，单位秒
+        self._reap_interval = 5  # 检查过期租约的间隔，单位秒
+        self._leaked_count = 0
+        self._leaks = collections.deque(maxlen=50)  # 最近被回收的过期租约
+        self.account_stats = AccountStatsRegistry()  # 各账号的生成耗时和限流情况，由生成流程上报
+        # 默认先进先出，按得分选择的策略每次分配都要遍历所有可用账号，账号较多时分配变慢
+        self._strategy = create_strategy(os.getenv("ACCOUNT_SELECTION_STRATEGY", "fifo"))
+        # 多进程部署时通过协调后端保证同一实例只被一个进程使用
+        self.coordinator: CoordinationBackend = create_backend(os.getenv("ACCOUNT_COORDINATION", "local"))
+        self.process_id = process_id()
+        self._parked: Dict[str, tuple] = {}  # 被其他进程占用的实例键 -> (实例, 恢复分配的时间)
+        self._park_seconds = 10  # 被其他进程占用的实例暂停分配的时间，单位秒
+        self._claim_attempts = 3  # get_account遇到被其他进程占用的实例时的尝试次数
+        self._claim_conflicts = 0
 
         # 从数据库加载账号
         self._load_accounts()
+        
+        # 后台回收过期未续约的租约
+        threading.Thread(target=self._reap_loop, name="AccountLeaseReaper", daemon=True).start()
+        # 后台增量刷新账号
+        threading.Thread(target=self._refresh_loop, name="AccountPoolRefresher", daemon=True).start()
 
     @classmethod
     def initialize(cls):
@@ -50,134 +197,693 @@ class AccountPool:
             if self._initialized:
                 return
             
-            self._refresh_accounts()
+            self._load_accounts()
             self._initialized = True
             logger.info(f"账号池初始化完成，共加载 {len(self._available_accounts)} 个账号实例")
+
+    @staticmethod
+    def _instance_key(account: Dict[str, Any]) -> str:
+        """账号实例的唯一键"""
+        return f"{account['id']}_{account['instance_id']}"
+
+    def _count_instance(self, account_id: int, delta: int):
+        """维护账号在池中的实例数（调用方需持有锁）"""
+        count = self._instance_counts.get(account_id, 0) + delta
+        if count > 0:
+            self._instance_counts[account_id] = count
+        else:
+            self._instance_counts.pop(account_id, None)
+
+    def _push_available(self, account: Dict[str, Any]):
+        """将实例加入可用队列队尾（调用方需持有锁）"""
+        key = self._instance_key(account)
+        self._available_accounts[key] = account
+        self._available_by_account.setdefault(account['id'], {})[key] = None
+        self._count_instance(account['id'], 1)
+
+    def _pop_available(self, key: Optional[str] = None) -> Dict[str, Any]:
+        """从可用队列取出实例，未指定键时取队首（调用方需持有锁）"""
+        if key is None:
+            key, account = self._available_accounts.popitem(last=False)
+        else:
+            account = self._available_accounts.pop(key)
+        keys = self._available_by_account[account['id']]
+        del keys[key]
+        if not keys:
+            del self._available_by_account[account['id']]
+        self._count_instance(account['id'], -1)
+        return account
+
+    def _mark_in_use(self, account: Dict[str, Any]):
+        """将实例标记为使用中（调用方需持有锁）"""
+        key = self._instance_key(account)
+        self._in_use_accounts[key] = account
+        self._in_use_by_account.setdefault(account['id'], {})[key] = None
+        self._count_instance(account['id'], 1)
+
+    def _unmark_in_use(self, key: str) -> Dict[str, Any]:
+        """取消实例的使用中标记，实例上的租约随之失效（调用方需持有锁）"""
+        lease = self._leases.pop(key, None)
+        if lease:
+            lease.active = False
+        account = self._in_use_accounts.pop(key)
+        keys = self._in_use_by_account[account['id']]
+        del keys[key]
+        if not keys:
+            del self._in_use_by_account[account['id']]
+        self._count_instance(account['id'], -1)
+        return account
+
+    def _configure_concurrency(self, account: Dict[str, Any]) -> int:
+        """按账号配置的最大并发数登记并发上限，返回当前上限（调用方需持有锁）"""
+        return self._concurrency.configure(account['id'], account.get('max_concurrency') or self._default_concurrency)
+
+    def _new_instance(self, account: Dict[str, Any], instance_id: int) -> Dict[str, Any]:
+        """创建账号实例"""
+        account_instance = account.copy()
+        account_instance['instance_id'] = instance_id
+        account_instance['session_id'] = self._session_ids.get(account['id'])
+        return account_instance
+
+    def _rebuild_available(self, account_id: int):
+        """按最新的账号信息和会话原地重建账号的可用实例，保持排队顺序（调用方需持有锁）"""
+        row = self._accounts.get(account_id)
+        if row is None:
+            return
+        for key in self._available_by_account.get(account_id, ()):
+            instance = self._available_accounts[key]
+            self._available_accounts[key] = self._new_instance(row, instance['instance_id'])
+
+    def _query_sessions(self, after_id: int) -> List[Dict[str, Any]]:
+        """查询ID大于after_id的会话，按ID升序"""
+        return list(RunwaySession
+                    .select(RunwaySession.id, RunwaySession.runway, RunwaySession.session_id)
+                    .where(RunwaySession.id > after_id)
+                    .order_by(RunwaySession.id)
+                    .dicts())
+
+    def _apply_sessions(self, sessions: List[Dict[str, Any]]):
+        """
+        合并新加载的会话，账号有多个会话时使用最新创建的（调用方需持有锁）
+        """
+        changed = set()
+        for session in sessions:
+            self._session_ids[session['runway']] = session['session_id']
+            self._session_watermark = max(self._session_watermark, session['id'])
+            changed.add(session['runway'])
+        for account_id in changed:
+            self._rebuild_available(account_id)
+
+    def _return_instance(self, account: Dict[str, Any]):
+        """
+        实例归还到可用队列（调用方需持有锁）
+        
+        按最新的账号信息重建实例，使用期间刷新的token等字段随之生效；
+        账号已不在账号池中、已到期或用完当天额度，或者实例超出账号当前并发上限时不再归还。
+        """
+        row = self._accounts.get(account['id'])
+        if row is not None and self._eligible(row) and account['instance_id'] < self._concurrency.limit(account['id']):
+            self._push_available(self._new_instance(row, account['instance_id']))
+
+    def _eligible(self, account: Dict[str, Any]) -> bool:
+        """账号套餐未到期且当天生成数未达每日上限（调用方需持有锁）"""
+        plan_expires = account.get('plan_expires')
+        if plan_expires and plan_expires <= datetime.now():
+            return False
+        return not self._quota.exhausted(account)
+
+    def _fill_instances(self, account_id: int):
+        """为可分配的账号补齐当前并发上限内缺少的可用实例（调用方需持有锁）"""
+        account = self._accounts.get(account_id)
+        if account is None or not self._eligible(account):
+            return
+        for instance_id in range(self._concurrency.limit(account_id)):
+            key = f"{account_id}_{instance_id}"
+            if key not in self._available_accounts and key not in self._in_use_accounts and key not in self._parked:
+                self._push_available(self._new_instance(account, instance_id))
+
+    def _clear_available(self, account_id: int):
+        """移除账号的全部可用实例，使用中的实例在释放时按_return_instance的规则处理（调用方需持有锁）"""
+        for key in list(self._available_by_account.get(account_id, ())):
+            self._pop_available(key)
+
+    def _apply_limit(self, account_id: int, old_limit: int, new_limit: int):
+        """
+        按新的并发上限增减账号的实例（调用方需持有锁）
+        
+        上限提高时补充可用实例；降低时移除超出上限的可用实例，使用中的实例在释放时不再归还。
+        """
+        if account_id not in self._accounts:
+            return
+        for instance_id in range(new_limit, old_limit):
+            key = f"{account_id}_{instance_id}"
+            if key in self._available_accounts:
+                self._pop_available(key)
+        self._fill_instances(account_id)
+        self._wake_waiters()
+
+    def _index_accounts(self, accounts: Iterable[Dict[str, Any]], shuffle: bool = False):
+        """
+        用数据库中的账号重建可用实例索引，使用中的实例保持不变（调用方需持有锁）
+        
+        Args:
+            accounts: 账号字典列表
+            shuffle: 是否打乱实例的分配顺序
+        """
+        instances = []
+        self._accounts = {account['id']: account for account in accounts}
+        for account in self._accounts.values():
+            limit = self._configure_concurrency(account)
+            # 已到期或用完当天额度的账号不分配
+            if not self._eligible(account):
+                continue
+            for instance_id in range(limit):
+                account_instance = self._new_instance(account, instance_id)
+                if self._instance_key(account_instance) not in self._in_use_accounts:
+                    instances.append(account_instance)
+        if shuffle:
+            random.shuffle(instances)
+        for key in list(self._available_accounts):
+            self._pop_available(key)
+        for account_instance in instances:
+            self._push_available(account_instance)
+        self._wake_waiters()
+
+    @staticmethod
+    def _max_updated_at(accounts: Iterable[Dict[str, Any]], current: Optional[datetime]) -> Optional[datetime]:
+        """账号最大的updated_at，作为下次增量刷新的起点"""
+        for account in accounts:
+            if account.get('updated_at') and (current is None or account['updated_at'] > current):
+                current = account['updated_at']
+        return current
+
     def _load_accounts(self):
-        """从数据库加载账号"""
+        """从数据库全量加载账号"""
+        try:
+            today = date.today()
+            counts = load_daily_counts(today)
+            with self._lock:
+                self._quota.seed(today, counts)
+        except Exception as e:
+            logger.error(f"统计账号当天生成数失败: {str(e)}")
         try:
-            # 获取所有账号
+            # 获取所有账号和会话，保留已经在使用的账号，其余实例随机打乱后放入可用队列
             accounts = list(RunwayAccount.select().dicts())
-            
-            # 更新可用账号列表，保留已经在使用的账号
-            in_use_keys = set(self._in_use_accounts.keys())
-            
-            # 清空可用账号列表
-            self._available_accounts = []
-            
-            # 创建所有可能的账号实例组合
-            all_instances = []
-            for account in accounts:
-                for instance_id in range(self._instances_per_account):
-                    account_instance = account.copy()
-                    account_instance['instance_id'] = instance_id
-                    account_key = f"{account['id']}_{instance_id}"
-                    if account_key not in in_use_keys:
-                        all_instances.append(account_instance)
-            
-            # 随机打乱所有实例的顺序
-            random.shuffle(all_instances)
-            
-            # 将打乱后的实例添加到可用列表
-            self._available_accounts = all_instances
-            
-            self._last_refresh_time = time.time()
-            logger.debug(f"账号池刷新完成，可用账号实例: {len(self._available_accounts)}，使用中账号实例: {len(self._in_use_accounts)}")
+            sessions = self._query_sessions(0)
+            with self._lock:
+                self._session_ids = {}
+                self._apply_sessions(sessions)
+                self._index_accounts(accounts, shuffle=True)
+                self._updated_watermark = self._max_updated_at(accounts, None)
+                self._last_refresh_time = time.time()
+                logger.debug(f"账号池加载完成，可用账号实例: {len(self._available_accounts)}，使用中账号实例: {len(self._in_use_accounts)}")
         except Exception as e:
-            logger.error(f"刷新账号池失败: {str(e)}")
-            self._available_accounts = []
+            logger.error(f"加载账号池失败: {str(e)}")
+            with self._lock:
+                for key in list(self._available_accounts):
+                    self._pop_available(key)
+
+    def _refresh_loop(self):
+        """后台线程主循环，按刷新间隔增量刷新账号"""
+        while True:
+            time.sleep(1)
+            try:
+                if time.time() - self._last_eligibility_check >= self._eligibility_interval:
+                    self._check_eligibility()
+                if time.time() - self._last_refresh_time < self._refresh_interval:
+                    continue
+                self._refresh_accounts()
+            except Exception as e:
+                logger.error(f"账号池后台刷新异常: {str(e)}")
+                # 等到下个刷新间隔再重试，避免每秒重复报错
+                self._last_refresh_time = time.time()
+
+    def _check_eligibility(self):
+        """跨天时恢复用完额度的账号，并停止分配套餐已到期的账号"""
+        with self._lock:
+            self._last_eligibility_check = time.time()
+            if self._quota.roll():
+                for account_id in self._accounts:
+                    self._fill_instances(account_id)
+            for account_id in list(self._available_by_account):
+                account = self._accounts.get(account_id)
+                if account is not None and not self._eligible(account):
+                    self._clear_available(account_id)
+                    logger.info(f"账号 ID: {account_id} 套餐已到期或用完当天额度，暂停分配")
+            self._wake_waiters()
 
     def _refresh_accounts(self):
-        """从数据库刷新账号列表"""
-        current_time = time.time()
-        # 如果距离上次刷新时间不足刷新间隔，则不刷新
-        if current_time - self._last_refresh_time < self._refresh_interval:
-            return
-            
+        """
+        从数据库增量刷新账号
+        
+        在锁外查询上次刷新以来更新过的账号和现存账号ID，再在锁内把变化合并到账号快照的副本上并整体替换，
+        获取账号的调用方不会等待数据库。updated_at精度为秒，按大于等于水位查询，重复返回的未变化账号会被跳过。
+        """
+        watermark = self._updated_watermark
         try:
-            # 获取所有账号
-            accounts = RunwayAccount.select().dicts()
-            
-            # 更新可用账号列表，保留已经在使用的账号
-            in_use_keys = set(self._in_use_accounts.keys())
-            
-            # 清空可用账号列表
-            self._available_accounts = []
-            
-            # 为每个账号创建多个实例
-            for account in accounts:
-                for instance_id in range(self._instances_per_account):
-                    # 创建账号实例，添加实例ID
-                    account_instance = account.copy()
-                    account_instance['instance_id'] = instance_id
-                    
-                    # 生成唯一键
-                    account_key = f"{account['id']}_{instance_id}"
-                    
-                    # 如果账号实例不在使用中，则添加到可用列表
-                    if account_key not in in_use_keys:
-                        self._available_accounts.append(account_instance)
-            
-            self._last_refresh_time = current_time
-            logger.debug(f"账号池刷新完成，可用账号实例: {len(self._available_accounts)}，使用中账号实例: {len(self._in_use_accounts)}")
+            query = RunwayAccount.select()
+            if watermark is not None:
+                query = query.where(RunwayAccount.updated_at >= watermark)
+            changed = list(query.dicts())
+            # 增量查询看不到删除，单独取现存ID
+            account_ids = {row.id for row in RunwayAccount.select(RunwayAccount.id)}
+            sessions = self._query_sessions(self._session_watermark)
         except Exception as e:
             logger.error(f"刷新账号池失败: {str(e)}")
+            self._last_refresh_time = time.time()
+            return
+        
+        with self._lock:
+            accounts = dict(self._accounts)
+            updated = 0
+            for row in changed:
+                account_id = row['id']
+                # 被移除的账号只能通过add_account重新加入
+                if account_id in self._removed_accounts or accounts.get(account_id) == row:
+                    continue
+                accounts[account_id] = row
+                updated += 1
+            deleted = [account_id for account_id in accounts if account_id not in account_ids]
+            for account_id in deleted:
+                del accounts[account_id]
+            
+            old_accounts, self._accounts = self._accounts, accounts
+            self._apply_sessions(sessions)
+            for account_id in deleted:
+                self._drop_instances(account_id)
+            for row in changed:
+                if self._accounts.get(row['id']) is row:
+                    self._sync_instances(row, old_accounts.get(row['id']))
+            self._wake_waiters()
+            
+            self._updated_watermark = self._max_updated_at(changed, watermark)
+            self._last_refresh_time = time.time()
+            if updated or deleted:
+                logger.debug(f"账号池增量刷新完成，更新账号: {updated}，删除账号: {len(deleted)}，可用账号实例: {len(self._available_accounts)}")
 
-    def get_account(self) -> Optional[Dict[str, Any]]:
+    def _sync_instances(self, row: Dict[str, Any], old_row: Optional[Dict[str, Any]]):
+        """
+        按账号的最新信息更新其实例（调用方需持有锁）
+        
+        新账号补充实例；已有账号原地替换可用实例以保持排队顺序，使用中的实例在释放时更新。
+        """
+        account_id = row['id']
+        old_limit = self._concurrency.limit(account_id) if old_row is not None else 0
+        new_limit = self._configure_concurrency(row)
+        self._rebuild_available(account_id)
+        # 同时按新的到期时间和每日上限补齐或移除实例
+        self._apply_limit(account_id, old_limit, new_limit)
+        if not self._eligible(row):
+            self._clear_available(account_id)
+
+    def _drop_instances(self, account_id: int):
+        """移除已从数据库删除的账号的可用实例，使用中的实例在释放时不再归还（调用方需持有锁）"""
+        self._clear_available(account_id)
+        self._concurrency.forget(account_id)
+        logger.info(f"账号 ID: {account_id} 已从数据库删除，移出账号池")
+
+    def get_account(self, ttl: Optional[float] = None, holder: Optional[str] = None) -> Optional[AccountLease]:
         """
         获取一个可用账号
         
+        Args:
+            ttl: 租约时长（秒），为None时使用默认值
+            holder: 持有者描述，出现在泄漏报告中
+        
         Returns:
-            Dict[str, Any] | None: 账号信息字典，如果没有可用账号则返回None
+            AccountLease | None: 账号租约，如果没有可用账号则返回None
         """
+        for _ in range(self._claim_attempts):
+            lease = self._get_account_local(ttl, holder)
+            if lease is None:
+                return None
+            if self._claim(lease):
+                lease.start_heartbeat()
+                return lease
+        return None
+    
+    def _get_account_local(self, ttl: Optional[float], holder: Optional[str]) -> Optional[AccountLease]:
+        """在本进程中分配一个可用账号，尚未向协调后端申领"""
         with self._lock:
             if not self._initialized:
                 self.initialize()
-                
-            # 如果没有可用账号，尝试刷新
-            if not self._available_accounts:
-                self._refresh_accounts()
-                
-            if not self._available_accounts:
+            
+            # 有调用方在排队等待时不插队
+            if self._waiters:
+                return None
+            
+            lease = self._take_available(ttl, holder)
+            if not lease:
                 logger.warning("没有可用账号")
                 return None
-                
-            # 从可用账号列表中取出一个账号
-            account = self._available_accounts.pop(0)
+        return lease
+    
+    def _claim(self, lease: AccountLease) -> bool:
+        """
+        向协调后端申领租约对应的实例（不能持有锁调用）
+        
+        实例被其他进程占用时收回本进程的租约，该实例暂停分配一段时间后再恢复。
+        
+        Returns:
+            bool: 是否申领成功
+        """
+        if self.coordinator.is_local or self.coordinator.try_acquire(lease.key, lease.owner, lease.ttl):
+            return True
+        with self._lock:
+            self._claim_conflicts += 1
+            if self._leases.get(lease.key) is lease:
+                account = self._unmark_in_use(lease.key)
+                self._parked[lease.key] = (account, time.time() + self._park_seconds)
+        logger.debug(f"账号 ID: {lease.account_id}, 实例ID: {lease.instance_id} 被其他进程占用，暂停分配 {self._park_seconds} 秒")
+        return False
+    
+    def _unpark_due(self, now: float) -> bool:
+        """恢复分配暂停期已过的实例（调用方需持有锁）"""
+        due = [key for key, (_, until) in self._parked.items() if until <= now]
+        for key in due:
+            account, _ = self._parked.pop(key)
+            if key not in self._available_accounts and key not in self._in_use_accounts:
+                self._return_instance(account)
+        return bool(due)
+    
+    def set_strategy(self, strategy: "SelectionStrategy | str"):
+        """
+        设置账号选择策略
+        
+        Args:
+            strategy: 策略对象或策略名称（fifo/least_in_flight/fastest/least_throttled/expiring_first/balanced）
+        """
+        with self._lock:
+            self._strategy = create_strategy(strategy) if isinstance(strategy, str) else strategy
+            logger.info(f"账号选择策略: {self._strategy.name}")
+    
+    def _in_flight(self, account_id: int) -> int:
+        """账号使用中的实例数（调用方需持有锁）"""
+        return len(self._in_use_by_account.get(account_id, ()))
+    
+    def _select_available(self) -> Dict[str, Any]:
+        """按选择策略从可用账号中取出一个实例（调用方需持有锁）"""
+        account_id = self._strategy.select(self._available_by_account.keys(), self._in_flight, self.account_stats, self._accounts)
+        if account_id is None or account_id not in self._available_by_account:
+            return self._pop_available()
+        return self._pop_available(next(iter(self._available_by_account[account_id])))
+    
+    def _grant(self, account: Dict[str, Any], ttl: Optional[float], holder: Optional[str]) -> AccountLease:
+        """将实例标记为使用中并签发租约（调用方需持有锁）"""
+        self._mark_in_use(account)
+        lease = AccountLease(self, account, ttl or self._lease_ttl, holder)
+        self._leases[lease.key] = lease
+        return lease
+    
+    def _take_available(self, ttl: Optional[float] = None, holder: Optional[str] = None) -> Optional[AccountLease]:
+        """从可用账号队列中取出一个账号并签发租约（调用方需持有锁）"""
+        # 账号由后台线程刷新，这里不访问数据库
+        if not self._available_accounts:
+            return None
             
-            # 生成唯一键
-            account_key = f"{account['id']}_{account['instance_id']}"
+        # 按选择策略取出一个账号，并标记为使用中
+        account = self._select_available()
+        lease = self._grant(account, ttl, holder)
+        
+        logger.debug(f"分配账号 ID: {account['id']}, 实例ID: {account['instance_id']}, 用户名: {account['username']}")
+        return lease
+    
+    def _wake_waiters(self):
+        """把可用账号依次交给排队最久的等待者（调用方需持有锁）"""
+        while self._waiters and self._available_accounts:
+            waiter = self._waiters.popleft()
+            waiter.wake(self._grant(self._select_available(), waiter.ttl, waiter.holder))
+    
+    def _record_wait(self, waiter: Optional[_Waiter]):
+        """记录一次成功获取账号的等待耗时（调用方需持有锁）"""
+        self._acquired_count += 1
+        self._wait_times.append(time.time() - waiter.enqueued_at if waiter else 0.0)
+    
+    def acquire(self, timeout: Optional[float] = None, ttl: Optional[float] = None,
+                holder: Optional[str] = None) -> Optional[AccountLease]:
+        """
+        获取一个可用账号，没有可用账号时阻塞等待，直到有账号被释放或超时
+        
+        等待者按先来后到获得账号，释放账号时只唤醒排在最前面的一个。
+        
+        Args:
+            timeout: 最长等待时间（秒），为None时一直等待
+            ttl: 租约时长（秒），为None时使用默认值
+            holder: 持有者描述，出现在泄漏报告中
             
-            # 将账号标记为使用中
-            self._in_use_accounts[account_key] = account
+        Returns:
+            AccountLease | None: 账号租约，超时返回None，持有者需在租约过期前调用renew续约
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            lease = self._acquire_local(None if deadline is None else max(0.0, deadline - time.time()), ttl, holder)
+            if lease is None or self._claim(lease):
+                return lease
+    
+    def _acquire_local(self, timeout: Optional[float], ttl: Optional[float],
+                       holder: Optional[str]) -> Optional[AccountLease]:
+        """在本进程中排队获取账号，尚未向协调后端申领"""
+        with self._lock:
+            if not self._initialized:
+                self.initialize()
+            lease = None if self._waiters else self._take_available(ttl, holder)
+            if lease:
+                self._record_wait(None)
+                return lease
+            waiter = _Waiter(ttl=ttl, holder=holder)
+            self._waiters.append(waiter)
+        
+        waiter.event.wait(timeout)
+        with self._lock:
+            if waiter.lease is None:
+                self._waiters.remove(waiter)
+                self._wait_timeout_count += 1
+                logger.warning(f"等待账号超时，等待 {timeout} 秒")
+                return None
+            self._record_wait(waiter)
+        return waiter.lease
+    
+    async def acquire_async(self, timeout: Optional[float] = None, ttl: Optional[float] = None,
+                            holder: Optional[str] = None) -> Optional[AccountLease]:
+        """
+        acquire的协程版本，等待期间不占用线程，获取到的租约在当前asyncio任务结束前自动续约
+        
+        Args:
+            timeout: 最长等待时间（秒），为None时一直等待
+            ttl: 租约时长（秒），为None时使用默认值
+            holder: 持有者描述，出现在泄漏报告中
+            
+        Returns:
+            AccountLease | None: 账号租约，超时返回None
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            lease = await self._acquire_local_async(None if deadline is None else max(0.0, deadline - time.time()), ttl, holder)
+            if lease is None:
+                return None
+            try:
+                claimed = self.coordinator.is_local or await asyncio.to_thread(self._claim, lease)
+            except asyncio.CancelledError:
+                self.release_account(lease)
+                raise
+            if claimed:
+                lease.start_heartbeat()
+                return lease
+    
+    async def _acquire_local_async(self, timeout: Optional[float], ttl: Optional[float],
+                                   holder: Optional[str]) -> Optional[AccountLease]:
+        """在本进程中排队获取账号的协程版本，尚未向协调后端申领"""
+        with self._lock:
+            if not self._initialized:
+                self.initialize()
+            lease = None if self._waiters else self._take_available(ttl, holder)
+            if lease:
+                self._record_wait(None)
+                return lease
+            waiter = _Waiter(asyncio.get_running_loop(), ttl, holder)
+            self._waiters.append(waiter)
+        
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                if waiter.lease is None:
+                    self._waiters.remove(waiter)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._wait_timeout_count += 1
+                        logger.warning(f"等待账号超时，等待 {timeout} 秒")
+                        return None
+                    raise
+            if isinstance(e, asyncio.CancelledError):
+                # 取消时账号已经交付，归还给下一个等待者
+                self.release_account(waiter.lease)
+                raise
+        with self._lock:
+            self._record_wait(waiter)
+        return waiter.lease
+
+    def get_account_by_id(self, account_id: int, ttl: Optional[float] = None,
+                          holder: Optional[str] = None) -> Optional[AccountLease]:
+        """
+        获取指定账号的一个可用实例，用于恢复已在该账号上创建的Runway任务
+        
+        Args:
+            account_id: 账号ID
+            ttl: 租约时长（秒），为None时使用默认值
+            holder: 持有者描述，出现在泄漏报告中
             
-            logger.debug(f"分配账号 ID: {account['id']}, 实例ID: {account['instance_id']}, 用户名: {account['username']}")
-            return account
+        Returns:
+            AccountLease | None: 账号租约，如果该账号没有可用实例则返回None
+        """
+        lease = self._get_account_by_id_local(account_id, ttl, holder)
+        if lease is None or not self._claim(lease):
+            return None
+        lease.start_heartbeat()
+        return lease
 
-    def release_account(self, account_id: int):
+    async def get_account_by_id_async(self, account_id: int, ttl: Optional[float] = None,
+                                      holder: Optional[str] = None) -> Optional[AccountLease]:
         """
-        释放一个账号，将其归还到可用账号池
+        get_account_by_id的协程版本，跨进程协调时向协调后端申领的操作在线程中执行
         
         Args:
             account_id: 账号ID
+            ttl: 租约时长（秒），为None时使用默认值
+            holder: 持有者描述，出现在泄漏报告中
+            
+        Returns:
+            AccountLease | None: 账号租约，如果该账号没有可用实例则返回None
+        """
+        lease = self._get_account_by_id_local(account_id, ttl, holder)
+        if lease is None:
+            return None
+        try:
+            claimed = self.coordinator.is_local or await asyncio.to_thread(self._claim, lease)
+        except asyncio.CancelledError:
+            await self.release_account_async(lease)
+            raise
+        if not claimed:
+            return None
+        lease.start_heartbeat()
+        return lease
+
+    def _get_account_by_id_local(self, account_id: int, ttl: Optional[float],
+                                 holder: Optional[str]) -> Optional[AccountLease]:
+        """在本进程中分配指定账号的一个可用实例，尚未向协调后端申领"""
+        with self._lock:
+            keys = self._available_by_account.get(account_id)
+            if not keys:
+                logger.warning(f"指定账号 ID: {account_id} 没有可用实例")
+                return None
+            account = self._pop_available(next(iter(keys)))
+            lease = self._grant(account, ttl, holder)
+            logger.debug(f"分配指定账号 ID: {account['id']}, 实例ID: {account['instance_id']}, 用户名: {account['username']}")
+        return lease
+
+    def renew_lease(self, lease: AccountLease, ttl: Optional[float] = None) -> bool:
+        """
+        续约
+        
+        Args:
+            lease: 账号租约
+            ttl: 新的租约时长（秒），为None时沿用原时长
+            
+        Returns:
+            bool: 租约已被释放或回收时返回False
+        """
+        with self._lock:
+            if self._leases.get(lease.key) is not lease:
+                return False
+            if ttl:
+                lease.ttl = ttl
+            lease.expires_at = time.time() + lease.ttl
+        if not self.coordinator.is_local and not self.coordinator.renew(lease.key, lease.owner, lease.ttl):
+            logger.warning(f"账号 ID: {lease.account_id}, 实例ID: {lease.instance_id} 的跨进程租约已被其他进程接管")
+            return False
+        return True
+
+    def release_account(self, lease: AccountLease):
+        """
+        释放租约，将其对应的账号实例归还到可用账号池
+        
+        只释放租约对应的实例；租约已释放或已被回收时忽略，重复释放不会影响其他持有者。
+        
+        Args:
+            lease: 账号租约
         """
+        # 先释放跨进程租约，避免实例在本进程中转交给等待者后被这里误删
+        if not self.coordinator.is_local:
+            self.coordinator.release(lease.key, lease.owner)
         with self._lock:
             if not self._initialized:
                 logger.warning("账号池未初始化，无法释放账号")
                 return
             
-            # 查找所有匹配的账号实例
-            matching_keys = [key for key in self._in_use_accounts.keys() if key.startswith(f"{account_id}_")]
-            
-            if not matching_keys:
-                logger.warning(f"尝试释放不存在或未被使用的账号 ID: {account_id}")
+            if self._leases.get(lease.key) is not lease:
+                logger.warning(f"租约已释放或已被回收，忽略释放 账号 ID: {lease.account_id}, 实例ID: {lease.instance_id}")
                 return
             
-            # 释放第一个匹配的账号实例
-            account_key = matching_keys[0]
-            account = self._in_use_accounts.pop(account_key)
-            self._available_accounts.append(account)
-            logger.debug(f"释放账号 ID: {account_id}, 实例ID: {account['instance_id']}, 用户名: {account['username']}")
+            # 有等待者时直接交给排队最久的等待者
+            account = self._unmark_in_use(lease.key)
+            self._return_instance(account)
+            self._wake_waiters()
+            logger.debug(f"释放账号 ID: {lease.account_id}, 实例ID: {lease.instance_id}, 用户名: {account['username']}")
+
+    async def release_account_async(self, lease: AccountLease):
+        """
+        release_account的协程版本，跨进程协调时释放操作需要访问数据库，放到线程中执行
+        
+        Args:
+            lease: 账号租约
+        """
+        if self.coordinator.is_local:
+            self.release_account(lease)
+        else:
+            await asyncio.to_thread(self.release_account, lease)
+
+    def _reap_loop(self):
+        """后台线程主循环，定期回收过期租约"""
+        while True:
+            time.sleep(self._reap_interval)
+            try:
+                self.reap_expired_leases()
+            except Exception as e:
+                logger.error(f"回收过期租约失败: {str(e)}")
+
+    def reap_expired_leases(self) -> int:
+        """
+        回收过期未续约的租约，将实例归还到可用账号池并记录泄漏
+        
+        Returns:
+            int: 回收的租约数量
+        """
+        now = time.time()
+        with self._lock:
+            expired = [lease for lease in self._leases.values() if lease.expires_at < now]
+        # 先释放跨进程租约，原因同release_account
+        if not self.coordinator.is_local:
+            for lease in expired:
+                self.coordinator.release(lease.key, lease.owner)
+        with self._lock:
+            # 释放期间续约或已释放的租约不再回收
+            expired = [lease for lease in expired if self._leases.get(lease.key) is lease and lease.expires_at < now]
+            for lease in expired:
+                self._leaked_count += 1
+                self._leaks.append({
+                    "lease_id": lease.lease_id,
+                    "account_id": lease.account_id,
+                    "instance_id": lease.instance_id,
+                    "holder": lease.holder,
+                    "held_seconds": round(now - lease.acquired_at, 1),
+                    "reclaimed_at": datetime.fromtimestamp(now).strftime("%Y-%m-%d %H:%M:%S")
+                })
+                logger.warning(f"回收过期租约，账号 ID: {lease.account_id}, 实例ID: {lease.instance_id}, 持有者: {lease.holder}")
+                account = self._unmark_in_use(lease.key)
+                self._return_instance(account)
+            unparked = self._unpark_due(now)
+            if expired or unparked:
+                self._wake_waiters()
+            return len(expired)
 
     def remove_account(self, account_id: int, reason: str = "未指定原因"):
         """
@@ -189,23 +895,15 @@ class AccountPool:
         """
         with self._lock:
             # 记录是否找到并移除了账号
-            removed = False
-            
-            # 从可用账号列表中移除所有匹配的账号实例
-            for account in self._available_accounts[:]:
-                if account['id'] == account_id:
-                    self._available_accounts.remove(account)
-                    removed = True
+            removed = account_id in self._accounts or account_id in self._available_by_account or account_id in self._in_use_by_account
             
-            # 从使用中账号列表中移除所有匹配的账号实例
-            keys_to_remove = []
-            for key, account in self._in_use_accounts.items():
-                if account['id'] == account_id:
-                    keys_to_remove.append(key)
-                    removed = True
-            
-            for key in keys_to_remove:
-                del self._in_use_accounts[key]
+            # 移除该账号所有可用和使用中的实例
+            for key in list(self._available_by_account.get(account_id, ())):
+                self._pop_available(key)
+            for key in list(self._in_use_by_account.get(account_id, ())):
+                self._unmark_in_use(key)
+            self._accounts = {key: account for key, account in self._accounts.items() if key != account_id}
+            self._concurrency.forget(account_id)
             
             if removed:
                 # 记录移除原因
@@ -224,59 +922,220 @@ class AccountPool:
         Returns:
             bool: 添加是否成功
         """
+        try:
+            # 在锁外从数据库获取账号信息，与加载账号时的字段保持一致
+            account_dict = RunwayAccount.select().where(RunwayAccount.id == account_id).dicts().get_or_none()
+        except Exception as e:
+            logger.error(f"添加账号 ID: {account_id} 失败: {str(e)}")
+            return False
+        
+        if not account_dict:
+            logger.error(f"账号 ID: {account_id} 在数据库中不存在")
+            return False
+        
         with self._lock:
             # 检查账号是否已在可用池中
-            for account in self._available_accounts:
-                if account['id'] == account_id:
-                    logger.warning(f"账号 ID: {account_id} 已经在可用池中")
-                    return False
+            if account_id in self._available_by_account:
+                logger.warning(f"账号 ID: {account_id} 已经在可用池中")
+                return False
             
             # 检查账号是否在使用中
-            in_use = False
-            for key, account in self._in_use_accounts.items():
-                if account['id'] == account_id:
-                    in_use = True
-                    break
-                
-            if in_use:
+            if account_id in self._in_use_by_account:
                 logger.warning(f"账号 ID: {account_id} 正在使用中，无法添加")
                 return False
             
-            # 从数据库获取账号信息
-            try:
-                # 从数据库获取账号信息
-                account = RunwayAccount.get_or_none(RunwayAccount.id == account_id)
-                
-                if not account:
-                    logger.error(f"账号 ID: {account_id} 在数据库中不存在")
-                    return False
-                
-                # 将账号转换为字典
-                account_dict = {
-                    'id': account.id,
-                    'username': account.username,
-                    'password': account.password,
-                    'team_id': account.team_id,
-                    'status': account.status,
-                    'created_at': account.created_at,
-                    'updated_at': account.updated_at
-                }
-                
-                # 为账号创建多个实例并添加到可用池
-                for instance_id in range(self._instances_per_account):
-                    account_instance = account_dict.copy()
-                    account_instance['instance_id'] = instance_id
-                    self._available_accounts.append(account_instance)
-                
-                # 如果账号在已移除列表中，则移除
-                if account_id in self._removed_accounts:
-                    del self._removed_accounts[account_id]
-                
-                logger.info(f"成功添加账号 ID: {account_id} 到可用池，创建了 {self._instances_per_account} 个实例")
-                return True
-            except Exception as e:
-                logger.error(f"添加账号 ID: {account_id} 失败: {str(e)}")
-                return False
+            # 按账号的并发上限创建实例并添加到可用池
+            self._accounts = {**self._accounts, account_id: account_dict}
+            limit = self._configure_concurrency(account_dict)
+            for instance_id in range(limit):
+                self._push_available(self._new_instance(account_dict, instance_id))
+            self._wake_waiters()
+            
+            # 如果账号在已移除列表中，则移除
+            if account_id in self._removed_accounts:
+                del self._removed_accounts[account_id]
+            
+            logger.info(f"成功添加账号 ID: {account_id} 到可用池，创建了 {limit} 个实例")
+            return True
+
+    def update_account(self, account_dict: Dict[str, Any]):
+        """
+        立即应用账号的最新信息（如重新登录后的token），不必等待下次刷新（不操作数据库）
+        
+        Args:
+            account_dict: 数据库中的账号字典
+        """
+        with self._lock:
+            account_id = account_dict['id']
+            old_row = self._accounts.get(account_id)
+            if old_row is None:
+                return
+            self._accounts = {**self._accounts, account_id: account_dict}
+            self._sync_instances(account_dict, old_row)
+            self._wake_waiters()
+
+    def update_token(self, account_id: int, token: str):
+        """
+        只更新账号的token（如重新登录后），其他字段保持账号池中的最新快照（不操作数据库）
+        
+        Args:
+            account_id: 账号ID
+            token: 新的token
+        """
+        with self._lock:
+            old_row = self._accounts.get(account_id)
+            if old_row is None or old_row.get('token') == token:
+                return
+            self.update_account({**old_row, 'token': token})
+
+    def set_session(self, account_id: int, session_id: str):
+        """
+        设置账号使用的会话（如管理后台新建会话后），立即对之后分配的实例生效（不操作数据库）
+        
+        Args:
+            account_id: 账号ID
+            session_id: 会话ID
+        """
+        with self._lock:
+            self._session_ids[account_id] = session_id
+            self._rebuild_available(account_id)
+
+    def get_session_id(self, account: Dict[str, Any]) -> str:
+        """
+        获取账号实例的会话ID，优先使用随实例返回的会话，没有时（如账号池还未加载到新建的会话）查询数据库
+        
+        Args:
+            account: 账号实例或租约
+            
+        Returns:
+            str: 会话ID
+        
+        Raises:
+            RunwaySession.DoesNotExist: 账号没有会话
+        """
+        session_id = account.get('session_id')
+        if session_id:
+            return session_id
+        session = (RunwaySession
+                   .select()
+                   .where(RunwaySession.runway == account['id'])
+                   .order_by(RunwaySession.id.desc())
+                   .get())
+        self.set_session(account['id'], session.session_id)
+        return session.session_id
+
+    def is_removed(self, account_id: int) -> bool:
+        """账号是否已被移出账号池"""
+        with self._lock:
+            return account_id in self._removed_accounts
+
+    def set_max_concurrency(self, account_id: int, max_concurrency: int):
+        """
+        修改账号的最大并发数，立即按新的上限增减实例（不操作数据库）
+        
+        Args:
+            account_id: 账号ID
+            max_concurrency: 最大并发数
+        """
+        with self._lock:
+            account = self._accounts.get(account_id)
+            if account is None:
+                logger.warning(f"账号 ID: {account_id} 不在账号池中，下次刷新时生效")
+                return
+            account = {**account, 'max_concurrency': max_concurrency}
+            self._accounts = {**self._accounts, account_id: account}
+            old_limit = self._concurrency.limit(account_id)
+            self._apply_limit(account_id, old_limit, self._configure_concurrency(account))
+
+    def record_request(self, account_id: int, throttled: bool):
+        """
+        上报一次请求是否被限流，被限流时降低账号的并发上限
+        
+        Args:
+            account_id: 账号ID
+            throttled: 是否返回429或任务进入THROTTLED状态
+        """
+        self.account_stats.record_request(account_id, throttled)
+        if not throttled:
+            return
+        with self._lock:
+            old_limit = self._concurrency.limit(account_id)
+            new_limit = self._concurrency.on_throttle(account_id)
+            if new_limit is not None:
+                self._apply_limit(account_id, old_limit, new_limit)
+
+    def record_queue_time(self, account_id: int, seconds: float):
+        """
+        上报任务在Runway的排队时间（创建到开始运行），据此调整账号的并发上限
+        
+        Args:
+            account_id: 账号ID
+            seconds: 排队时间（秒）
+        """
+        with self._lock:
+            old_limit = self._concurrency.limit(account_id)
+            new_limit = self._concurrency.on_queue_time(account_id, seconds)
+            if new_limit is not None:
+                self._apply_limit(account_id, old_limit, new_limit)
+
+    def record_generation(self, account_id: int):
+        """
+        记录账号创建了一个Runway任务，达到每日上限时暂停分配该账号直到第二天
+        
+        Args:
+            account_id: 账号ID
+        """
+        with self._lock:
+            if self._quota.roll():
+                for other_id in self._accounts:
+                    self._fill_instances(other_id)
+            count = self._quota.increment(account_id)
+            account = self._accounts.get(account_id)
+            if account is not None and self._quota.exhausted(account):
+                self._clear_available(account_id)
+                logger.info(f"账号 ID: {account_id} 今日已创建 {count} 个任务，达到每日上限，暂停分配")
+            self._wake_waiters()
+
+    def get_quota_stats(self) -> Dict[str, Any]:
+        """
+        获取各账号当天的生成数、每日上限和套餐剩余天数
+        
+        Returns:
+            Dict[str, Any]: 包含统计日期和各账号额度信息的字典
+        """
+        with self._lock:
+            accounts = self._quota.snapshot(self._accounts)
+            for account_id, item in accounts.items():
+                account = self._accounts[account_id]
+                days = days_until_expiry(account)
+                item["days_until_expiry"] = round(days, 1) if days is not None else None
+                item["eligible"] = self._eligible(account)
+            return {
+                "day": self._quota.day.strftime("%Y-%m-%d"),
+                "accounts": accounts
+            }
+
+    def get_concurrency_stats(self) -> Dict[int, dict]:
+        """
+        获取各账号的并发上限
+        
+        Returns:
+            Dict[int, dict]: 账号ID -> 当前上限、配置的最大并发数和使用中实例数
+        """
+        with self._lock:
+            stats = self._concurrency.snapshot()
+            for account_id, item in stats.items():
+                item["in_flight"] = self._in_flight(account_id)
+            return stats
+
+    def get_accounts(self) -> List[Dict[str, Any]]:
+        """
+        获取账号池中的账号信息，读取当前快照，不需要加锁
+        
+        Returns:
+            List[Dict[str, Any]]: 账号字典列表
+        """
+        return list(self._accounts.values())
 
     def get_stats(self) -> Dict[str, int]:
         """
@@ -286,17 +1145,48 @@ class AccountPool:
             Dict[str, int]: 包含可用账号数和使用中账号数的字典
         """
         with self._lock:
-            # 计算唯一账号ID的数量
-            unique_available_ids = set(account['id'] for account in self._available_accounts)
-            unique_in_use_ids = set(int(key.split('_')[0]) for key in self._in_use_accounts.keys())
-            
+            # 唯一账号数直接取自按账号ID维护的索引，不再每次重建集合
             return {
                 "available_instances": len(self._available_accounts),
                 "in_use_instances": len(self._in_use_accounts),
                 "total_instances": len(self._available_accounts) + len(self._in_use_accounts),
-                "unique_available": len(unique_available_ids),
-                "unique_in_use": len(unique_in_use_ids),
-                "unique_total": len(unique_available_ids.union(unique_in_use_ids))
+                "unique_available": len(self._available_by_account),
+                "unique_in_use": len(self._in_use_by_account),
+                "unique_total": len(self._instance_counts)
+            }
+
+    def get_wait_stats(self) -> Dict[str, Any]:
+        """
+        获取账号等待统计信息
+        
+        Returns:
+            Dict[str, Any]: 包含当前等待数、成功获取数、超时数和等待耗时的字典
+        """
+        with self._lock:
+            waits = sorted(self._wait_times)
+            p95 = waits[max(0, math.ceil(len(waits) * 0.95) - 1)] if waits else 0.0
+            return {
+                "waiters": len(self._waiters),
+                "acquired": self._acquired_count,
+                "timeouts": self._wait_timeout_count,
+                "wait_avg_ms": round(sum(waits) / len(waits) * 1000, 2) if waits else 0.0,
+                "wait_p95_ms": round(p95 * 1000, 2)
+            }
+
+    def get_selection_stats(self) -> Dict[str, Any]:
+        """
+        获取账号选择策略和各账号的实时统计
+        
+        Returns:
+            Dict[str, Any]: 包含当前策略名称和各账号耗时中位数、限流比例、使用中实例数的字典
+        """
+        accounts = self.account_stats.snapshot()
+        with self._lock:
+            for account_id, item in accounts.items():
+                item["in_flight"] = self._in_flight(account_id)
+            return {
+                "strategy": self._strategy.name,
+                "accounts": accounts
             }
 
     def get_pool_status(self):
@@ -311,7 +1201,13 @@ class AccountPool:
                 "available": len(self._available_accounts),
                 "in_use": len(self._in_use_accounts),
                 "removed": len(self._removed_accounts),
-                "total": len(self._available_accounts) + len(self._in_use_accounts) + len(self._removed_accounts)
+                "total": len(self._available_accounts) + len(self._in_use_accounts) + len(self._removed_accounts),
+                "leases": len(self._leases),
+                "coordination": self.coordinator.name,
+                "parked": len(self._parked),
+                "claim_conflicts": self._claim_conflicts,
+                "leaked": self._leaked_count,
+                "leaks": list(self._leaks)
             }
 
 # 创建全局单例实例
@@ -0,0 +1,97 @@
+from datetime import date, datetime
+from typing import Any, Dict, Optional
+from loguru import logger
+from peewee import fn
+from models import VideoGeneration, AIVideo
+
+
+def load_daily_counts(day: date) -> Dict[int, int]:
+    """
+    从生成记录统计各账号当天已创建的Runway任务数
+
+    Args:
+        day: 统计日期
+
+    Returns:
+        Dict[int, int]: 账号ID -> 当天生成数
+    """
+    start = datetime.combine(day, datetime.min.time())
+    counts: Dict[int, int] = {}
+    queries = [
+        VideoGeneration
+        .select(VideoGeneration.runway_id, fn.COUNT(VideoGeneration.id).alias('count'))
+        .where((VideoGeneration.created_at >= start) & (VideoGeneration.runway_id.is_null(False)))
+        .group_by(VideoGeneration.runway_id),
+        AIVideo
+        .select(AIVideo.runway_id, fn.COUNT(AIVideo.id).alias('count'))
+        .where((AIVideo.created_at >= start) & (AIVideo.runway_task_id.is_null(False)))
+        .group_by(AIVideo.runway_id),
+    ]
+    for query in queries:
+        for row in query.dicts():
+            account_id = int(row['runway_id'])
+            counts[account_id] = counts.get(account_id, 0) + row['count']
+    return counts
+
+
+class DailyQuota:
+    """
+    各账号当天的生成数和每日上限
+
+    启动时从生成记录初始化，之后每创建一个Runway任务加一，跨天自动清零。
+    本类不加锁，由账号池在持有锁时调用。
+    """
+    def __init__(self, default_quota: int = 0):
+        """
+        Args:
+            default_quota: 账号未配置daily_quota时的每日上限，0表示不限
+        """
+        self.default_quota = default_quota
+        self.day = date.today()
+        self._counts: Dict[int, int] = {}
+
+    def seed(self, day: date, counts: Dict[int, int]):
+        """用统计出的生成数初始化，统计日期已过时忽略"""
+        if day == self.day:
+            self._counts = dict(counts)
+
+    def roll(self, today: Optional[date] = None) -> bool:
+        """
+        跨天时清零生成数
+
+        Returns:
+            bool: 是否发生了跨天
+        """
+        today = today or date.today()
+        if today == self.day:
+            return False
+        logger.info(f"账号每日生成数清零，日期: {today}")
+        self.day = today
+        self._counts = {}
+        return True
+
+    def count(self, account_id: int) -> int:
+        """账号当天的生成数"""
+        return self._counts.get(account_id, 0)
+
+    def increment(self, account_id: int) -> int:
+        """记录一次生成，返回当天的生成数"""
+        self._counts[account_id] = self._counts.get(account_id, 0) + 1
+        return self._counts[account_id]
+
+    def quota(self, account: Dict[str, Any]) -> int:
+        """账号的每日上限，0表示不限"""
+        quota = account.get('daily_quota')
+        return self.default_quota if quota is None else quota
+
+    def exhausted(self, account: Dict[str, Any]) -> bool:
+        """账号当天的生成数是否已达上限"""
+        quota = self.quota(account)
+        return quota > 0 and self.count(account['id']) >= quota
+
+    def snapshot(self, accounts: Dict[int, Dict[str, Any]]) -> Dict[int, dict]:
+        """导出各账号当天的生成数和上限"""
+        return {
+            account_id: {"count": self.count(account_id), "quota": self.quota(account)}
+            for account_id, account in accounts.items()
+        }
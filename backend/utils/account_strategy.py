@@ -0,0 +1,208 @@
+import collections
+import threading
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Mapping, Optional
+from loguru import logger
+
+
+class AccountStats:
+    """单个账号最近的生成耗时和限流情况"""
+    def __init__(self, window: int = 50):
+        """
+        Args:
+            window: 统计窗口，保留最近window次记录
+        """
+        self.durations = collections.deque(maxlen=window)  # 最近的生成耗时（秒）
+        self.requests = collections.deque(maxlen=window)  # 最近的请求是否被限流(429/THROTTLED)
+
+    def p50(self) -> Optional[float]:
+        """最近生成耗时的中位数，没有记录时返回None"""
+        if not self.durations:
+            return None
+        durations = sorted(self.durations)
+        return durations[len(durations) // 2]
+
+    def throttle_rate(self) -> float:
+        """最近请求中被限流的比例"""
+        if not self.requests:
+            return 0.0
+        return sum(1 for throttled in self.requests if throttled) / len(self.requests)
+
+
+class AccountStatsRegistry:
+    """按账号ID维护的实时统计，由生成流程上报，供选择策略使用"""
+    def __init__(self, window: int = 50):
+        self._window = window
+        self._stats: Dict[int, AccountStats] = {}
+        self._lock = threading.Lock()
+
+    def get(self, account_id: int) -> AccountStats:
+        """获取账号的统计，不存在时创建"""
+        with self._lock:
+            stats = self._stats.get(account_id)
+            if stats is None:
+                stats = self._stats[account_id] = AccountStats(self._window)
+            return stats
+
+    def record_duration(self, account_id: int, duration: float):
+        """
+        记录一次完整生成的耗时
+
+        Args:
+            account_id: 账号ID
+            duration: 从创建Runway任务到生成完成的耗时（秒）
+        """
+        self.get(account_id).durations.append(duration)
+
+    def record_request(self, account_id: int, throttled: bool):
+        """
+        记录一次请求是否被限流
+
+        Args:
+            account_id: 账号ID
+            throttled: 是否返回429或任务进入THROTTLED状态
+        """
+        self.get(account_id).requests.append(throttled)
+
+    def snapshot(self) -> Dict[int, dict]:
+        """导出所有账号的统计"""
+        with self._lock:
+            items = list(self._stats.items())
+        return {
+            account_id: {
+                "p50_seconds": round(stats.p50(), 1) if stats.p50() is not None else None,
+                "throttle_rate": round(stats.throttle_rate(), 3),
+                "samples": len(stats.durations)
+            }
+            for account_id, stats in items
+        }
+
+
+class SelectionStrategy:
+    """
+    账号选择策略
+
+    从有可用实例的账号中选出下一个分配的账号。默认按可用队列先进先出分配，耗时为常数，不随账号数量增长。
+    """
+    name = "fifo"
+
+    def select(self, candidates: Iterable[int], in_flight: Callable[[int], int],
+               stats: AccountStatsRegistry, accounts: Mapping[int, Dict[str, Any]]) -> Optional[int]:
+        """
+        Args:
+            candidates: 有可用实例的账号ID
+            in_flight: 返回账号使用中实例数的函数
+            stats: 账号实时统计
+            accounts: 账号ID -> 账号信息（含plan_expires等字段）
+
+        Returns:
+            int | None: 选中的账号ID，返回None时按可用队列先进先出分配
+        """
+        return None
+
+
+class ScoredStrategy(SelectionStrategy):
+    """
+    按得分选择账号，得分最低者优先，得分相同时按候选顺序
+
+    每次分配都要为所有有可用实例的账号计算得分，耗时随账号数量线性增长（1万个账号时balanced策略每次约20多毫秒，
+    且在账号池的锁内执行），账号较多时应使用默认的fifo策略。
+    """
+    def score(self, account_id: int, in_flight: int, stats: AccountStats, account: Dict[str, Any]) -> Any:
+        raise NotImplementedError
+
+    def select(self, candidates, in_flight, stats, accounts):
+        best, best_score = None, None
+        for account_id in candidates:
+            score = self.score(account_id, in_flight(account_id), stats.get(account_id), accounts.get(account_id, {}))
+            if best_score is None or score < best_score:
+                best, best_score = account_id, score
+        return best
+
+
+class LeastInFlightStrategy(ScoredStrategy):
+    """优先选择使用中实例最少的账号"""
+    name = "least_in_flight"
+
+    def score(self, account_id, in_flight, stats, account):
+        return in_flight
+
+
+class FastestStrategy(ScoredStrategy):
+    """优先选择最近生成耗时中位数最低的账号，没有记录的账号优先被试用"""
+    name = "fastest"
+
+    def score(self, account_id, in_flight, stats, account):
+        p50 = stats.p50()
+        return 0.0 if p50 is None else p50
+
+
+class LeastThrottledStrategy(ScoredStrategy):
+    """优先选择最近限流比例最低的账号，比例相同时选择使用中实例较少的"""
+    name = "least_throttled"
+
+    def score(self, account_id, in_flight, stats, account):
+        return stats.throttle_rate() * 1000 + in_flight
+
+
+def days_until_expiry(account: Dict[str, Any]) -> Optional[float]:
+    """账号套餐剩余天数，没有到期时间时返回None"""
+    plan_expires = account.get('plan_expires')
+    if not plan_expires:
+        return None
+    return (plan_expires - datetime.now()).total_seconds() / 86400
+
+
+class ExpiringFirstStrategy(ScoredStrategy):
+    """优先使用套餐最先到期的账号，到期前用完其额度，到期时间相同时选择使用中实例较少的"""
+    name = "expiring_first"
+
+    def score(self, account_id, in_flight, stats, account):
+        days = days_until_expiry(account)
+        return (float("inf") if days is None else days, in_flight)
+
+
+class BalancedStrategy(ScoredStrategy):
+    """综合负载、耗时和限流情况估算任务在该账号上完成的相对耗时，并适当优先即将到期的账号"""
+    name = "balanced"
+
+    def __init__(self, default_duration: float = 120.0, throttle_penalty: float = 4.0, expiry_horizon: float = 7.0):
+        """
+        Args:
+            default_duration: 没有耗时记录的账号使用的默认耗时（秒）
+            throttle_penalty: 限流比例的惩罚系数，限流比例为1时耗时按(1+throttle_penalty)倍估算
+            expiry_horizon: 套餐在该天数内到期的账号得分按剩余天数最多减半，越早到期越优先
+        """
+        self.default_duration = default_duration
+        self.throttle_penalty = throttle_penalty
+        self.expiry_horizon = expiry_horizon
+
+    def score(self, account_id, in_flight, stats, account):
+        p50 = stats.p50()
+        duration = self.default_duration if p50 is None else p50
+        score = duration * (1 + in_flight) * (1 + self.throttle_penalty * stats.throttle_rate())
+        days = days_until_expiry(account)
+        if days is not None:
+            score *= 0.5 + 0.5 * min(1.0, max(0.0, days) / self.expiry_horizon)
+        return score
+
+
+STRATEGIES = {
+    strategy.name: strategy
+    for strategy in (SelectionStrategy, LeastInFlightStrategy, FastestStrategy, LeastThrottledStrategy,
+                     ExpiringFirstStrategy, BalancedStrategy)
+}
+
+
+def create_strategy(name: str) -> SelectionStrategy:
+    """
+    按名称创建选择策略，未知名称时退回先进先出
+
+    Args:
+        name: 策略名称，可选 fifo/least_in_flight/fastest/least_throttled/expiring_first/balanced
+    """
+    strategy = STRATEGIES.get(name)
+    if strategy is None:
+        logger.warning(f"未知的账号选择策略: {name}，使用fifo")
+        strategy = SelectionStrategy
+    return strategy()
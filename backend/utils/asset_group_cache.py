@@ -0,0 +1,180 @@
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+from loguru import logger
+from models import RunwayAccount, RunwaySession
+from utils.runway_client import runway_client, API_BASE_URL
+
+
+def fetch_asset_group_id(session_id: str, account: Dict[str, Any]) -> Optional[str]:
+    """
+    向Runway查询会话的assetGroupId，会话还没有assetGroup时创建
+
+    Args:
+        session_id: 会话ID
+        account: 会话所属的账号信息
+
+    Returns:
+        str: assetGroupId，未能获取时返回None
+    """
+    headers = {"Authorization": f"Bearer {account['token']}"}
+    params = {"asTeamId": account['as_team_id']}
+    response = runway_client.get(f"{API_BASE_URL}/sessions/{session_id}", account=account, headers=headers, params=params)
+    response.raise_for_status()
+    asset_group_id = response.json().get('session', {}).get('assetGroupId')
+    if asset_group_id:
+        return asset_group_id
+    response = runway_client.post(f"{API_BASE_URL}/sessions/{session_id}/assetGroup", account=account, headers=headers, params=params)
+    response.raise_for_status()
+    return response.json().get('assetGroup', {}).get('id')
+
+
+class AssetGroupCache:
+    """
+    Runway会话的assetGroupId缓存
+
+    同一会话的assetGroupId不会变化，首次获取后缓存在内存并保存到runway_session.asset_group_id，
+    之后创建任务不再请求Runway。启动时从数据库加载，并在后台为尚未缓存的会话预先获取；
+    创建任务返回401/404（账号或会话失效）时清除对应会话的缓存，下次重新获取。
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[str, str] = {}  # 会话ID -> assetGroupId
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+    def load(self) -> int:
+        """
+        从数据库加载已保存的assetGroupId
+
+        Returns:
+            int: 加载的会话数
+        """
+        rows = (RunwaySession
+                .select(RunwaySession.session_id, RunwaySession.asset_group_id)
+                .where(RunwaySession.asset_group_id.is_null(False))
+                .dicts())
+        cache = {row['session_id']: row['asset_group_id'] for row in rows}
+        with self._lock:
+            self._cache.update(cache)
+        logger.info(f"assetGroupId缓存加载完成，会话数: {len(cache)}")
+        return len(cache)
+
+    def start(self):
+        """加载数据库中的缓存，并启动后台线程为尚未缓存的会话获取assetGroupId"""
+        try:
+            self.load()
+        except Exception as e:
+            logger.error(f"加载assetGroupId缓存失败: {str(e)}")
+        threading.Thread(target=self.warm_missing, name="AssetGroupWarmup", daemon=True).start()
+
+    def warm_missing(self) -> int:
+        """
+        为数据库中尚未保存assetGroupId的会话逐个向Runway获取，单个会话失败时跳过
+
+        Returns:
+            int: 本次获取成功的会话数
+        """
+        try:
+            rows = list(RunwaySession
+                        .select(RunwaySession.session_id, RunwayAccount.token, RunwayAccount.as_team_id)
+                        .join(RunwayAccount)
+                        .where(RunwaySession.asset_group_id.is_null())
+                        .dicts())
+        except Exception as e:
+            logger.error(f"查询待预热的会话失败: {str(e)}")
+            return 0
+        warmed = 0
+        for row in rows:
+            session_id = row['session_id']
+            if self.get(session_id, count=False):
+                continue
+            try:
+                asset_group_id = fetch_asset_group_id(session_id, row)
+            except Exception as e:
+                logger.warning(f"预热会话 {session_id} 的assetGroupId失败: {str(e)}")
+                continue
+            if asset_group_id:
+                self.set(session_id, asset_group_id)
+                warmed += 1
+        logger.info(f"assetGroupId预热完成，成功: {warmed}/{len(rows)}")
+        return warmed
+
+    def get(self, session_id: str, count: bool = True) -> Optional[str]:
+        """
+        获取缓存的assetGroupId
+
+        Args:
+            session_id: 会话ID
+            count: 是否计入命中率统计
+        """
+        with self._lock:
+            asset_group_id = self._cache.get(session_id)
+            if count:
+                if asset_group_id:
+                    self._hits += 1
+                else:
+                    self._misses += 1
+            return asset_group_id
+
+    def set(self, session_id: str, asset_group_id: str):
+        """缓存assetGroupId并保存到数据库"""
+        if self._cache_set(session_id, asset_group_id):
+            self._save(session_id, asset_group_id)
+
+    async def set_async(self, session_id: str, asset_group_id: str):
+        """set的协程版本，缓存发生变化时在线程中保存到数据库，不阻塞事件循环"""
+        if self._cache_set(session_id, asset_group_id):
+            await asyncio.to_thread(self._save, session_id, asset_group_id)
+
+    def invalidate(self, session_id: str):
+        """清除会话的assetGroupId缓存，包括数据库中保存的值"""
+        if self._cache_invalidate(session_id):
+            self._save(session_id, None)
+
+    async def invalidate_async(self, session_id: str):
+        """invalidate的协程版本，在线程中清除数据库中保存的值"""
+        if self._cache_invalidate(session_id):
+            await asyncio.to_thread(self._save, session_id, None)
+
+    def _cache_set(self, session_id: str, asset_group_id: str) -> bool:
+        """更新内存缓存，返回缓存是否发生变化"""
+        with self._lock:
+            if self._cache.get(session_id) == asset_group_id:
+                return False
+            self._cache[session_id] = asset_group_id
+            return True
+
+    def _cache_invalidate(self, session_id: str) -> bool:
+        """清除内存缓存，返回之前是否有缓存"""
+        with self._lock:
+            if self._cache.pop(session_id, None) is None:
+                return False
+            self._invalidations += 1
+        logger.info(f"清除会话 {session_id} 的assetGroupId缓存")
+        return True
+
+    def _save(self, session_id: str, asset_group_id: Optional[str]):
+        """保存会话的assetGroupId到数据库，None表示清除"""
+        try:
+            RunwaySession.update(asset_group_id=asset_group_id).where(RunwaySession.session_id == session_id).execute()
+        except Exception as e:
+            # 只影响重启后的预热，内存缓存仍然有效
+            logger.error(f"{'保存' if asset_group_id else '清除'}会话 {session_id} 的assetGroupId失败: {str(e)}")
+
+    def get_stats(self) -> dict:
+        """获取缓存大小和命中率"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._cache),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else None,
+                "invalidations": self._invalidations
+            }
+
+
+# 全局assetGroupId缓存
+asset_group_cache = AssetGroupCache()
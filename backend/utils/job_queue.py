@@ -0,0 +1,376 @@
+import collections
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from loguru import logger
+from models import db, Job
+from utils.thread_pool import ThreadPool, Task, PoolSaturatedError, TaskTimeoutError, global_thread_pool
+
+# 任务状态
+JOB_PENDING = 0
+JOB_RUNNING = 1
+JOB_SUCCEEDED = 2
+JOB_FAILED = 3
+JOB_CANCELLED = 4
+
+
+class JobQueue:
+    """
+    基于MySQL的持久化任务队列
+    
+    任务先写入 job_queue 表，再由后台线程以 SELECT ... FOR UPDATE SKIP LOCKED 领取并带租约提交到线程池执行。
+    执行中的任务会定期续约，进程退出后租约过期的任务会被重新领取，重启不会丢失排队中的任务。
+    """
+    def __init__(self, pool: ThreadPool, lease_seconds: int = 60, poll_interval: float = 1.0, prefetch: int = 50,
+                 max_attempts: int = 3):
+        """
+        初始化持久化任务队列
+        
+        Args:
+            pool: 执行任务的线程池
+            lease_seconds: 租约时长（秒），持有进程需在过期前续约
+            poll_interval: 没有待执行任务时轮询数据库的间隔（秒）
+            prefetch: 超出线程池空闲容量额外领取的任务数，使线程池的公平调度有任务可排
+            max_attempts: 最大领取次数，租约反复过期（如任务导致进程崩溃）的任务超过该次数后标记为失败
+        """
+        self.pool = pool
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.prefetch = prefetch
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, Callable] = {}
+        self._timeouts: Dict[str, Optional[float]] = {}
+        self._failure_hooks: Dict[str, Callable] = {}
+        self._timed_out_count = 0
+        self._claimed: Dict[int, Task] = {}  # 本进程领取且未结束的任务
+        self._claimed_keys: Dict[int, str] = {}  # 本进程领取的任务ID -> 业务键
+        self._claimed_lock = threading.Lock()
+        self._finished = collections.deque()  # 已结束待回写状态的任务: (任务ID, 状态, 失败原因)
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_renew_time = 0.0
+        self._pending_count = 0
+        self._pending_count_time = 0.0
+    
+    def register(self, job_type: str, func: Callable, timeout: Optional[float] = None,
+                 on_failed: Optional[Callable] = None):
+        """
+        注册任务类型对应的处理函数
+        
+        Args:
+            job_type: 任务类型
+            func: 处理函数，参数与入队时的args一致
+            timeout: 单次执行的截止时间（秒），超时的任务会被线程池终止并标记为失败，为None时不限制
+            on_failed: 处理函数没有机会执行完时（超过最大重试次数、无法提交）队列直接放弃任务后调用，
+                参数与入队时的args一致，用于把业务记录标记为失败
+        """
+        self._handlers[job_type] = func
+        self._timeouts[job_type] = timeout
+        if on_failed is not None:
+            self._failure_hooks[job_type] = on_failed
+    
+    def enqueue(self, job_type: str, args: tuple = (), owner_id: Optional[int] = None, weight: float = 1.0,
+                job_key: Optional[str] = None) -> int:
+        """
+        将任务写入持久化队列
+        
+        Args:
+            job_type: 任务类型，必须已注册
+            args: 处理函数的位置参数，需可JSON序列化
+            owner_id: 任务归属用户ID，用于公平调度
+            weight: 公平调度权重
+            job_key: 业务键（如 generate_video:任务ID:类型），用于按业务记录查找任务
+            
+        Returns:
+            int: 任务ID
+        """
+        if job_type not in self._handlers:
+            raise ValueError(f"未注册的任务类型: {job_type}")
+        job = Job.create(
+            job_type=job_type,
+            payload=json.dumps(list(args), ensure_ascii=False),
+            owner_id=owner_id,
+            weight=weight,
+            job_key=job_key
+        )
+        self._pending_count += 1
+        self._wakeup.set()
+        logger.info(f"任务已写入持久化队列，任务ID: {job.id}, 类型: {job_type}")
+        return job.id
+    
+    def has_active_job(self, job_key: str) -> bool:
+        """
+        判断业务键对应的任务是否在待执行或执行中
+        
+        Args:
+            job_key: 业务键
+        """
+        return Job.select().where(
+            (Job.job_key == job_key) & (Job.status.in_([JOB_PENDING, JOB_RUNNING]))
+        ).exists()
+    
+    def cancel(self, job_key: str) -> int:
+        """
+        取消业务键对应的待执行和执行中任务
+        
+        本进程持有的任务立即取消；其他进程持有的任务在其下次续约时发现状态变化后取消。
+        
+        Args:
+            job_key: 业务键
+            
+        Returns:
+            int: 被取消的任务数量
+        """
+        count = (Job
+                 .update(status=JOB_CANCELLED, updated_at=datetime.now())
+                 .where((Job.job_key == job_key) & (Job.status.in_([JOB_PENDING, JOB_RUNNING])))
+                 .execute())
+        with self._claimed_lock:
+            tasks = [self._claimed[job_id] for job_id, key in self._claimed_keys.items() if key == job_key]
+        for task in tasks:
+            task.cancel()
+        if count:
+            logger.info(f"已取消任务，业务键: {job_key}, 数量: {count}")
+        return count
+    
+    def get_pending_count(self, max_age: float = 1.0) -> int:
+        """
+        获取待执行的任务数量（缓存max_age秒，避免每个请求都查询数据库）
+        
+        Args:
+            max_age: 缓存有效期（秒）
+        """
+        now = time.time()
+        if now - self._pending_count_time > max_age:
+            self._pending_count = Job.select().where(Job.status == JOB_PENDING).count()
+            self._pending_count_time = now
+        return self._pending_count
+    
+    def check_admission(self, count: int = 1):
+        """
+        准入检查，积压任务过多时快速失败
+        
+        Args:
+            count: 即将入队的任务数量
+            
+        Raises:
+            PoolSaturatedError: 待执行任务数超过线程池准入上限
+        """
+        queue_depth = self.get_pending_count() + self.pool.get_queue_size()
+        if self.pool.max_pending and queue_depth + count > self.pool.max_pending:
+            overflow = queue_depth + count - self.pool.max_pending
+            retry_after = min(300, max(1, int(self.pool.async_engine.estimate_wait(overflow)) + 1))
+            logger.warning(f"持久化队列积压过多，拒绝新任务，积压任务数: {queue_depth}")
+            raise PoolSaturatedError(queue_depth, retry_after)
+    
+    def start(self):
+        """启动后台领取线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="JobQueue", daemon=True)
+        self._thread.start()
+        logger.info(f"持久化任务队列已启动，进程标识: {self.worker_id}")
+    
+    def stop(self):
+        """停止后台领取线程，已领取的任务租约到期后会被其他进程接管"""
+        self._stop_event.set()
+        self._wakeup.set()
+    
+    def _run(self):
+        """后台线程主循环：回收过期租约、续约、领取新任务"""
+        while not self._stop_event.is_set():
+            claimed = 0
+            try:
+                self._flush_finished()
+                self._reclaim_expired()
+                self._renew_leases()
+                claimed = self._claim_and_submit()
+            except Exception as e:
+                logger.error(f"持久化任务队列处理异常: {str(e)}")
+                logger.error(traceback.format_exc())
+            # 本轮领取到任务则立即继续，尽快排空积压
+            if claimed == 0:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+    
+    def _reclaim_expired(self):
+        """将租约已过期的执行中任务放回待执行状态"""
+        expired = (Job.status == JOB_RUNNING) & (Job.lease_expires_at < datetime.now())
+        exhausted = list(Job.select().where(expired & (Job.attempts >= self.max_attempts)))
+        if exhausted:
+            failed = (Job
+                      .update(status=JOB_FAILED, error="超过最大重试次数", lease_owner=None, lease_expires_at=None,
+                              updated_at=datetime.now())
+                      .where((Job.id.in_([job.id for job in exhausted])) & (Job.status == JOB_RUNNING))
+                      .execute())
+            logger.error(f"{failed} 个任务超过最大重试次数，已标记为失败")
+            for job in exhausted:
+                self._run_failure_hook(job)
+        count = (Job
+                 .update(status=JOB_PENDING, lease_owner=None, lease_expires_at=None, updated_at=datetime.now())
+                 .where(expired)
+                 .execute())
+        if count:
+            logger.warning(f"回收 {count} 个租约过期的任务")
+    
+    def _renew_leases(self):
+        """为本进程持有的任务续约，并取消已被其他进程标记为取消的任务"""
+        now = time.time()
+        if now - self._last_renew_time < self.lease_seconds / 3:
+            return
+        with self._claimed_lock:
+            job_ids = list(self._claimed.keys())
+        if job_ids:
+            (Job
+             .update(lease_expires_at=datetime.now() + timedelta(seconds=self.lease_seconds), updated_at=datetime.now())
+             .where((Job.id.in_(job_ids)) & (Job.lease_owner == self.worker_id) & (Job.status == JOB_RUNNING))
+             .execute())
+            cancelled_ids = [job.id for job in Job.select(Job.id).where(
+                (Job.id.in_(job_ids)) & (Job.status == JOB_CANCELLED))]
+            with self._claimed_lock:
+                tasks = [self._claimed[job_id] for job_id in cancelled_ids if job_id in self._claimed]
+            for task in tasks:
+                task.cancel()
+        self._last_renew_time = now
+    
+    def _claim_and_submit(self) -> int:
+        """
+        按线程池空闲容量领取待执行任务并提交
+        
+        Returns:
+            int: 本次领取的任务数量
+        """
+        with self._claimed_lock:
+            # 只统计已提交但还没有开始执行的任务，执行中或延迟等待中的任务不再占用预取名额
+            in_memory = sum(1 for task in self._claimed.values() if not task.started)
+        engine = self.pool.async_engine
+        # 引擎排队的任务中扣除本进程领取的部分，剩下的是其他来源提交的任务
+        other_pending = max(0, engine.get_pending_count() - in_memory)
+        free_slots = max(0, engine.concurrency_limit - engine.get_running_count() - other_pending)
+        limit = free_slots + self.prefetch - in_memory
+        if limit <= 0:
+            return 0
+        
+        jobs = self._claim(limit)
+        for job in jobs:
+            self._submit(job)
+        return len(jobs)
+    
+    def _claim(self, limit: int) -> List[Job]:
+        """
+        领取待执行任务，多进程间通过 SKIP LOCKED 避免重复领取
+        
+        Args:
+            limit: 最多领取的任务数
+        """
+        with db.atomic():
+            jobs = list(Job
+                        .select()
+                        .where(Job.status == JOB_PENDING)
+                        .order_by(Job.id)
+                        .limit(limit)
+                        .for_update('FOR UPDATE SKIP LOCKED'))
+            if not jobs:
+                return []
+            (Job
+             .update(status=JOB_RUNNING,
+                     lease_owner=self.worker_id,
+                     lease_expires_at=datetime.now() + timedelta(seconds=self.lease_seconds),
+                     attempts=Job.attempts + 1,
+                     updated_at=datetime.now())
+             .where(Job.id.in_([job.id for job in jobs]))
+             .execute())
+        self._pending_count = max(0, self._pending_count - len(jobs))
+        logger.info(f"从持久化队列领取 {len(jobs)} 个任务")
+        return jobs
+    
+    def _submit(self, job: Job):
+        """将领取到的任务提交到线程池"""
+        handler = self._handlers.get(job.job_type)
+        if handler is None:
+            logger.error(f"任务 {job.id} 的类型 {job.job_type} 没有注册处理函数")
+            self._finish(job.id, JOB_FAILED, f"未注册的任务类型: {job.job_type}")
+            self._run_failure_hook(job)
+            return
+        args = tuple(json.loads(job.payload))
+        task = Task(handler, args, owner=job.owner_id, weight=job.weight, timeout=self._timeouts.get(job.job_type))
+        with self._claimed_lock:
+            self._claimed[job.id] = task
+            if job.job_key:
+                self._claimed_keys[job.id] = job.job_key
+        future = self.pool.submit_task(task)
+        future.add_done_callback(lambda f, job_id=job.id: self._on_done(job_id, f))
+    
+    def _run_failure_hook(self, job: Job):
+        """队列放弃任务时调用注册的失败回调，把业务记录标记为失败，回调异常只记录日志"""
+        hook = self._failure_hooks.get(job.job_type)
+        if hook is None:
+            return
+        try:
+            hook(*json.loads(job.payload))
+        except Exception as e:
+            logger.error(f"任务 {job.id} 的失败回调执行异常: {str(e)}")
+    
+    def _on_done(self, job_id: int, future: Future):
+        """任务结束回调，结果交给后台线程回写，避免在事件循环中访问数据库"""
+        with self._claimed_lock:
+            self._claimed.pop(job_id, None)
+            self._claimed_keys.pop(job_id, None)
+        if future.cancelled():
+            self._finished.append((job_id, JOB_CANCELLED, None))
+            self._wakeup.set()
+            return
+        error = future.exception()
+        if isinstance(error, TaskTimeoutError):
+            self._timed_out_count += 1
+            logger.error(f"任务 {job_id} 超时: {str(error)}")
+        if error is None:
+            self._finished.append((job_id, JOB_SUCCEEDED, None))
+        else:
+            self._finished.append((job_id, JOB_FAILED, str(error)))
+        self._wakeup.set()
+    
+    def _flush_finished(self):
+        """回写已结束任务的状态"""
+        while self._finished:
+            job_id, status, error = self._finished.popleft()
+            try:
+                self._finish(job_id, status, error)
+            except Exception as e:
+                logger.error(f"更新任务 {job_id} 状态失败: {str(e)}")
+    
+    def _finish(self, job_id: int, status: int, error: Optional[str] = None):
+        """更新任务最终状态并释放租约"""
+        (Job
+         .update(status=status, error=error, lease_owner=None, lease_expires_at=None, updated_at=datetime.now())
+         .where((Job.id == job_id) & (Job.lease_owner == self.worker_id))
+         .execute())
+    
+    def get_timed_out_count(self) -> int:
+        """获取超时失败的任务总数（所有进程）"""
+        return Job.select().where((Job.status == JOB_FAILED) & (Job.error.startswith("任务超时"))).count()
+    
+    def get_stats(self) -> dict:
+        """获取持久化任务队列的统计信息"""
+        with self._claimed_lock:
+            claimed = len(self._claimed)
+        return {
+            "worker_id": self.worker_id,
+            "pending": self._pending_count,
+            "claimed": claimed,
+            "timed_out": self._timed_out_count
+        }
+
+
+# 全局持久化任务队列
+job_queue = JobQueue(global_thread_pool)
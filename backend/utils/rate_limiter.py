@@ -0,0 +1,326 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Hashable, Optional
+from loguru import logger
+
+
+class TokenBucket:
+    """
+    令牌桶
+
+    获取令牌时立即预约（令牌数可以为负），返回需要等待的时间，调用方在锁外等待，
+    多个线程同时获取时按预约先后依次放行，不会同时醒来再次争抢。
+    预约后的等待时间超过max_wait时拒绝预约，令牌赤字不会无限增长。
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_wait: float = 30.0):
+        """
+        Args:
+            rate: 每秒产生的令牌数
+            capacity: 桶容量，即允许的突发请求数，默认与rate相同（至少为1）
+            max_wait: 预约后最多需要等待的秒数
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.max_wait = max_wait
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        # 限流暂停期间_updated_at被推迟到暂停结束，此前不产生令牌
+        if now <= self._updated_at:
+            return
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, now: float) -> Optional[float]:
+        """
+        预约一个令牌
+
+        Returns:
+            float | None: 需要等待的秒数，等待时间会超过max_wait时不预约并返回None
+        """
+        self._refill(now)
+        tokens = self._tokens - 1
+        wait = 0.0 if tokens >= 0 else -tokens / self.rate
+        if wait > self.max_wait:
+            return None
+        self._tokens = tokens
+        return self._pause(now) + wait
+
+    def _pause(self, now: float) -> float:
+        """距离开始产生令牌的秒数，只在限流暂停期间大于0"""
+        return max(0.0, self._updated_at - now)
+
+    def refund(self, now: float):
+        """归还一个已预约但没有使用的令牌"""
+        self._refill(now)
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    def wait_time(self, now: float) -> float:
+        """不预约令牌，查询获取下一个令牌需要等待的秒数"""
+        self._refill(now)
+        return self._pause(now) + (0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """
+    自适应速率的令牌桶（AIMD）
+
+    请求成功时速率加性增长，被限流时速率乘性减小，并在Retry-After期间暂停放行，
+    使速率稳定在上游限制之下，而不是反复撞上限流。
+    """
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float = 0.05,
+                 decrease: float = 0.5, max_wait: float = 30.0):
+        """
+        Args:
+            rate: 初始速率（每秒请求数）
+            min_rate: 最低速率
+            max_rate: 最高速率
+            increase: 每次成功请求增加的速率
+            decrease: 被限流时速率的缩减系数
+            max_wait: 预约后最多需要等待的秒数（不含Retry-After暂停）
+        """
+        super().__init__(rate, capacity=max(1.0, rate), max_wait=max_wait)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.blocked_until = 0.0
+        self.throttled_count = 0
+
+    def _set_rate(self, rate: float):
+        self.rate = min(self.max_rate, max(self.min_rate, rate))
+        self.capacity = max(1.0, self.rate)
+
+    def reserve(self, now: float) -> Optional[float]:
+        wait = super().reserve(now)
+        return None if wait is None else max(wait, self.blocked_until - now)
+
+    def wait_time(self, now: float) -> float:
+        return max(super().wait_time(now), self.blocked_until - now)
+
+    def on_success(self, now: float):
+        """请求成功，速率加性增长"""
+        self._refill(now)
+        self._set_rate(self.rate + self.increase)
+
+    def on_throttle(self, now: float, retry_after: Optional[float] = None):
+        """
+        请求被限流，速率乘性减小，并在retry_after秒内暂停放行
+
+        Args:
+            now: 当前单调时钟时间
+            retry_after: 上游返回的Retry-After（秒），没有时按新速率暂停一个令牌间隔
+        """
+        self._refill(now)
+        self.throttled_count += 1
+        self._set_rate(self.rate * self.decrease)
+        pause = retry_after if retry_after is not None else 1 / self.rate
+        self.blocked_until = max(self.blocked_until, now + pause)
+        # 清空桶内积攒的令牌，并从暂停结束时才开始产生令牌，暂停期间的预约在恢复后按新速率依次放行
+        self._tokens = min(self._tokens, 0.0)
+        self._updated_at = max(self._updated_at, self.blocked_until)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After响应头
+
+    Args:
+        value: 秒数或HTTP日期
+
+    Returns:
+        float | None: 需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RunwayRateLimiter:
+    """
+    Runway接口的限流器
+
+    每次请求需同时获得全局令牌和所属账号（以团队ID区分）的令牌。查询任务状态的轮询请求使用单独的全局令牌桶，
+    大量任务同时轮询时不会挤占创建任务、上传等请求的全局额度，账号令牌桶仍然共用。
+    速率根据429响应和Retry-After自动调整：账号被限流时只降低该账号的速率，全局速率小幅回退。
+    排队等待超过max_wait时不预约，调用方稍后重试；协程等待期间被取消时归还预约的令牌。
+    """
+    def __init__(self, global_rate: float = 20.0, account_rate: float = 1.0, max_account_rate: float = 5.0,
+                 min_account_rate: float = 0.05, poll_rate: float = 10.0, max_wait: float = 30.0):
+        """
+        Args:
+            global_rate: 全局初始速率（每秒请求数）
+            account_rate: 单个账号的初始速率
+            max_account_rate: 单个账号的最高速率
+            min_account_rate: 单个账号的最低速率
+            poll_rate: 轮询请求的全局初始速率
+            max_wait: 预约后最多需要等待的秒数
+        """
+        self._lock = threading.Lock()
+        self._max_wait = max_wait
+        self._global = AdaptiveTokenBucket(global_rate, min_rate=global_rate / 10, max_rate=global_rate * 2,
+                                           decrease=0.9, max_wait=max_wait)
+        self._poll = AdaptiveTokenBucket(poll_rate, min_rate=poll_rate / 10, max_rate=poll_rate * 2,
+                                         decrease=0.9, max_wait=max_wait)
+        self._account_rate = account_rate
+        self._max_account_rate = max_account_rate
+        self._min_account_rate = min_account_rate
+        self._accounts: Dict[Hashable, AdaptiveTokenBucket] = {}
+        self._rejected_count = 0  # 因排队过长被拒绝预约的次数
+
+    def _bucket(self, key: Hashable) -> AdaptiveTokenBucket:
+        """获取账号的令牌桶，不存在时创建（调用方需持有锁）"""
+        bucket = self._accounts.get(key)
+        if bucket is None:
+            bucket = self._accounts[key] = AdaptiveTokenBucket(
+                self._account_rate, min_rate=self._min_account_rate, max_rate=self._max_account_rate,
+                max_wait=self._max_wait
+            )
+        return bucket
+
+    def reserve(self, key: Optional[Hashable] = None, poll: bool = False) -> Optional[float]:
+        """
+        预约一次请求
+
+        Args:
+            key: 账号标识（团队ID），为None时只受全局速率限制
+            poll: 是否为轮询请求，轮询请求使用单独的全局令牌桶
+
+        Returns:
+            float | None: 需要等待的秒数，排队等待会超过max_wait时不预约并返回None
+        """
+        now = time.monotonic()
+        with self._lock:
+            global_bucket = self._poll if poll else self._global
+            wait = global_bucket.reserve(now)
+            if wait is not None and key is not None:
+                account_wait = self._bucket(key).reserve(now)
+                if account_wait is None:
+                    global_bucket.refund(now)
+                    wait = None
+                else:
+                    wait = max(wait, account_wait)
+            if wait is None:
+                self._rejected_count += 1
+            return wait
+
+    def refund(self, key: Optional[Hashable] = None, poll: bool = False):
+        """
+        归还已预约但没有发出的请求的令牌（如等待期间被取消）
+
+        Args:
+            key: 账号标识（团队ID）
+            poll: 是否为轮询请求
+        """
+        now = time.monotonic()
+        with self._lock:
+            (self._poll if poll else self._global).refund(now)
+            if key is not None:
+                self._bucket(key).refund(now)
+
+    def wait_time(self, key: Optional[Hashable] = None, poll: bool = False) -> float:
+        """
+        查询下一次请求需要等待的秒数，不预约
+
+        Args:
+            key: 账号标识（团队ID）
+            poll: 是否为轮询请求
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait = (self._poll if poll else self._global).wait_time(now)
+            if key is not None:
+                wait = max(wait, self._bucket(key).wait_time(now))
+            return wait
+
+    def _retry_delay(self, key: Optional[Hashable], poll: bool) -> float:
+        """预约被拒绝后重试前的等待时间，加上随机抖动避免被拒绝的调用方同时醒来"""
+        return max(0.1, self.wait_time(key, poll) - self._max_wait) + random.uniform(0, 1)
+
+    def acquire(self, key: Optional[Hashable] = None, poll: bool = False):
+        """获取请求许可，需要等待时阻塞当前线程"""
+        wait = self.reserve(key, poll)
+        while wait is None:
+            time.sleep(self._retry_delay(key, poll))
+            wait = self.reserve(key, poll)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self, key: Optional[Hashable] = None, poll: bool = False):
+        """获取请求许可，需要等待时挂起当前协程，等待期间被取消时归还令牌"""
+        wait = self.reserve(key, poll)
+        while wait is None:
+            await asyncio.sleep(self._retry_delay(key, poll))
+            wait = self.reserve(key, poll)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.refund(key, poll)
+                raise
+
+    def observe(self, key: Optional[Hashable], response, poll: bool = False) -> bool:
+        """
+        根据响应调整速率
+
+        Args:
+            key: 账号标识（团队ID）
+            response: requests或httpx的响应对象
+            poll: 是否为轮询请求，调整对应的全局令牌桶
+
+        Returns:
+            bool: 响应是否为429限流
+        """
+        now = time.monotonic()
+        with self._lock:
+            global_bucket = self._poll if poll else self._global
+            if response.status_code == 429:
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                global_bucket.on_throttle(now)
+                if key is not None:
+                    bucket = self._bucket(key)
+                    bucket.on_throttle(now, retry_after)
+                    logger.warning(f"Runway限流，账号 {key} 速率降为 {bucket.rate:.2f}/s，Retry-After: {retry_after}")
+                return True
+            if response.status_code < 400:
+                global_bucket.on_success(now)
+                if key is not None:
+                    self._bucket(key).on_success(now)
+            return False
+
+    def get_stats(self) -> dict:
+        """获取全局和各账号的当前速率"""
+        with self._lock:
+            return {
+                "global_rate": round(self._global.rate, 2),
+                "global_throttled": self._global.throttled_count,
+                "poll_rate": round(self._poll.rate, 2),
+                "poll_throttled": self._poll.throttled_count,
+                "rejected": self._rejected_count,
+                "accounts": {
+                    str(key): {"rate": round(bucket.rate, 2), "throttled": bucket.throttled_count}
+                    for key, bucket in self._accounts.items()
+                }
+            }
+
+
+# 全局Runway限流器
+runway_limiter = RunwayRateLimiter(
+    global_rate=float(os.getenv("RUNWAY_GLOBAL_RATE", "20")),
+    account_rate=float(os.getenv("RUNWAY_ACCOUNT_RATE", "1")),
+    max_account_rate=float(os.getenv("RUNWAY_MAX_ACCOUNT_RATE", "5")),
+    poll_rate=float(os.getenv("RUNWAY_POLL_RATE", "10")),
+    max_wait=float(os.getenv("RUNWAY_LIMITER_MAX_WAIT", "30"))
+)
@@ -0,0 +1,344 @@
+import asyncio
+import collections
+import os
+import threading
+from typing import Any, Dict, Optional
+import aiofiles
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from loguru import logger
+from scripts.config import USER_AGENT
+from utils.rate_limiter import runway_limiter
+
+API_BASE_URL = "https://api.runwayml.com/v1"
+
+
+class RunwayClient:
+    """
+    Runway HTTP客户端
+
+    按账号(as_team_id)复用requests.Session，同一账号的请求复用keep-alive连接，
+    省去每次请求的TCP和TLS握手；统一设置公共请求头、连接/读取超时和重试策略，
+    并在每次请求前后经过Runway限流器。上传到存储预签名链接的请求使用单独的会话，不经过限流器。
+    """
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 60, retries: int = 2,
+                 pool_maxsize: int = 10, max_sessions: int = 256):
+        """
+        Args:
+            connect_timeout: 连接超时（秒）
+            read_timeout: 读取超时（秒）
+            retries: 连接失败和网关错误(502/503/504)的重试次数，只对GET/PUT/DELETE重试网关错误，
+                创建任务等POST请求不会被重复提交
+            pool_maxsize: 每个会话对同一主机保持的最大连接数
+            max_sessions: 最多保留的账号会话数，超出时丢弃最久未使用的会话
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.pool_maxsize = pool_maxsize
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._sessions: "collections.OrderedDict[Any, requests.Session]" = collections.OrderedDict()  # as_team_id -> 会话
+        self._upload_session = self._new_session()
+        self._request_count = 0
+        self._error_count = 0
+        self._evicted_count = 0
+
+    def _new_session(self) -> requests.Session:
+        """创建带连接池和重试策略的会话"""
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,
+            status=self.retries,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"GET", "PUT", "DELETE"}),
+            backoff_factor=0.5,
+            raise_on_status=False,
+            respect_retry_after_header=False
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_maxsize, max_retries=retry)
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update({
+            "Accept": "application/json",
+            "User-Agent": USER_AGENT
+        })
+        return session
+
+    def session(self, key: Any = None) -> requests.Session:
+        """
+        获取账号的会话，不存在时创建
+
+        被丢弃的会话不主动关闭，正在使用它的请求可以正常完成，之后由垃圾回收关闭连接。
+
+        Args:
+            key: 账号的as_team_id，None表示不属于任何账号的请求（登录等）
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+            session = self._sessions[key] = self._new_session()
+            if len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._evicted_count += 1
+            return session
+
+    def request(self, method: str, url: str, account: Optional[Dict[str, Any]] = None,
+                team_id: Any = None, poll: bool = False, **kwargs) -> requests.Response:
+        """
+        发送Runway API请求
+
+        Args:
+            method: HTTP方法
+            url: 请求地址
+            account: 账号信息，按其as_team_id选择会话和限流桶
+            team_id: 未传account时用于选择会话和限流桶的团队ID，均为空时只经过全局限流
+            poll: 是否为查询任务状态的轮询请求，使用单独的全局限流额度
+            kwargs: 传给requests的其他参数，未指定timeout时使用默认超时
+
+        Returns:
+            requests.Response: 响应对象
+        """
+        key = account['as_team_id'] if account is not None else team_id
+        kwargs.setdefault("timeout", self.timeout)
+        session = self.session(key)
+        runway_limiter.acquire(key, poll)
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._request_count += 1
+                self._error_count += 1
+            raise
+        with self._lock:
+            self._request_count += 1
+        runway_limiter.observe(key, response, poll)
+        return response
+
+    def get(self, url: str, account: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request("GET", url, account, **kwargs)
+
+    def post(self, url: str, account: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request("POST", url, account, **kwargs)
+
+    def delete(self, url: str, account: Optional[Dict[str, Any]] = None, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, account, **kwargs)
+
+    def upload(self, url: str, **kwargs) -> requests.Response:
+        """
+        PUT上传文件到Runway返回的预签名链接，不经过Runway限流器
+
+        Args:
+            url: 预签名上传链接
+            kwargs: 传给requests的其他参数，未指定timeout时使用默认超时
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            response = self._upload_session.put(url, **kwargs)
+        except requests.RequestException:
+            with self._lock:
+                self._request_count += 1
+                self._error_count += 1
+            raise
+        with self._lock:
+            self._request_count += 1
+        return response
+
+    def get_stats(self) -> dict:
+        """获取会话数和请求统计"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "evicted_sessions": self._evicted_count,
+                "requests": self._request_count,
+                "errors": self._error_count
+            }
+
+
+class AsyncRunwayClient:
+    """
+    Runway异步HTTP客户端
+
+    与RunwayClient使用相同的公共请求头、超时和限流，基于httpx.AsyncClient，供生成流程在协程中直接调用。
+    Runway API和上传存储各用一个客户端，分别限制到各自主机的连接数。
+    httpx客户端绑定创建时的事件循环，因此在首次使用时创建，事件循环变化时重建，并在旧的事件循环中关闭旧客户端。
+    事件循环结束前应调用aclose关闭当前客户端（异步任务引擎通过关闭回调调用）。
+    """
+    def __init__(self, connect_timeout: float = 5, read_timeout: float = 60, retries: int = 2,
+                 max_connections: int = 100, max_keepalive_connections: int = 20, chunk_size: int = 64 * 1024):
+        """
+        Args:
+            connect_timeout: 连接超时（秒）
+            read_timeout: 读取超时（秒）
+            retries: 连接失败的重试次数，GET/PUT/DELETE请求遇到网关错误(502/503/504)时也按此次数重试
+            max_connections: 每个主机的最大连接数
+            max_keepalive_connections: 每个主机保持的最大空闲连接数
+            chunk_size: 流式上传时每次从磁盘读取的字节数
+        """
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.retries = retries
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections)
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._api_client: Optional[httpx.AsyncClient] = None
+        self._upload_client: Optional[httpx.AsyncClient] = None
+        self._request_count = 0
+        self._error_count = 0
+
+    def _new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            headers={"Accept": "application/json", "User-Agent": USER_AGENT},
+            timeout=self.timeout,
+            transport=httpx.AsyncHTTPTransport(retries=self.retries, limits=self.limits)
+        )
+
+    def _clients(self):
+        """获取当前事件循环的API和上传客户端"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                old_loop, old_clients = self._loop, (self._api_client, self._upload_client)
+                self._loop = loop
+                self._api_client = self._new_client()
+                self._upload_client = self._new_client()
+                if old_loop is not None:
+                    self._close_on(old_loop, old_clients)
+            return self._api_client, self._upload_client
+
+    def _close_on(self, loop: asyncio.AbstractEventLoop, clients: tuple):
+        """在客户端所属的事件循环中关闭它们，该事件循环已停止时只能丢弃，由垃圾回收关闭连接"""
+        if loop.is_closed() or not loop.is_running():
+            logger.debug("旧事件循环已停止，无法关闭其上的Runway客户端")
+            return
+        asyncio.run_coroutine_threadsafe(self._close_clients(clients), loop)
+
+    @staticmethod
+    async def _close_clients(clients: tuple):
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.error(f"关闭Runway客户端失败: {str(e)}")
+
+    async def aclose(self):
+        """关闭当前事件循环的客户端，需在创建它们的事件循环中调用，之后再次使用时重新创建"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._loop is not loop:
+                return
+            clients = (self._api_client, self._upload_client)
+            self._loop = self._api_client = self._upload_client = None
+        await self._close_clients(clients)
+
+    async def _send(self, client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        """发送请求，幂等请求遇到网关错误时退避重试"""
+        attempt = 0
+        while True:
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.HTTPError:
+                self._request_count += 1
+                self._error_count += 1
+                raise
+            self._request_count += 1
+            if (response.status_code not in (502, 503, 504) or method not in ("GET", "PUT", "DELETE")
+                    or attempt >= self.retries):
+                return response
+            attempt += 1
+            logger.warning(f"Runway请求返回 {response.status_code}，第 {attempt} 次重试: {method} {url}")
+            await asyncio.sleep(0.5 * 2 ** (attempt - 1))
+
+    async def request(self, method: str, url: str, account: Optional[Dict[str, Any]] = None,
+                      team_id: Any = None, poll: bool = False, **kwargs) -> httpx.Response:
+        """
+        发送Runway API请求
+
+        Args:
+            method: HTTP方法
+            url: 请求地址
+            account: 账号信息，按其as_team_id选择限流桶
+            team_id: 未传account时用于选择限流桶的团队ID，均为空时只经过全局限流
+            poll: 是否为查询任务状态的轮询请求，使用单独的全局限流额度
+            kwargs: 传给httpx的其他参数
+
+        Returns:
+            httpx.Response: 响应对象
+        """
+        key = account['as_team_id'] if account is not None else team_id
+        api_client, _ = self._clients()
+        await runway_limiter.acquire_async(key, poll)
+        response = await self._send(api_client, method, url, **kwargs)
+        runway_limiter.observe(key, response, poll)
+        return response
+
+    async def get(self, url: str, account: Optional[Dict[str, Any]] = None, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, account, **kwargs)
+
+    async def post(self, url: str, account: Optional[Dict[str, Any]] = None, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, account, **kwargs)
+
+    async def delete(self, url: str, account: Optional[Dict[str, Any]] = None, **kwargs) -> httpx.Response:
+        return await self.request("DELETE", url, account, **kwargs)
+
+    async def upload(self, url: str, file_path: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        从磁盘流式PUT上传文件到Runway返回的预签名链接，不把整个文件读入内存，不经过Runway限流器
+
+        Args:
+            url: 预签名上传链接
+            file_path: 本地文件路径
+            headers: 请求头，未指定Content-Length时按文件大小设置（预签名链接不支持分块传输）
+        """
+        headers = dict(headers or {})
+        headers.setdefault("Content-Length", str(os.path.getsize(file_path)))
+        _, upload_client = self._clients()
+
+        async def chunks():
+            async with aiofiles.open(file_path, 'rb') as f:
+                while True:
+                    chunk = await f.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        # 流式请求体只能发送一次，因此不在_send中重试
+        try:
+            response = await upload_client.put(url, content=chunks(), headers=headers)
+        except httpx.HTTPError:
+            self._request_count += 1
+            self._error_count += 1
+            raise
+        self._request_count += 1
+        return response
+
+    def get_stats(self) -> dict:
+        """获取请求统计"""
+        return {
+            "requests": self._request_count,
+            "errors": self._error_count
+        }
+
+
+# 全局Runway客户端
+runway_client = RunwayClient(
+    connect_timeout=float(os.getenv("RUNWAY_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.getenv("RUNWAY_READ_TIMEOUT", "60")),
+    retries=int(os.getenv("RUNWAY_HTTP_RETRIES", "2")),
+    pool_maxsize=int(os.getenv("RUNWAY_POOL_MAXSIZE", "10")),
+    max_sessions=int(os.getenv("RUNWAY_MAX_SESSIONS", "256"))
+)
+
+# 全局Runway异步客户端，供生成流程的协程使用
+async_runway_client = AsyncRunwayClient(
+    connect_timeout=float(os.getenv("RUNWAY_CONNECT_TIMEOUT", "5")),
+    read_timeout=float(os.getenv("RUNWAY_READ_TIMEOUT", "60")),
+    retries=int(os.getenv("RUNWAY_HTTP_RETRIES", "2")),
+    max_connections=int(os.getenv("RUNWAY_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("RUNWAY_MAX_KEEPALIVE", "20"))
+)
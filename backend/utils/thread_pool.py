@@ -3,20 +3,152 @@ import queue
 import time
 import traceback
 import asyncio
-from typing import Callable, Any, List, Optional
-from concurrent.futures import Future
+import collections
+import heapq
+import itertools
+import math
+import os
+from typing import Awaitable, Callable, Any, Dict, Hashable, List, Optional
+from concurrent.futures import Future, ThreadPoolExecutor
 from loguru import logger
 
+class PoolSaturatedError(Exception):
+    """线程池已饱和，拒绝接收新任务"""
+    def __init__(self, queue_depth: int, retry_after: int):
+        super().__init__(f"线程池已饱和，当前排队任务数: {queue_depth}，建议 {retry_after} 秒后重试")
+        self.queue_depth = queue_depth
+        self.retry_after = retry_after
+
+class TaskTimeoutError(Exception):
+    """任务超过截止时间仍未完成"""
+    def __init__(self, timeout: float):
+        super().__init__(f"任务超时: 超过 {timeout} 秒未完成")
+        self.timeout = timeout
+
+# 截止时间到达时取消协程任务使用的消息，任务可据此区分超时和主动取消
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+def is_deadline_exceeded(error: BaseException) -> bool:
+    """
+    判断协程任务收到的CancelledError是否由截止时间触发
+    
+    Args:
+        error: 捕获到的CancelledError
+    """
+    return bool(error.args) and error.args[0] == DEADLINE_EXCEEDED
+
+class Reschedule:
+    """
+    任务返回该对象表示"N秒后再执行我一次"
+    
+    任务会在延迟期间释放工作线程（或异步引擎的并发名额），到期后以相同参数重新入队，
+    Future保持不变。适用于可重入的任务，例如等待账号或轮询远端状态。
+    """
+    def __init__(self, delay: float):
+        self.delay = delay
+
 class Task:
     """表示要在线程池中执行的任务"""
-    def __init__(self, func: Callable, args: tuple = (), kwargs: dict = None):
+    def __init__(self, func: Callable, args: tuple = (), kwargs: dict = None,
+                 owner: Optional[Hashable] = None, weight: float = 1.0, timeout: Optional[float] = None):
+        """
+        Args:
+            func: 要执行的函数
+            args: 位置参数
+            kwargs: 关键字参数
+            owner: 任务归属（通常为用户ID），公平调度时按归属划分子队列
+            weight: 公平调度权重，权重越大每轮可出队的任务越多
+            timeout: 从首次开始执行起的最长耗时（秒），包括延迟重新执行的等待时间，为None时不限制
+        """
         self.func = func
         self.args = args
         self.kwargs = kwargs or {}
+        self.owner = owner
+        self.weight = weight
+        self.submitted_at = time.time()
         self.future = Future()
+        self.reschedule_count = 0
+        self.reschedule_delay: Optional[float] = None  # 本次执行返回Reschedule时的延迟
+        self.on_reschedule: Optional[Callable[["Task", float], None]] = None
+        self.cancelled = False
+        self.timeout = timeout
+        self.deadline: Optional[float] = None
+        self.timed_out = False
+        self.started = False  # 是否已被工作线程或异步引擎取出开始执行过
+        self._async_task: Optional[asyncio.Task] = None  # 正在事件循环中执行时对应的asyncio任务
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+    
+    def cancel(self) -> bool:
+        """
+        取消任务
+        
+        尚未开始执行（排队中或延迟等待中）的任务不会再执行；正在异步引擎中执行的协程任务
+        会在下一个await处收到CancelledError；正在工作线程中执行的同步任务无法中断，只标记为已取消。
+        
+        Returns:
+            bool: 任务已结束或已请求过取消时返回False
+        """
+        if self.future.done() or self.cancelled:
+            return False
+        self.cancelled = True
+        async_task, loop = self._async_task, self._loop
+        if async_task is not None and loop is not None:
+            loop.call_soon_threadsafe(async_task.cancel)
+        return True
+    
+    def _check_deadline(self) -> bool:
+        """
+        首次执行时确定截止时间，并检查是否已经超时
+        
+        Returns:
+            bool: 是否已超过截止时间
+        """
+        if self.timeout is None:
+            return False
+        if self.deadline is None:
+            self.deadline = time.time() + self.timeout
+        if time.time() >= self.deadline:
+            self.timed_out = True
+            logger.error(f"任务 {self.func.__name__} 超过截止时间 {self.timeout} 秒")
+            self.future.set_exception(TaskTimeoutError(self.timeout))
+            return True
+        return False
+    
+    def _on_deadline(self):
+        """截止时间到达，取消正在事件循环中执行的协程任务"""
+        if self._async_task is not None and not self.future.done():
+            self.timed_out = True
+            self._async_task.cancel(msg=DEADLINE_EXCEEDED)
+    
+    def _handle_result(self, result: Any) -> bool:
+        """
+        处理任务返回值
+        
+        Returns:
+            bool: 任务是否要求延迟后重新执行
+        """
+        if isinstance(result, Reschedule):
+            self.reschedule_count += 1
+            self.reschedule_delay = result.delay
+            logger.debug(f"任务 {self.func.__name__} 请求 {result.delay} 秒后重新执行，第 {self.reschedule_count} 次")
+            return True
+        self.reschedule_delay = None
+        return False
     
     def execute(self):
-        """执行任务并设置结果到future"""
+        """
+        在工作线程中执行任务并设置结果到future
+        
+        协程任务由线程池交给异步任务引擎执行，不会进入工作线程；直接调用时临时创建事件循环运行。
+        """
+        self.reschedule_delay = None
+        self.started = True
+        if self.cancelled:
+            self.future.cancel()
+            return
+        # 同步任务无法在执行中途中断，只在开始执行前检查截止时间
+        if self._check_deadline():
+            return
         try:
             logger.info(f"执行任务，函数: {self.func.__name__}, 参数: {self.args}, {self.kwargs}")
             # 确保函数被实际调用
@@ -26,6 +158,11 @@ class Task:
             else:
                 # 普通函数直接调用
                 result = self.func(*self.args, **self.kwargs)
+            if self._handle_result(result):
+                if self.on_reschedule is not None:
+                    self.on_reschedule(self, result.delay)
+                    return
+                raise RuntimeError("任务请求延迟重新执行，但没有可用的延迟调度器")
             logger.info(f"任务执行结果: {result}")
             self.future.set_result(result)
         except Exception as e:
@@ -33,6 +170,410 @@ class Task:
             logger.error(traceback.format_exc())
             self.future.set_exception(e)
 
+    async def execute_async(self):
+        """在事件循环中执行协程任务并设置结果到future"""
+        self.reschedule_delay = None
+        self.started = True
+        self._loop = asyncio.get_running_loop()
+        self._async_task = asyncio.current_task()
+        if self.cancelled:
+            self.future.cancel()
+            return
+        if self._check_deadline():
+            return
+        deadline_handle = None
+        if self.deadline is not None:
+            deadline_handle = self._loop.call_later(self.deadline - time.time(), self._on_deadline)
+        try:
+            logger.info(f"执行协程任务，函数: {self.func.__name__}, 参数: {self.args}, {self.kwargs}")
+            result = await self.func(*self.args, **self.kwargs)
+            if self._handle_result(result):
+                return
+            logger.info(f"协程任务执行结果: {result}")
+            self.future.set_result(result)
+        except asyncio.CancelledError:
+            if self.timed_out:
+                logger.error(f"协程任务 {self.func.__name__} 超过截止时间 {self.timeout} 秒，已终止")
+                self.future.set_exception(TaskTimeoutError(self.timeout))
+            else:
+                logger.info(f"协程任务 {self.func.__name__} 已取消")
+                self.future.cancel()
+        except Exception as e:
+            logger.error(f"协程任务执行异常: {str(e)}")
+            logger.error(traceback.format_exc())
+            self.future.set_exception(e)
+        finally:
+            self._async_task = None
+            if deadline_handle is not None:
+                deadline_handle.cancel()
+
+class DelayedScheduler(threading.Thread):
+    """
+    基于最小堆的延迟调度线程
+    
+    到期的回调在调度线程中执行，回调应只做入队等轻量操作。
+    """
+    def __init__(self, name: str = "DelayedScheduler"):
+        super().__init__(name=name, daemon=True)
+        self._heap: List[tuple] = []  # (到期时间, 序号, 回调)
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+    
+    def schedule(self, delay: float, callback: Callable[[], None]):
+        """
+        在delay秒后执行回调
+        
+        Args:
+            delay: 延迟秒数
+            callback: 到期时执行的回调
+        """
+        with self._condition:
+            heapq.heappush(self._heap, (time.monotonic() + max(0.0, delay), next(self._counter), callback))
+            self._condition.notify()
+    
+    def run(self):
+        """调度线程主循环，等待最早到期的回调"""
+        while True:
+            with self._condition:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, callback = heapq.heappop(self._heap)
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"延迟任务回调异常: {str(e)}")
+                logger.error(traceback.format_exc())
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+    
+    def stop(self):
+        """停止调度线程，未到期的回调被丢弃"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+class FairQueue(queue.Queue):
+    """
+    按任务归属划分子队列的公平调度队列
+    
+    使用赤字轮询（Deficit Round Robin）在各子队列之间出队：每轮为当前子队列补充与权重相等的额度，
+    每出队一个任务消耗1个额度，额度不足时轮到下一个子队列。单个用户大量提交任务时，
+    其他用户的任务不会被排在其后面长时间等待。接口与 queue.Queue 一致。
+    """
+    def _init(self, maxsize):
+        self._queues: Dict[Hashable, collections.deque] = {}  # 归属 -> 子队列
+        self._weights: Dict[Hashable, float] = {}
+        self._deficits: Dict[Hashable, float] = {}
+        self._active = collections.deque()  # 有待出队任务的归属，按轮询顺序排列
+        self._size = 0
+    
+    def _qsize(self):
+        return self._size
+    
+    def _put(self, task: Task):
+        owner = task.owner
+        sub_queue = self._queues.get(owner)
+        if sub_queue is None:
+            sub_queue = self._queues[owner] = collections.deque()
+            self._active.append(owner)
+            # 新加入轮询的归属，如果是唯一一个则直接获得本轮额度
+            self._deficits[owner] = task.weight if len(self._active) == 1 else 0.0
+        self._weights[owner] = max(task.weight, 0.1)
+        sub_queue.append(task)
+        self._size += 1
+    
+    def _get(self) -> Task:
+        while True:
+            owner = self._active[0]
+            if self._deficits[owner] >= 1:
+                self._deficits[owner] -= 1
+                sub_queue = self._queues[owner]
+                task = sub_queue.popleft()
+                self._size -= 1
+                if not sub_queue:
+                    # 子队列已空，退出轮询
+                    self._active.popleft()
+                    del self._queues[owner]
+                    del self._weights[owner]
+                    del self._deficits[owner]
+                    if self._active:
+                        self._deficits[self._active[0]] += self._weights[self._active[0]]
+                return task
+            # 当前归属额度用完，轮到下一个并补充额度
+            self._active.rotate(-1)
+            next_owner = self._active[0]
+            self._deficits[next_owner] += self._weights[next_owner]
+    
+    def get_owner_sizes(self) -> Dict[Hashable, int]:
+        """获取各归属当前排队的任务数量"""
+        with self.mutex:
+            return {owner: len(sub_queue) for owner, sub_queue in self._queues.items()}
+
+def _create_queue(scheduler: str, maxsize: int = 0) -> queue.Queue:
+    """
+    根据调度模式创建任务队列
+    
+    Args:
+        scheduler: fifo-先进先出，fair-按归属公平调度
+        maxsize: 队列最大长度，0表示无限
+    """
+    if scheduler == "fair":
+        return FairQueue(maxsize=maxsize)
+    return queue.Queue(maxsize=maxsize)
+
+class AsyncEngine:
+    """
+    异步任务引擎
+    
+    在一个常驻的事件循环线程上以协程方式执行任务，轮询等待期间不占用线程，
+    阻塞型IO通过 asyncio.to_thread 交给引擎自带的IO线程池执行。
+    """
+    def __init__(self, max_concurrency: int = 500, io_workers: int = 64, name: str = "AsyncEngine",
+                 scheduler: str = "fifo"):
+        """
+        初始化异步任务引擎
+        
+        Args:
+            max_concurrency: 同时运行的协程任务上限，超出的任务在引擎内排队
+            io_workers: 事件循环默认执行器（IO线程池）的线程数
+            name: 事件循环线程名称
+            scheduler: 排队任务的调度模式，fifo 或 fair
+        """
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency  # 当前生效的并发上限，可由线程池自动伸缩调整
+        self.io_workers = io_workers
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending = _create_queue(scheduler)  # 等待调度的任务
+        self._queue_waits = collections.deque(maxlen=1000)  # 最近任务的排队等待时间（秒）
+        self._running_count = 0  # 仅在事件循环线程中修改
+        self._delayed_count = 0  # 延迟后重新执行、当前不占用并发名额的任务数
+        self._cancelled_count = 0
+        self._timed_out_count = 0
+        self._started = threading.Event()
+        self.running = False
+        # 事件循环指标
+        self._completed_count = 0
+        self._failed_count = 0
+        self._loop_lag = 0.0  # 最近一次测得的事件循环调度延迟（秒）
+        self._max_loop_lag = 0.0
+        self._lag_check_interval = 1.0
+        self._avg_duration = 0.0  # 协程任务平均耗时（指数移动平均，秒）
+        self._shutdown_hooks: List[Callable[[], Awaitable[Any]]] = []
+    
+    def start(self):
+        """启动事件循环线程"""
+        if self.running:
+            return
+        self.running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix=f"{self.name}-IO")
+        self._started.clear()
+        self._thread = threading.Thread(target=self._run_loop, name=self.name, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        logger.info(f"异步任务引擎已启动，最大并发协程数: {self.max_concurrency}，IO线程数: {self.io_workers}")
+    
+    def _run_loop(self):
+        """事件循环线程主函数"""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(self._executor)
+        self.loop.call_soon(self._check_loop_lag, self.loop.time())
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.loop.close()
+    
+    def submit(self, task: Task) -> Future:
+        """
+        提交协程任务到引擎（线程安全）
+        
+        Args:
+            task: 包装了协程函数的任务
+            
+        Returns:
+            任务的Future对象
+        """
+        if not self.running:
+            self.start()
+        self._pending.put_nowait(task)
+        self.loop.call_soon_threadsafe(self._dispatch)
+        return task.future
+    
+    def _dispatch(self):
+        """在事件循环线程中调度排队任务，直到达到并发上限"""
+        while self._running_count < self.concurrency_limit:
+            try:
+                task = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            self._queue_waits.append(time.time() - task.submitted_at)
+            self._running_count += 1
+            self.loop.create_task(self._run_task(task))
+    
+    async def _run_task(self, task: Task):
+        """执行单个协程任务，结束后继续调度"""
+        start_time = self.loop.time()
+        try:
+            await task.execute_async()
+        finally:
+            self._running_count -= 1
+            duration = self.loop.time() - start_time
+            if task.reschedule_delay is not None:
+                # 任务请求延迟执行，释放并发名额，到期后重新排队
+                self._delayed_count += 1
+                self.loop.call_later(task.reschedule_delay, self._requeue, task)
+            else:
+                self._avg_duration = duration if self._avg_duration == 0 else self._avg_duration * 0.9 + duration * 0.1
+                if task.future.cancelled():
+                    self._cancelled_count += 1
+                elif task.future.exception() is None:
+                    self._completed_count += 1
+                else:
+                    self._failed_count += 1
+                    if task.timed_out:
+                        self._timed_out_count += 1
+            self._dispatch()
+    
+    def _requeue(self, task: Task):
+        """延迟到期，将任务重新放回排队队列"""
+        self._delayed_count -= 1
+        task.submitted_at = time.time()
+        self._pending.put_nowait(task)
+        self._dispatch()
+    
+    def _check_loop_lag(self, expected_time: float):
+        """定时回调，测量事件循环的调度延迟，延迟过大说明有阻塞调用占用了事件循环"""
+        lag = max(0.0, self.loop.time() - expected_time)
+        self._loop_lag = lag
+        self._max_loop_lag = max(self._max_loop_lag, lag)
+        if lag > 0.5:
+            logger.warning(f"异步任务引擎事件循环延迟过高: {lag:.3f} 秒")
+        next_time = self.loop.time() + self._lag_check_interval
+        self.loop.call_at(next_time, self._check_loop_lag, next_time)
+    
+    def get_stats(self) -> dict:
+        """获取异步任务引擎的事件循环指标"""
+        return {
+            "running": self._running_count,
+            "pending": self._pending.qsize(),
+            "delayed": self._delayed_count,
+            "max_concurrency": self.max_concurrency,
+            "concurrency_limit": self.concurrency_limit,
+            "completed": self._completed_count,
+            "failed": self._failed_count,
+            "cancelled": self._cancelled_count,
+            "timed_out": self._timed_out_count,
+            "loop_lag_ms": round(self._loop_lag * 1000, 2),
+            "max_loop_lag_ms": round(self._max_loop_lag * 1000, 2),
+            "queue_wait_p95_ms": round(self.get_queue_wait_percentile(95) * 1000, 2)
+        }
+    
+    def get_queue_wait_percentile(self, percentile: float) -> float:
+        """
+        获取最近任务排队等待时间的百分位数
+        
+        Args:
+            percentile: 百分位，如95
+            
+        Returns:
+            等待时间（秒），没有数据时返回0
+        """
+        waits = sorted(self._queue_waits)
+        if not waits:
+            return 0.0
+        index = min(len(waits) - 1, max(0, math.ceil(len(waits) * percentile / 100) - 1))
+        return waits[index]
+    
+    def get_delayed_count(self) -> int:
+        """获取延迟等待中的任务数量"""
+        return self._delayed_count
+    
+    def get_pending_count(self) -> int:
+        """获取在引擎内排队的任务数量"""
+        return self._pending.qsize()
+    
+    def get_running_count(self) -> int:
+        """获取正在运行的协程任务数量"""
+        return self._running_count
+    
+    def estimate_wait(self, position: int) -> float:
+        """
+        估算排在第position位的任务开始执行前需要等待的时间
+        
+        Args:
+            position: 任务在引擎队列中的位置
+            
+        Returns:
+            预计等待秒数
+        """
+        if self._avg_duration == 0:
+            return 0.0
+        return self._avg_duration * position / max(1, self.concurrency_limit)
+    
+    def set_concurrency_limit(self, limit: int):
+        """
+        调整当前并发上限（线程安全），超出上限的运行中任务不受影响，只是暂停调度新任务
+        
+        Args:
+            limit: 新的并发上限，不超过max_concurrency
+        """
+        limit = max(1, min(limit, self.max_concurrency))
+        if limit == self.concurrency_limit:
+            return
+        logger.info(f"异步任务引擎并发上限调整: {self.concurrency_limit} -> {limit}")
+        self.concurrency_limit = limit
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._dispatch)
+    
+    def add_shutdown_hook(self, hook: Callable[[], Awaitable[Any]]):
+        """
+        注册关闭引擎前在事件循环中执行的清理协程函数，如关闭绑定该事件循环的HTTP客户端
+        
+        Args:
+            hook: 无参数的协程函数
+        """
+        self._shutdown_hooks.append(hook)
+    
+    async def _run_shutdown_hooks(self):
+        """依次执行关闭回调，单个回调失败不影响其他回调"""
+        for hook in self._shutdown_hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"异步任务引擎关闭回调 {hook.__name__} 执行失败: {str(e)}")
+    
+    def shutdown(self, wait: bool = True):
+        """
+        关闭引擎
+        
+        Args:
+            wait: 是否等待正在运行和排队的协程任务完成
+        """
+        if not self.running:
+            return
+        self.running = False
+        if wait:
+            while self._running_count > 0 or self._pending.qsize() > 0:
+                time.sleep(0.1)
+        if self._shutdown_hooks:
+            try:
+                asyncio.run_coroutine_threadsafe(self._run_shutdown_hooks(), self.loop).result(timeout=5)
+            except Exception as e:
+                logger.error(f"执行异步任务引擎关闭回调失败: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
+        self._executor.shutdown(wait=wait)
+        logger.info("异步任务引擎已关闭")
+
 class Worker(threading.Thread):
     """工作线程，从任务队列获取任务并执行"""
     def __init__(self, task_queue: queue.Queue, name: str = None):
@@ -40,20 +581,27 @@ class Worker(threading.Thread):
         self.task_queue = task_queue
         self.daemon = True  # 设置为守护线程，主线程结束时自动退出
         self._stop_event = threading.Event()
+        self.task_count = 0
+        self.busy = False
+        self.last_active_time = time.time()  # 最近一次执行完任务的时间，用于判断空闲
     
     def run(self):
-        """线程主循环，不断从队列获取任务执行"""
+        """线程主循环，不断从队列获取同步任务执行（协程任务由异步任务引擎执行）"""
         while not self._stop_event.is_set():
             try:
                 # 从队列获取任务，最多等待1秒
                 task = self.task_queue.get(timeout=1)
+                self.busy = True
                 try:
                     logger.debug(f"线程 {self.name} 开始执行任务")
                     task.execute()
+                    self.task_count += 1
                     logger.debug(f"线程 {self.name} 完成任务")
                 finally:
                     # 无论任务是否成功，都标记为完成
                     self.task_queue.task_done()
+                    self.busy = False
+                    self.last_active_time = time.time()
             except queue.Empty:
                 # 队列为空，继续等待
                 continue
@@ -64,10 +612,17 @@ class Worker(threading.Thread):
     def stop(self):
         """停止工作线程"""
         self._stop_event.set()
+    
+    def is_stopping(self) -> bool:
+        """是否已被要求停止"""
+        return self._stop_event.is_set()
 
 class ThreadPool:
     """线程池，管理工作线程并分配任务"""
-    def __init__(self, max_workers: int = 10, queue_size: int = 100, thread_name_prefix: str = "Worker"):
+    def __init__(self, max_workers: int = 10, queue_size: int = 100, thread_name_prefix: str = "Worker",
+                 max_concurrency: int = 500, io_workers: int = 64, max_pending: Optional[int] = None,
+                 scheduler: str = "fifo", min_workers: Optional[int] = None, min_concurrency: Optional[int] = None,
+                 idle_timeout: float = 60, scale_interval: float = 2):
         """
         初始化线程池
         
@@ -75,13 +630,34 @@ class ThreadPool:
             max_workers: 最大工作线程数
             queue_size: 任务队列最大长度，0表示无限
             thread_name_prefix: 工作线程名称前缀
+            max_concurrency: 协程任务的最大并发数（由异步任务引擎执行）
+            io_workers: 异步任务引擎的IO线程数
+            max_pending: 准入上限，排队任务数达到该值后 submit_async 直接拒绝，默认等于queue_size
+            scheduler: 调度模式，fifo-先进先出，fair-按任务归属（用户）加权公平调度
+            min_workers: 最小工作线程数，小于max_workers时根据队列长度和空闲时间自动伸缩，默认不伸缩
+            min_concurrency: 协程任务的最小并发数，设置容量函数后并发上限在该值和max_concurrency之间伸缩
+            idle_timeout: 工作线程空闲超过该时间（秒）后被回收
+            scale_interval: 自动伸缩检查间隔（秒）
         """
         self.max_workers = max_workers
+        self.min_workers = max_workers if min_workers is None else min(min_workers, max_workers)
+        self.min_concurrency = max(1, min_concurrency if min_concurrency is not None else min(max_concurrency, 20))
+        self.idle_timeout = idle_timeout
+        self.scale_interval = scale_interval
+        self._capacity_provider: Optional[Callable[[], int]] = None
+        self._scaler_thread: Optional[threading.Thread] = None
+        self._worker_seq = 0
+        self._delayed_scheduler: Optional[DelayedScheduler] = None
         self.thread_name_prefix = thread_name_prefix
-        self.task_queue = queue.Queue(maxsize=queue_size)
+        self.scheduler = scheduler
+        self.task_queue = _create_queue(scheduler, maxsize=queue_size)
+        self.max_pending = max_pending if max_pending is not None else queue_size
         self.workers: List[Worker] = []
         self.running = False
         self._lock = threading.RLock()
+        # 协程任务交给常驻事件循环执行，不再占用工作线程
+        self.async_engine = AsyncEngine(max_concurrency=max_concurrency, io_workers=io_workers,
+                                        name=f"{thread_name_prefix}-Loop", scheduler=scheduler)
     
     def start(self):
         """启动线程池"""
@@ -90,18 +666,103 @@ class ThreadPool:
                 return
             
             self.running = True
-            # 创建并启动工作线程
-            for i in range(self.max_workers):
-                worker = Worker(self.task_queue, name=f"{self.thread_name_prefix}-{i+1}")
-                self.workers.append(worker)
-                worker.start()
+            # 创建并启动工作线程，开启自动伸缩时先启动最小数量
+            for i in range(self.min_workers):
+                self._add_worker()
             
-            logger.info(f"线程池已启动，工作线程数: {self.max_workers}")
+            self.async_engine.start()
+            self._delayed_scheduler = DelayedScheduler(name=f"{self.thread_name_prefix}-Delayed")
+            self._delayed_scheduler.start()
+            if self.min_workers < self.max_workers or self._capacity_provider is not None:
+                self._start_scaler()
+            logger.info(f"线程池已启动，工作线程数: {self.min_workers}-{self.max_workers}")
+    
+    def _add_worker(self) -> Worker:
+        """创建并启动一个工作线程"""
+        self._worker_seq += 1
+        worker = Worker(self.task_queue, name=f"{self.thread_name_prefix}-{self._worker_seq}")
+        self.workers.append(worker)
+        worker.start()
+        return worker
+    
+    def set_capacity_provider(self, provider: Callable[[], int]):
+        """
+        设置下游容量函数（如账号池的可用实例数），自动伸缩时据此调整协程任务并发上限
+        
+        Args:
+            provider: 返回当前还可承接的任务数量的函数
+        """
+        self._capacity_provider = provider
+        if self.running:
+            self._start_scaler()
+    
+    def _start_scaler(self):
+        """启动自动伸缩线程"""
+        if self._scaler_thread and self._scaler_thread.is_alive():
+            return
+        self._scaler_thread = threading.Thread(target=self._scale_loop, name=f"{self.thread_name_prefix}-Scaler", daemon=True)
+        self._scaler_thread.start()
+    
+    def _scale_loop(self):
+        """自动伸缩线程主循环"""
+        while self.running:
+            try:
+                self._scale_workers()
+                self._scale_concurrency()
+            except Exception as e:
+                logger.error(f"线程池自动伸缩异常: {str(e)}")
+                logger.error(traceback.format_exc())
+            time.sleep(self.scale_interval)
+    
+    def _scale_workers(self):
+        """根据队列长度和空闲时间增减工作线程"""
+        with self._lock:
+            if not self.running:
+                return
+            # 清理已退出的工作线程
+            self.workers = [worker for worker in self.workers if worker.is_alive() and not worker.is_stopping()]
+            queue_size = self.task_queue.qsize()
+            idle_workers = [worker for worker in self.workers if not worker.busy]
+            
+            if queue_size > len(idle_workers) and len(self.workers) < self.max_workers:
+                # 队列积压超过空闲线程数，按积压数量扩容
+                count = min(queue_size - len(idle_workers), self.max_workers - len(self.workers))
+                for _ in range(count):
+                    self._add_worker()
+                logger.info(f"工作线程扩容 {count} 个，当前工作线程数: {len(self.workers)}，队列长度: {queue_size}")
+            elif queue_size == 0 and len(self.workers) > self.min_workers:
+                # 回收空闲超时的工作线程，保留最小数量
+                now = time.time()
+                removable = len(self.workers) - self.min_workers
+                for worker in idle_workers:
+                    if removable <= 0:
+                        break
+                    if now - worker.last_active_time > self.idle_timeout:
+                        worker.stop()
+                        self.workers.remove(worker)
+                        removable -= 1
+                        logger.info(f"回收空闲工作线程 {worker.name}，当前工作线程数: {len(self.workers)}")
+    
+    def _scale_concurrency(self):
+        """根据下游容量调整协程任务并发上限，使排队任务数与可用账号数匹配"""
+        if self._capacity_provider is None:
+            return
+        engine = self.async_engine
+        try:
+            capacity = int(self._capacity_provider())
+        except Exception as e:
+            logger.error(f"获取下游容量失败: {str(e)}")
+            return
+        # 运行中的任务已占用的容量加上剩余容量即为可以同时推进的任务数
+        target = engine.get_running_count() + capacity
+        engine.set_concurrency_limit(max(self.min_concurrency, target))
     
     def submit(self, func: Callable, *args, **kwargs) -> Future:
         """
         提交任务到线程池
         
+        协程函数交给异步任务引擎执行，普通函数进入工作线程队列
+        
         Args:
             func: 要执行的函数
             args: 位置参数
@@ -115,38 +776,157 @@ class ThreadPool:
             queue.Full: 如果队列已满且设置了最大队列长度
         """
         logger.info(f"提交任务到线程池，函数: {func.__name__}, 参数: {args}, {kwargs}")
+        return self.submit_task(Task(func, args, kwargs))
+    
+    def submit_task(self, task: Task, block: bool = True) -> Future:
+        """
+        提交已构造好的任务到线程池，可通过Task指定归属和调度权重
+        
+        Args:
+            task: 要执行的任务
+            block: 工作线程队列已满时是否阻塞等待
+            
+        Returns:
+            Future对象，可用于获取任务结果
+            
+        Raises:
+            queue.Full: block为False且队列已满
+        """
         if not self.running:
             # 如果线程池未启动，先启动线程池
             logger.warning("线程池未启动，正在自动启动")
             self.start()
         
-        task = Task(func, args, kwargs)
-        self.task_queue.put(task)
+        task.on_reschedule = self._reschedule
+        if asyncio.iscoroutinefunction(task.func):
+            self.async_engine.submit(task)
+            logger.debug(f"协程任务已提交到异步引擎，运行中: {self.async_engine.get_running_count()}，排队中: {self.async_engine.get_pending_count()}")
+            return task.future
+        self.task_queue.put(task, block=block)
         logger.debug(f"任务已提交到队列，当前队列长度: {self.task_queue.qsize()}")
         return task.future
     
-    def submit_nowait(self, func: Callable, *args, **kwargs) -> Optional[Future]:
+    def submit_later(self, delay: float, func: Callable, *args, **kwargs) -> Future:
         """
-        提交任务到线程池，如果队列已满则立即返回None而不阻塞
+        延迟delay秒后提交任务，等待期间不占用任何工作线程
         
         Args:
+            delay: 延迟秒数
             func: 要执行的函数
             args: 位置参数
             kwargs: 关键字参数
             
         Returns:
-            Future对象，可用于获取任务结果；如果队列已满则返回None
+            Future对象，可用于获取任务结果
+        """
+        return self.submit_task_later(delay, Task(func, args, kwargs))
+    
+    def submit_task_later(self, delay: float, task: Task) -> Future:
+        """
+        延迟delay秒后提交已构造好的任务
+        
+        Args:
+            delay: 延迟秒数
+            task: 要执行的任务
+            
+        Returns:
+            Future对象，可用于获取任务结果
         """
         if not self.running:
-            # 如果线程池未启动，先启动线程池
             logger.warning("线程池未启动，正在自动启动")
             self.start()
+        self._delayed_scheduler.schedule(delay, lambda: self._resubmit(task))
+        return task.future
+    
+    def _reschedule(self, task: Task, delay: float):
+        """同步任务返回Reschedule时，延迟后重新入队"""
+        self._delayed_scheduler.schedule(delay, lambda: self._resubmit(task))
+    
+    def _resubmit(self, task: Task):
+        """延迟到期后重新提交任务，队列已满时稍后再试，避免阻塞调度线程"""
+        if not self.running or task.cancelled:
+            task.future.cancel()
+            return
+        task.submitted_at = time.time()
+        try:
+            self.submit_task(task, block=False)
+        except queue.Full:
+            logger.warning(f"任务队列已满，延迟任务 {task.func.__name__} 1秒后重试入队")
+            self._delayed_scheduler.schedule(1, lambda: self._resubmit(task))
+    
+    def get_delayed_count(self) -> int:
+        """获取延迟等待中的任务数量"""
+        scheduled = len(self._delayed_scheduler) if self._delayed_scheduler else 0
+        return scheduled + self.async_engine.get_delayed_count()
+    
+    def check_admission(self, count: int = 1):
+        """
+        准入检查，线程池饱和时快速失败而不是阻塞调用方
         
-        task = Task(func, args, kwargs)
+        Args:
+            count: 即将提交的任务数量
+            
+        Raises:
+            PoolSaturatedError: 排队任务数加上即将提交的任务数超过准入上限
+        """
+        queue_depth = self.get_queue_size()
+        if self.max_pending and queue_depth + count > self.max_pending:
+            overflow = queue_depth + count - self.max_pending
+            wait_seconds = self.async_engine.estimate_wait(overflow)
+            retry_after = min(300, max(1, math.ceil(wait_seconds)))
+            logger.warning(f"线程池已饱和，拒绝新任务，排队任务数: {queue_depth}，建议重试间隔: {retry_after} 秒")
+            raise PoolSaturatedError(queue_depth, retry_after)
+    
+    async def submit_async(self, func: Callable, *args, **kwargs) -> Future:
+        """
+        在异步代码（如FastAPI接口）中提交任务，不会阻塞事件循环
+        
+        Args:
+            func: 要执行的函数
+            args: 位置参数
+            kwargs: 关键字参数
+            
+        Returns:
+            Future对象，可用于获取任务结果
+            
+        Raises:
+            PoolSaturatedError: 线程池已饱和
+        """
+        return await self.submit_task_async(Task(func, args, kwargs))
+    
+    async def submit_task_async(self, task: Task) -> Future:
+        """
+        在异步代码中提交已构造好的任务，不会阻塞事件循环
+        
+        Args:
+            task: 要执行的任务
+            
+        Returns:
+            Future对象，可用于获取任务结果
+            
+        Raises:
+            PoolSaturatedError: 线程池已饱和
+        """
+        self.check_admission()
         try:
-            self.task_queue.put_nowait(task)
-            logger.debug(f"任务已提交到队列，当前队列长度: {self.task_queue.qsize()}")
-            return task.future
+            return self.submit_task(task, block=False)
+        except queue.Full:
+            raise PoolSaturatedError(self.get_queue_size(), 1)
+    
+    def submit_nowait(self, func: Callable, *args, **kwargs) -> Optional[Future]:
+        """
+        提交任务到线程池，如果队列已满则立即返回None而不阻塞
+        
+        Args:
+            func: 要执行的函数
+            args: 位置参数
+            kwargs: 关键字参数
+            
+        Returns:
+            Future对象，可用于获取任务结果；如果队列已满则返回None
+        """
+        try:
+            return self.submit_task(Task(func, args, kwargs), block=False)
         except queue.Full:
             logger.warning("任务队列已满，任务被丢弃")
             return None
@@ -172,6 +952,11 @@ class ThreadPool:
                 # 等待队列中的任务完成
                 self.task_queue.join()
             
+            # 协程任务多为长时间轮询，关闭时不等待其结束
+            self.async_engine.shutdown(wait=False)
+            if self._delayed_scheduler:
+                self._delayed_scheduler.stop()
+            
             # 清空工作线程列表
             self.workers.clear()
             
@@ -192,7 +977,7 @@ class ThreadPool:
         
         try:
             start_time = time.time()
-            while not self.task_queue.empty():
+            while not self.task_queue.empty() or self.async_engine.get_pending_count() > 0:
                 if timeout is not None and time.time() - start_time > timeout:
                     return False
                 time.sleep(0.1)
@@ -201,8 +986,32 @@ class ThreadPool:
             return False
     
     def get_queue_size(self) -> int:
-        """获取当前队列中的任务数量"""
-        return self.task_queue.qsize()
+        """获取当前队列中的任务数量（含异步引擎中排队的协程任务）"""
+        return self.task_queue.qsize() + self.async_engine.get_pending_count()
+    
+    def get_free_slots(self) -> int:
+        """获取异步引擎还能立即开始执行的协程任务数量"""
+        engine = self.async_engine
+        return max(0, engine.concurrency_limit - engine.get_running_count() - engine.get_pending_count())
+    
+    def get_async_running(self) -> int:
+        """获取异步引擎中正在运行的协程任务数量"""
+        return self.async_engine.get_running_count()
+    
+    def get_loop_stats(self) -> dict:
+        """
+        获取事件循环指标
+        
+        Returns:
+            包含异步任务引擎事件循环指标和工作线程任务数的字典
+        """
+        workers = list(self.workers)
+        return {
+            "engine": self.async_engine.get_stats(),
+            "workers": {
+                "task_count": sum(worker.task_count for worker in workers)
+            }
+        }
     
     def get_active_workers(self) -> int:
         """获取当前活动的工作线程数量"""
@@ -215,8 +1024,11 @@ class ThreadPool:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.shutdown()
 
-# 创建一个全局线程池实例
-global_thread_pool = ThreadPool(max_workers=20, queue_size=1000)
+# 创建一个全局线程池实例，默认按用户公平调度，工作线程在2到20之间自动伸缩
+global_thread_pool = ThreadPool(max_workers=20, queue_size=1000,
+                                scheduler=os.getenv("THREAD_POOL_SCHEDULER", "fair"),
+                                min_workers=int(os.getenv("THREAD_POOL_MIN_WORKERS", "2")),
+                                max_concurrency=int(os.getenv("THREAD_POOL_MAX_CONCURRENCY", "500")))
 # 确保线程池在创建时就启动
 global_thread_pool.start()
 
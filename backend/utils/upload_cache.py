@@ -0,0 +1,86 @@
+import collections
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Optional
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """按块计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadCache:
+    """
+    已上传到Runway的图片缓存
+
+    按(图片内容SHA-256, 团队ID)缓存上传完成后返回的图片地址，同一账号再次使用相同图片时
+    跳过申请上传、PUT上传和完成上传三个请求。Runway返回的地址有有效期，缓存条目在ttl后过期，
+    ttl应小于地址的有效期。缓存只在当前进程内有效。
+    """
+    def __init__(self, ttl: float = 3600, max_entries: int = 10000):
+        """
+        Args:
+            ttl: 缓存有效期（秒），0表示不缓存
+            max_entries: 最多缓存的条目数，超出时淘汰最久未使用的条目
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "collections.OrderedDict[tuple, tuple]" = collections.OrderedDict()  # (摘要, 团队ID) -> (图片地址, 过期时间)
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, digest: str, team_id: Any) -> Optional[str]:
+        """
+        获取未过期的图片地址
+
+        Args:
+            digest: 图片内容的SHA-256
+            team_id: 账号的团队ID，图片地址只对上传它的团队有效
+        """
+        key = (digest, str(team_id))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self._misses += 1
+            return None
+
+    def set(self, digest: str, team_id: Any, image_url: str):
+        """缓存上传完成后返回的图片地址"""
+        if self.ttl <= 0:
+            return
+        key = (digest, str(team_id))
+        with self._lock:
+            self._entries[key] = (image_url, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        """获取缓存大小和命中率"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 3) if total else None
+            }
+
+
+# 全局图片上传缓存
+upload_cache = UploadCache(
+    ttl=float(os.getenv("UPLOAD_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("UPLOAD_CACHE_MAX_ENTRIES", "10000"))
+)